@@ -1,26 +1,62 @@
 import json
-from sentence_transformers import SentenceTransformer, util
-import torch
+from sentence_transformers import SentenceTransformer
+import numpy as np
+import hashlib
 import os
 
+from cache import CacheScores, crear_cliente_redis, normalizar_texto
+from indice_frases import crear_indice
+
+MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+
+# Umbral: 0.4 suele ser bueno. 1.0 es idéntico. 0.0 es nada que ver.
+UMBRAL_ALERTA = 0.55
+
+# Caché en disco de los embeddings del banco de frases (.npy + índice .json).
+EMBEDDINGS_CACHE_DIR = os.environ.get("EMBEDDINGS_CACHE_DIR", ".cache")
+
+# Caché de scores por transcripción normalizada (LRU + TTL, Redis opcional).
+NLP_CACHE_SIZE = int(os.environ.get("NLP_CACHE_SIZE", "10000"))
+NLP_CACHE_TTL_S = float(os.environ.get("NLP_CACHE_TTL_S", "3600"))
+
+def _hash_banco(dataset_path, frases):
+    """SHA-256 del archivo de frases (o de las frases de fallback si no existe)."""
+    h = hashlib.sha256()
+    if os.path.exists(dataset_path):
+        with open(dataset_path, 'rb') as f:
+            for bloque in iter(lambda: f.read(1 << 20), b''):
+                h.update(bloque)
+    else:
+        h.update("\n".join(frases).encode('utf-8'))
+    return h.hexdigest()
+
+def _rutas_cache(model_name):
+    slug = model_name.replace('/', '_')
+    base = os.path.join(EMBEDDINGS_CACHE_DIR, f"banco_{slug}")
+    return base + ".npy", base + ".json"
+
+def _ruta_indice(model_name, categoria):
+    """Prefijo de la caché del índice IVF de una categoría (ver indice_frases.IndiceIVF)."""
+    return _rutas_cache(model_name)[0][:-len(".npy")] + f"_ivf_{categoria}"
+
 class SemanticAnalyzer:
     def __init__(self, dataset_path="frases_entrenamiento.json"):
         print("⏳ Cargando modelo Semántico...")
-        self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-        
+        self.model = SentenceTransformer(MODEL_NAME)
+
         self.frases_trampa = []
         self.frases_domesticas = []
 
         if os.path.exists(dataset_path):
             with open(dataset_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                
+
                 # --- LÓGICA NUEVA PARA TU JSON ---
                 # Recorremos la lista "dataset" y clasificamos según el "label"
                 for item in data.get("dataset", []):
                     texto = item.get("text")
                     label = item.get("label")
-                    
+
                     if label == "SOSPECHOSO":
                         self.frases_trampa.append(texto)
                     elif label == "DOMESTICO":
@@ -33,36 +69,165 @@ class SemanticAnalyzer:
 
         # Validación de seguridad
         if not self.frases_trampa: print("⚠️ ALERTA: No se cargaron frases de trampa.")
-        
+
         print(f"🧠 Memorizando {len(self.frases_trampa)} frases de TRAMPA y {len(self.frases_domesticas)} DOMÉSTICAS...")
-        
-        # Convertir a Vectores (Embeddings)
-        self.embeddings_trampa = self.model.encode(self.frases_trampa, convert_to_tensor=True)
-        self.embeddings_domestico = self.model.encode(self.frases_domesticas, convert_to_tensor=True)
-        
+
+        # Banco único [TRAMPA | DOMÉSTICO] de vectores ya normalizados (norma L2 = 1):
+        # la similitud coseno es un producto punto.
+        frases = self.frases_trampa + self.frases_domesticas
+        hash_banco = _hash_banco(dataset_path, frases)
+        self.n_trampa = len(self.frases_trampa)
+        self.banco = self._cargar_banco(frases, hash_banco)
+
+        # Un índice top-k por categoría (exacto o aproximado según el tamaño).
+        # El IVF se guarda junto a la caché del banco, con la misma llave.
+        self.indice_trampa = crear_indice(self.banco[:self.n_trampa],
+                                          ruta_cache=_ruta_indice(MODEL_NAME, "trampa"), llave=hash_banco)
+        self.indice_domestico = crear_indice(self.banco[self.n_trampa:],
+                                             ruta_cache=_ruta_indice(MODEL_NAME, "domestico"), llave=hash_banco)
+
+        # Los scores dependen del modelo y del banco: ambos forman parte de la llave
+        self.cache = CacheScores(
+            namespace=f"{MODEL_NAME}:{hash_banco[:12]}",
+            max_items=NLP_CACHE_SIZE,
+            ttl_s=NLP_CACHE_TTL_S,
+            cliente_redis=crear_cliente_redis(),
+        )
+
         print("✅ Analizador listo.")
 
+    def _cargar_banco(self, frases, hash_banco):
+        """
+        Obtiene la matriz (P, D) del banco de frases usando la caché en disco.
+
+        - Mismo archivo de frases y mismo modelo → se mapea el .npy (mmap),
+          sin correr el modelo.
+        - El banco cambió → se reutilizan los vectores de las frases ya
+          conocidas y solo se codifican las nuevas; la caché se reescribe.
+        """
+        ruta_npy, ruta_meta = _rutas_cache(MODEL_NAME)
+
+        meta, cacheado = None, None
+        try:
+            with open(ruta_meta, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            cacheado = np.load(ruta_npy, mmap_mode='r')
+            if meta.get("model") != MODEL_NAME or len(meta.get("texts", [])) != len(cacheado):
+                meta, cacheado = None, None
+        except (OSError, ValueError):
+            meta, cacheado = None, None
+
+        if meta is not None and meta.get("file_hash") == hash_banco and meta["texts"] == frases:
+            print("💾 Embeddings del banco cargados desde caché.")
+            return np.ascontiguousarray(cacheado, dtype=np.float32)
+
+        conocidas = {t: i for i, t in enumerate(meta["texts"])} if meta is not None else {}
+        nuevas = [t for t in dict.fromkeys(frases) if t not in conocidas]
+        print(f"🧮 Codificando {len(nuevas)} frases nuevas (reutilizando {len(frases) - len(nuevas)} de caché)...")
+        embeddings_nuevas = self._encode(nuevas)
+        fila_nueva = {t: i for i, t in enumerate(nuevas)}
+
+        banco = np.empty((len(frases), embeddings_nuevas.shape[1]), dtype=np.float32)
+        for i, texto in enumerate(frases):
+            if texto in fila_nueva:
+                banco[i] = embeddings_nuevas[fila_nueva[texto]]
+            else:
+                banco[i] = cacheado[conocidas[texto]]
+
+        self._guardar_banco(ruta_npy, ruta_meta, banco, frases, hash_banco)
+        return banco
+
+    def _guardar_banco(self, ruta_npy, ruta_meta, banco, frases, hash_banco):
+        """Escribe la caché de forma atómica (archivo temporal + os.replace)."""
+        try:
+            os.makedirs(EMBEDDINGS_CACHE_DIR, exist_ok=True)
+            with open(ruta_npy + ".tmp", 'wb') as f:
+                np.save(f, banco)
+            with open(ruta_meta + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump({"model": MODEL_NAME, "file_hash": hash_banco, "texts": frases},
+                          f, ensure_ascii=False)
+            os.replace(ruta_npy + ".tmp", ruta_npy)
+            os.replace(ruta_meta + ".tmp", ruta_meta)
+        except OSError as e:
+            print(f"⚠️ No se pudo escribir la caché de embeddings: {e}")
+
+    def _encode(self, textos):
+        """Codifica una lista de textos a una matriz (N, D) float32 normalizada."""
+        if not textos:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return self.model.encode(
+            textos,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ).astype(np.float32, copy=False)
+
+    def _max_similitudes(self, embeddings):
+        """
+        Similitud coseno máxima de cada embedding contra TRAMPA y DOMÉSTICO.
+        Retorna dos arrays (N,) — uno por categoría.
+        """
+        ceros = np.zeros(len(embeddings), dtype=np.float32)
+        maximos = []
+        for indice in (self.indice_trampa, self.indice_domestico):
+            # Top-1 del índice = la frase a la que más se pareció (0.0 si está vacío)
+            scores, _ = indice.buscar(embeddings, k=1)
+            maximos.append(scores[:, 0] if scores.shape[1] else ceros)
+        return maximos[0], maximos[1]
+
     def analizar(self, texto_alumno):
-        if not texto_alumno or len(texto_alumno.split()) < 2:
-            return {"category": "NEUTRAL", "score": 0.0, "flagged": False,
-                    "raw_score_trampa": 0.0, "raw_score_domestico": 0.0}
+        return self.analizar_batch([texto_alumno])[0]
+
+    def analizar_batch(self, textos):
+        """
+        Analiza N transcripciones con un solo `model.encode` y una sola
+        búsqueda top-1 por categoría en el índice del banco de frases.
+        Retorna una lista de resultados alineada con `textos` (mismo
+        formato que `analizar`).
+        """
+        resultados = [None] * len(textos)
+        indices = []
+
+        for i, texto in enumerate(textos):
+            if not texto or len(texto.split()) < 2:
+                resultados[i] = {"category": "NEUTRAL", "score": 0.0, "flagged": False,
+                                 "raw_score_trampa": 0.0, "raw_score_domestico": 0.0}
+            else:
+                indices.append(i)
 
-        # 1. Convertir lo que dijo el alumno a vector
-        embedding_alumno = self.model.encode(texto_alumno, convert_to_tensor=True)
+        if not indices:
+            return resultados
 
-        # 2. Comparar contra TRAMPAS (Similitud Coseno)
-        # util.cos_sim devuelve una matriz, tomamos el valor máximo (la frase a la que más se pareció)
-        scores_trampa = util.cos_sim(embedding_alumno, self.embeddings_trampa)
-        max_score_trampa = torch.max(scores_trampa).item()
+        # 0. Caché: las frases repetidas no pasan por el modelo
+        llaves = {i: normalizar_texto(textos[i]) for i in indices}
+        scores = self.cache.obtener_muchos(list(dict.fromkeys(llaves.values())))
+        pendientes = list(dict.fromkeys(ll for ll in llaves.values() if ll not in scores))
 
-        # 3. Comparar contra DOMÉSTICO
-        scores_domestico = util.cos_sim(embedding_alumno, self.embeddings_domestico)
-        max_score_domestico = torch.max(scores_domestico).item()
+        if pendientes:
+            # 1. Convertir lo que dijeron los alumnos a vectores (un solo forward)
+            #    Se codifica el primer texto original de cada llave pendiente
+            originales = {}
+            for i in indices:
+                originales.setdefault(llaves[i], textos[i])
+            embeddings = self._encode([originales[ll] for ll in pendientes])
 
-        # 4. Lógica de Decisión
-        # Umbral: 0.4 suele ser bueno. 1.0 es idéntico. 0.0 es nada que ver.
-        UMBRAL_ALERTA = 0.55 
+            # 2. Comparar contra TRAMPAS y DOMÉSTICO (Similitud Coseno)
+            #    Nos quedamos con el valor máximo (la frase a la que más se pareció)
+            max_trampa, max_domestico = self._max_similitudes(embeddings)
+            nuevos = {
+                ll: (float(max_trampa[j]), float(max_domestico[j]))
+                for j, ll in enumerate(pendientes)
+            }
+            self.cache.guardar_muchos(nuevos)
+            scores.update(nuevos)
 
+        for i in indices:
+            max_score_trampa, max_score_domestico = scores[llaves[i]]
+            resultados[i] = self._clasificar(textos[i], max_score_trampa, max_score_domestico)
+
+        return resultados
+
+    def _clasificar(self, texto_alumno, max_score_trampa, max_score_domestico):
+        # Lógica de Decisión
         resultado = {
             "text": texto_alumno,
             "category": "NEUTRAL",
@@ -84,8 +249,8 @@ class SemanticAnalyzer:
         if max_score_domestico > UMBRAL_ALERTA:
             resultado["category"] = "DOMESTICO"
             resultado["score"] = round(max_score_domestico, 2)
-        
+
         return resultado
 
 # Instancia global para no recargar el modelo en cada petición
-analyzer_service = SemanticAnalyzer()
\ No newline at end of file
+analyzer_service = SemanticAnalyzer()
@@ -1,27 +1,50 @@
 import numpy as np
-from scipy.signal import butter, lfilter
+from scipy.signal import butter, sosfilt
+from functools import lru_cache
 import subprocess
 import io
+import os
 
-def butter_bandpass(lowcut, highcut, fs, order=5):
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-    b, a = butter(order, [low, high], btype='band')
-    return b, a
+# PyAV (bindings de libav) permite decodificar dentro del proceso, sin lanzar
+# un ffmpeg por chunk. Es opcional: sin él se usa el subproceso de FFmpeg.
+try:
+    import av
+except ImportError:
+    av = None
+
+# "pyav" (default) o "ffmpeg" para forzar el subproceso
+AUDIO_DECODER = os.environ.get("AUDIO_DECODER", "pyav")
+SAMPLE_RATE = 16000
+
+# Rango telefónico estándar para voz inteligible
+VOZ_LOWCUT = 300.0
+VOZ_HIGHCUT = 3400.0
+# Capacidad inicial de los buffers de FrontEndVoz
+# (muestras: 16 s a 16 kHz cubren un chunk de 15 s sin realocar)
+BLOQUE_INICIAL = 16000 * 16
+
+@lru_cache(maxsize=8)
+def sos_bandpass(lowcut, highcut, fs, order=6):
+    """
+    Pasa-banda Butterworth en secciones de 2º orden (SOS), diseñado UNA vez
+    por configuración. En float32: sosfilt mantiene float32 de punta a punta
+    (la forma b/a de orden 12 exigía float64 para ser estable).
+    """
+    sos = butter(order, [lowcut, highcut], btype='band', fs=fs, output='sos')
+    # Compartido entre llamadas: no modificar (sosfilt no acepta arrays read-only)
+    return sos.astype(np.float32)
 
 def aplicar_filtro_voz(audio_data, rate=16000):
     """
     Deja pasar solo frecuencias de voz humana (300Hz - 3400Hz).
     Elimina ruido grave (golpes) y agudo (interferencia).
     """
-    # Rango telefónico estándar para voz inteligible
-    lowcut = 300.0
-    highcut = 3400.0
-    
-    b, a = butter_bandpass(lowcut, highcut, rate, order=6)
-    y = lfilter(b, a, audio_data)
-    return y.astype(np.float32)
+    sos = sos_bandpass(VOZ_LOWCUT, VOZ_HIGHCUT, rate)
+    return sosfilt(sos, np.asarray(audio_data, dtype=np.float32))
+
+def nivel_db(rms):
+    """RMS → dB (evitar log(0) sumando un epsilon pequeño)."""
+    return 20 * np.log10(rms + 1e-9)
 
 def es_silencio(audio_data, umbral_db=-40):
     """
@@ -29,16 +52,272 @@ def es_silencio(audio_data, umbral_db=-40):
     Retorna True si el volumen es muy bajo.
     """
     # Calcular RMS (Root Mean Square) -> Volumen promedio
-    rms = np.sqrt(np.mean(audio_data**2))
-    
-    # Convertir a Decibeles
-    # Evitar log(0) sumando un epsilon pequeño
-    db = 20 * np.log10(rms + 1e-9)
-    
+    audio_data = np.asarray(audio_data, dtype=np.float32)
+    rms = np.sqrt(np.dot(audio_data, audio_data) / len(audio_data)) if len(audio_data) else 0.0
+
     # Si el volumen es menor al umbral (ej. -40dB), es silencio
-    return db < umbral_db
+    return nivel_db(rms) < umbral_db
+
+class FrontEndVoz:
+    """
+    Front end DSP por bloques: filtro de voz + métricas en UNA pasada.
+
+    Se alimenta con bloques float32 a medida que se decodifican
+    (procesar()). Los bloques se copian a un buffer crudo preasignado (que
+    crece por duplicación) y se filtran por tramos de al menos `tramo`
+    muestras: sosfilt tiene un costo fijo por llamada que, con los bloques
+    de ~60 ms del decoder, pesaría más que el filtro. El filtro SOS conserva
+    su estado entre tramos, así que el resultado es idéntico a filtrar el
+    chunk entero. Por tramo acumula:
+
+      • energía y pico de la señal cruda   → rms, db, peak
+      • energía de la señal filtrada       → energia_voz (banda 300-3400 Hz)
+
+    Con filtrar=False solo se miden rms/db/peak (casi gratis): así el worker
+    decide el silencio sin filtrar chunks que se van a descartar.
+    """
+
+    def __init__(self, rate=16000, capacidad=BLOQUE_INICIAL, tramo=None, filtrar=True):
+        self.rate = rate
+        self.tramo = tramo or rate
+        self.filtrar = filtrar
+        self.sos = sos_bandpass(VOZ_LOWCUT, VOZ_HIGHCUT, rate)
+        self._crudo = np.empty(capacidad, dtype=np.float32)
+        self._filtrado = np.empty(capacidad if filtrar else 0, dtype=np.float32)
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Descarta lo procesado (p. ej. si el decoder falló a mitad del chunk)."""
+        self._zi = np.zeros((self.sos.shape[0], 2), dtype=np.float32)
+        self.muestras = 0
+        self._procesadas = 0
+        self.suma_cuadrados = 0.0
+        self.suma_cuadrados_voz = 0.0
+        self.pico = 0.0
+
+    def procesar(self, bloque):
+        """Agrega un bloque; filtra y mide en cuanto hay un tramo completo pendiente."""
+        n = len(bloque)
+        fin = self.muestras + n
+        if fin > len(self._crudo):
+            capacidad = max(fin, 2 * len(self._crudo))
+            for nombre in ("_crudo", "_filtrado") if self.filtrar else ("_crudo",):
+                nuevo = np.empty(capacidad, dtype=np.float32)
+                nuevo[:self.muestras] = getattr(self, nombre)[:self.muestras]
+                setattr(self, nombre, nuevo)
+        self._crudo[self.muestras:fin] = bloque
+        self.muestras = fin
+
+        if self.muestras - self._procesadas >= self.tramo:
+            self._vaciar()
+
+    def _vaciar(self):
+        """Filtra y mide las muestras pendientes."""
+        inicio, fin = self._procesadas, self.muestras
+        if inicio == fin:
+            return
+        crudo = self._crudo[inicio:fin]
+        # np.dot en float32 por tramo; el acumulado va en float64 (Python)
+        self.suma_cuadrados += float(np.dot(crudo, crudo))
+        if self.filtrar:
+            self._filtrado[inicio:fin], self._zi = sosfilt(self.sos, crudo, zi=self._zi)
+            filtrado = self._filtrado[inicio:fin]
+            self.suma_cuadrados_voz += float(np.dot(filtrado, filtrado))
+        self.pico = max(self.pico, float(np.max(np.abs(crudo))))
+        self._procesadas = fin
+
+    @property
+    def crudo(self):
+        """Señal cruda acumulada (vista: evita concatenar los bloques del decoder)."""
+        return self._crudo[:self.muestras]
+
+    @property
+    def filtrado(self):
+        """Señal filtrada acumulada (vista sobre el buffer interno)."""
+        if not self.filtrar:
+            raise ValueError("FrontEndVoz creado con filtrar=False")
+        self._vaciar()
+        return self._filtrado[:self.muestras]
+
+    @property
+    def rms(self):
+        self._vaciar()
+        return float(np.sqrt(self.suma_cuadrados / self.muestras)) if self.muestras else 0.0
+
+    @property
+    def db(self):
+        return float(nivel_db(self.rms))
+
+    def es_silencio(self, umbral_db=-40):
+        """Mismo criterio que es_silencio(), sin otra pasada sobre el audio."""
+        return self.db < umbral_db
+
+    def metricas(self):
+        """
+        Returns:
+            dict con rms, db, peak, energia_voz (RMS de la banda de voz) y
+            ratio_voz (fracción de la energía que cae en la banda de voz).
+            Con filtrar=False, energia_voz y ratio_voz son None.
+        """
+        rms = self.rms
+        metricas = {"rms": rms, "db": float(nivel_db(rms)), "peak": self.pico,
+                    "energia_voz": None, "ratio_voz": None}
+        if self.filtrar:
+            metricas["energia_voz"] = float(np.sqrt(self.suma_cuadrados_voz / max(self.muestras, 1)))
+            metricas["ratio_voz"] = (self.suma_cuadrados_voz / self.suma_cuadrados
+                                     if self.suma_cuadrados else 0.0)
+        return metricas
+
+def analizar_senal(audio_data, rate=16000):
+    """Atajo: pasa un chunk ya decodificado por FrontEndVoz (un solo tramo)."""
+    audio_data = np.asarray(audio_data, dtype=np.float32)
+    frontend = FrontEndVoz(rate, capacidad=max(len(audio_data), 1), tramo=max(len(audio_data), 1))
+    frontend.procesar(audio_data)
+    return frontend
+
+def convertir_a_numpy(file_bytes, frontend=None):
+    """
+    Convierte cualquier cosa (webm, mp3) a array numpy float32 mono 16 kHz.
+    Decodifica en proceso con PyAV si está disponible; si no (o si PyAV
+    no puede con el chunk) usa el subproceso de FFmpeg como respaldo.
+
+    Con `frontend` (FrontEndVoz), cada bloque decodificado pasa por el
+    front end (métricas y, si corresponde, filtro de voz) mientras se sigue
+    decodificando.
+    """
+    if av is not None and AUDIO_DECODER == "pyav":
+        audio = decodificar_con_pyav(file_bytes, frontend)
+        if audio is not None:
+            return audio
+        if frontend is not None:
+            frontend.reiniciar()
+    audio = convertir_a_numpy_ffmpeg(file_bytes)
+    if audio is not None and frontend is not None:
+        frontend.procesar(audio)
+    return audio
+
+def decodificar_con_pyav(file_bytes, frontend=None):
+    """
+    Decodifica en proceso con PyAV directamente a float32 mono 16 kHz.
+    El resampler de libav entrega 'flt' (float32) ya mezclado a mono, así
+    que la única copia es la concatenación final de los bloques (o, con
+    `frontend`, la copia al buffer crudo del front end).
+    """
+    try:
+        with av.open(io.BytesIO(file_bytes), mode="r") as contenedor:
+            stream = contenedor.streams.audio[0]
+            resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+            bloques = []
+            agregar = bloques.append if frontend is None else frontend.procesar
+
+            for frame in contenedor.decode(stream):
+                for salida in resampler.resample(frame):
+                    agregar(salida.to_ndarray()[0])
+
+            # Vaciar las muestras que el resampler tenga retenidas
+            for salida in resampler.resample(None):
+                agregar(salida.to_ndarray()[0])
+
+        if frontend is not None:
+            return frontend.crudo
+        if not bloques:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(bloques)
+    except Exception as e:
+        print(f"Error PyAV: {e}")
+        return None
+
+class LectorConCopia:
+    """
+    Envoltorio de solo lectura sobre un stream (p. ej. el cuerpo HTTP) que
+    guarda los bytes comprimidos leídos hasta que PyAV entrega el primer
+    bloque (soltar()). Si PyAV no llega a decodificar nada (contenedor o
+    códec que no reconoce), resto() devuelve el archivo completo para el
+    respaldo con FFmpeg (el stream HTTP no se puede rebobinar).
+    """
+
+    def __init__(self, fuente):
+        self.fuente = fuente
+        self._leido = []
+
+    @property
+    def copiando(self):
+        return self._leido is not None
+
+    def read(self, n=-1):
+        datos = self.fuente.read(n)
+        if datos and self._leido is not None:
+            self._leido.append(datos)
+        return datos
+
+    def soltar(self):
+        """Descarta la copia y deja de guardar lo que se lea después."""
+        self._leido = None
+
+    def resto(self):
+        """Bytes ya leídos + lo que falta del stream (solo mientras se copia)."""
+        restante = self.fuente.read()
+        return b"".join(self._leido) + (restante or b"")
+
+def bloques_pcm(fuente):
+    """
+    Generador: decodifica `fuente` (objeto con read(), p. ej. el cuerpo de
+    la respuesta HTTP) a medida que llegan los bytes y entrega bloques
+    float32 mono 16 kHz. Cerrar el generador antes de tiempo (break)
+    cierra el contenedor sin leer el resto del stream.
+    """
+    with av.open(fuente, mode="r") as contenedor:
+        stream = contenedor.streams.audio[0]
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+
+        for frame in contenedor.decode(stream):
+            for salida in resampler.resample(frame):
+                yield salida.to_ndarray()[0]
+
+        # Vaciar las muestras que el resampler tenga retenidas
+        for salida in resampler.resample(None):
+            yield salida.to_ndarray()[0]
+
+def decodificar_stream(fuente, frontend, detener=None):
+    """
+    Decodifica un stream (sin tenerlo entero en memoria) alimentando
+    `frontend` bloque a bloque. `detener(frontend)` se evalúa tras cada
+    bloque; si retorna True se deja de leer (parada temprana).
+
+    Sin PyAV (o con AUDIO_DECODER=ffmpeg), o si PyAV falla antes del primer
+    bloque, se lee el resto del stream y se usa el subproceso de FFmpeg.
+    Desde el primer bloque no se guarda el archivo comprimido: si PyAV
+    falla más adelante (chunk truncado o corrupto) se conserva el audio
+    decodificado hasta ese punto.
+
+    Returns:
+        (audio crudo float32 o None, True si se detuvo antes del final)
+    """
+    lector = LectorConCopia(fuente)
+    if av is not None and AUDIO_DECODER == "pyav":
+        bloques = bloques_pcm(lector)
+        try:
+            for bloque in bloques:
+                if lector.copiando:
+                    lector.soltar()
+                frontend.procesar(bloque)
+                if detener is not None and detener(frontend):
+                    return frontend.crudo, True
+            return frontend.crudo, False
+        except Exception as e:
+            print(f"Error PyAV (stream): {e}")
+            if not lector.copiando:
+                return frontend.crudo, False
+            frontend.reiniciar()
+        finally:
+            bloques.close()
+
+    audio = convertir_a_numpy_ffmpeg(lector.resto())
+    if audio is not None:
+        frontend.procesar(audio)
+    return audio, False
 
-def convertir_a_numpy(file_bytes):
+def convertir_a_numpy_ffmpeg(file_bytes):
     """
     Usa FFmpeg para convertir cualquier cosa (webm, mp3) a array numpy raw float32
     """
@@ -0,0 +1,143 @@
+"""
+benchmark_cascada.py — Cascada de Whisper vs solo modelo completo
+=================================================================
+Compara, sobre un corpus etiquetado de chunks de audio:
+
+  • medium-only: todo chunk con voz se transcribe con transcriber.MODEL_SIZE.
+  • cascada:     modelo rápido (WHISPER_FAST_MODEL, greedy) y re-transcripción
+                 con el completo solo de los chunks dudosos
+                 (worker.transcribir_y_analizar con WHISPER_CASCADE=1).
+
+Reporta throughput (chunks/s), fracción escalada al modelo completo,
+acuerdo de categoría entre ambos modos y exactitud contra la etiqueta.
+Cada modo arranca con la caché de scores NLP vacía y sin Redis (si no,
+el segundo modo encontraría los textos del primero ya analizados) y
+corre un lote de calentamiento sin cronometrar.
+
+Corpus: archivo JSONL, una línea por chunk:
+  {"audio": "ruta/al/chunk.webm", "label": "SOSPECHOSO"}
+Etiquetas válidas: SOSPECHOSO | DOMESTICO | NEUTRAL | SILENCIO.
+Las rutas relativas se resuelven contra la carpeta del JSONL.
+
+Ejecutar:  python benchmark_cascada.py corpus.jsonl [--json]
+"""
+
+import json
+import os
+import sys
+import time
+
+# La cascada debe estar activa ANTES de importar transcriber (carga ambos modelos)
+os.environ["WHISPER_CASCADE"] = "1"
+
+import transcriber
+import worker
+from cache import CacheScores
+
+LOTE = int(os.environ.get("AUDIO_BATCH_SIZE", "8"))
+
+
+def cargar_corpus(ruta):
+    base = os.path.dirname(os.path.abspath(ruta))
+    corpus = []
+    with open(ruta, "r", encoding="utf-8") as f:
+        for linea in f:
+            if not linea.strip():
+                continue
+            item = json.loads(linea)
+            with open(os.path.join(base, item["audio"]), "rb") as audio:
+                corpus.append((item["label"].upper(), audio.read()))
+    return corpus
+
+
+def categoria(chunk):
+    if chunk is None or chunk["silencio"]:
+        return "SILENCIO"
+    if "analisis" not in chunk:
+        return "NEUTRAL"
+    return chunk["analisis"]["category"]
+
+
+def vaciar_cache_nlp():
+    """Caché de scores nueva, solo en memoria, para que ningún modo herede los textos del otro."""
+    anterior = worker.analyzer_service.cache
+    worker.analyzer_service.cache = CacheScores(
+        namespace=anterior.namespace, max_items=anterior.local.max_items, ttl_s=anterior.local.ttl_s,
+    )
+
+
+def calentar(corpus):
+    """Un lote sin cronometrar: primeras llamadas a CTranslate2/MiniLM, buffers, caches del SO."""
+    chunks = [worker.preparar_audio(audio) for _, audio in corpus[:LOTE]]
+    worker.transcribir_y_analizar([c for c in chunks if c is not None and not c["silencio"]])
+
+
+def correr(corpus, cascada):
+    """Procesa el corpus en lotes de LOTE → (categorías, tiers, segundos de STT+NLP)."""
+    transcriber.WHISPER_CASCADE = cascada
+    calentar(corpus)
+    vaciar_cache_nlp()
+    categorias, tiers, segundos = [], [], 0.0
+
+    for inicio in range(0, len(corpus), LOTE):
+        # La preparación (decode/VAD/filtro) es idéntica en ambos modos: no se cronometra
+        chunks = [worker.preparar_audio(audio) for _, audio in corpus[inicio:inicio + LOTE]]
+        con_voz = [c for c in chunks if c is not None and not c["silencio"]]
+
+        t0 = time.perf_counter()
+        worker.transcribir_y_analizar(con_voz)
+        segundos += time.perf_counter() - t0
+
+        categorias.extend(categoria(c) for c in chunks)
+        tiers.extend(c.get("stt_tier") if c is not None else None for c in chunks)
+
+    return categorias, tiers, segundos
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    if transcriber.fast_model is None:
+        print("❌ No se pudo cargar el modelo rápido; no hay cascada que medir.")
+        sys.exit(1)
+
+    corpus = cargar_corpus(sys.argv[1])
+    etiquetas = [label for label, _ in corpus]
+    n = len(corpus)
+
+    cat_completo, _, seg_completo = correr(corpus, cascada=False)
+    cat_cascada, tiers, seg_cascada = correr(corpus, cascada=True)
+
+    con_voz = [t for t in tiers if t is not None]
+    reporte = {
+        "chunks": n,
+        "fast_model": transcriber.FAST_MODEL_SIZE,
+        "full_model": transcriber.MODEL_SIZE,
+        "band": worker.WHISPER_CASCADE_BAND,
+        "min_logprob": worker.WHISPER_CASCADE_MIN_LOGPROB,
+        "full_only_chunks_per_s": round(n / seg_completo, 3) if seg_completo else None,
+        "cascade_chunks_per_s": round(n / seg_cascada, 3) if seg_cascada else None,
+        "speedup": round(seg_completo / seg_cascada, 3) if seg_cascada else None,
+        "escalated_ratio": round(
+            sum(t == transcriber.MODEL_SIZE for t in con_voz) / len(con_voz), 4
+        ) if con_voz else 0.0,
+        "agreement": round(sum(a == b for a, b in zip(cat_completo, cat_cascada)) / n, 4),
+        "full_only_accuracy": round(sum(a == b for a, b in zip(cat_completo, etiquetas)) / n, 4),
+        "cascade_accuracy": round(sum(a == b for a, b in zip(cat_cascada, etiquetas)) / n, 4),
+    }
+
+    if "--json" in sys.argv:
+        print(json.dumps(reporte, indent=2))
+        return
+
+    print("=" * 60)
+    print(f"Cascada {reporte['fast_model']} → {reporte['full_model']} sobre {n} chunks")
+    print("=" * 60)
+    for clave, valor in reporte.items():
+        print(f"  {clave:<24} {valor}")
+
+
+if __name__ == "__main__":
+    main()
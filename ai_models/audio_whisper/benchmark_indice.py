@@ -0,0 +1,111 @@
+"""
+benchmark_indice.py — Recall y latencia de los índices del banco de frases
+==========================================================================
+Compara IndiceExacto vs IndiceIVF (indice_frases.py) sobre bancos
+sintéticos de distintos tamaños, sin cargar MiniLM.
+
+Los bancos imitan la estructura de los embeddings reales: frases
+agrupadas alrededor de "intenciones" (centros) con ruido, en D = 384.
+Las consultas son variaciones ruidosas de frases del banco.
+
+Métricas por tamaño de banco:
+  • recall@1:       fracción de consultas donde el IVF encuentra la misma
+                    frase top-1 que la búsqueda exacta.
+  • err_max_score:  diferencia máxima |score_exacto - score_ivf| (el campo
+                    que consume soft_evidence.normalizar_audio).
+  • ms/lote:        latencia media por lote de consultas.
+
+Ejecutar:  python benchmark_indice.py [--json]
+"""
+
+import json
+import sys
+import time
+
+import numpy as np
+
+from indice_frases import IndiceExacto, IndiceIVF
+
+DIM = 384
+TAMANOS = [1_000, 10_000, 50_000]
+CONSULTAS = 256
+LOTE = 8
+REPETICIONES = 3
+# Norma del ruido relativo a un vector unitario. Con 0.9 una frase queda a
+# coseno ≈ 0.75 de su intención; con 0.75 una consulta queda a ≈ 0.8 de su
+# frase de origen (rango típico de paráfrasis con MiniLM).
+RUIDO_FRASE = 0.9
+RUIDO_CONSULTA = 0.75
+
+
+def _normalizar(m):
+    return (m / np.linalg.norm(m, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _ruido(forma, norma, rng):
+    return norma * rng.standard_normal(forma) / np.sqrt(DIM)
+
+
+def generar_banco(n, rng):
+    centros = _normalizar(rng.standard_normal((max(8, n // 50), DIM)))
+    asignacion = rng.integers(0, len(centros), n)
+    return _normalizar(centros[asignacion] + _ruido((n, DIM), RUIDO_FRASE, rng))
+
+
+def generar_consultas(banco, rng):
+    base = banco[rng.integers(0, len(banco), CONSULTAS)]
+    return _normalizar(base + _ruido(base.shape, RUIDO_CONSULTA, rng))
+
+
+def medir(indice, consultas):
+    """Ejecuta todas las consultas en lotes de LOTE → (scores, ids, ms por lote)."""
+    mejor = float("inf")
+    for _ in range(REPETICIONES):
+        t0 = time.perf_counter()
+        resultados = [indice.buscar(consultas[i:i + LOTE], k=1) for i in range(0, len(consultas), LOTE)]
+        mejor = min(mejor, time.perf_counter() - t0)
+    scores = np.concatenate([s for s, _ in resultados])[:, 0]
+    ids = np.concatenate([i for _, i in resultados])[:, 0]
+    return scores, ids, 1000 * mejor / (len(consultas) / LOTE)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    filas = []
+
+    for n in TAMANOS:
+        banco = generar_banco(n, rng)
+        consultas = generar_consultas(banco, rng)
+
+        s_exacto, i_exacto, ms_exacto = medir(IndiceExacto(banco), consultas)
+
+        t0 = time.perf_counter()
+        ivf = IndiceIVF(banco)
+        construccion_s = time.perf_counter() - t0
+        s_ivf, i_ivf, ms_ivf = medir(ivf, consultas)
+
+        filas.append({
+            "bank_size": n,
+            "nlist": ivf.nlist,
+            "nprobe": ivf.nprobe,
+            "recall_at_1": round(float(np.mean(i_exacto == i_ivf)), 4),
+            "max_score_error": round(float(np.max(np.abs(s_exacto - s_ivf))), 4),
+            "exact_ms_per_batch": round(ms_exacto, 3),
+            "ivf_ms_per_batch": round(ms_ivf, 3),
+            "ivf_build_s": round(construccion_s, 2),
+        })
+
+    if "--json" in sys.argv:
+        print(json.dumps(filas, indent=2))
+        return
+
+    print(f"{'frases':>8} {'nlist':>6} {'nprobe':>6} {'recall@1':>9} {'err_max':>8} "
+          f"{'exacto ms':>10} {'ivf ms':>8} {'build s':>8}")
+    for f in filas:
+        print(f"{f['bank_size']:>8} {f['nlist']:>6} {f['nprobe']:>6} {f['recall_at_1']:>9.3f} "
+              f"{f['max_score_error']:>8.4f} {f['exact_ms_per_batch']:>10.3f} "
+              f"{f['ivf_ms_per_batch']:>8.3f} {f['ivf_build_s']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""
+benchmark_pipeline.py — Latencias por etapa del pipeline de audio
+=================================================================
+Corre worker.procesar_audio() (o procesar_lote_audio() con --lote N) fuera
+de línea sobre un corpus de chunks WebM y reporta, por etapa:
+
+  stream     worker.descargar_y_decodificar (AUDIO_STREAM_DOWNLOAD=1: descarga
+             y decode solapados; incluye rms)
+  download   worker.descargar_audio_bytes  (HTTP local que simula Blob Storage)
+  decode     audiocleaner.convertir_a_numpy (PyAV o subproceso FFmpeg)
+  rms        audiocleaner.FrontEndVoz.procesar (RMS/pico por bloque DENTRO
+             de decode: decode incluye este tiempo; ítems = muestras)
+  vad        vad.detectar_voz
+  bandpass   audiocleaner.aplicar_filtro_voz
+  whisper    transcriber.transcribir_lote / transcribir_lote_rapido
+  embedding  analyzer_service.analizar_batch
+
+p50/p95/p99 (ms por llamada), llamadas, ítems y throughput (ítems/s de la
+etapa), más la latencia end-to-end por mensaje. La salida JSON es estable
+para comparar releases (--salida reporte.json).
+
+Corpus:
+  • --corpus corpus.jsonl  mismo formato que benchmark_cascada.py
+                           ({"audio": "chunk.webm", "label": "SOSPECHOSO"}).
+  • sin --corpus           se genera uno sintético en --dir (default
+                           .cache/bench_corpus): silencio, ruido de fondo y
+                           "voz" sintética (pulsos glotales + formantes) en
+                           dos ritmos, DOMESTICO y SOSPECHOSO. No es habla
+                           real: ejercita decode/DSP/VAD/Whisper con carga
+                           realista, pero las categorías NLP no son medibles.
+
+Ejecutar:  python benchmark_pipeline.py [--corpus c.jsonl | --dir D --por-clase 10]
+                                        [--lote N] [--repeticiones R] [--sin-http]
+                                        [--json] [--salida reporte.json]
+           python benchmark_pipeline.py --solo-generar --dir D
+"""
+
+import argparse
+import functools
+import http.server
+import io
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+CHUNK_S = 15
+# Tasa de Opus en WebM (la que produce MediaRecorder en el navegador)
+OPUS_RATE = 48000
+ETAPAS = ["stream", "download", "decode", "rms", "vad", "bandpass", "whisper", "embedding"]
+
+
+# ── Corpus sintético ─────────────────────────────────────────
+
+def _voz_sintetica(rng, duracion_s, f0, silabas_por_s, rate=SAMPLE_RATE):
+    """Tren de pulsos glotales con jitter, tres formantes y envolvente silábica."""
+    n = int(duracion_s * rate)
+    t = np.arange(n) / rate
+
+    # f0 con vibrato lento y jitter → fase acumulada
+    f0_t = f0 * (1 + 0.05 * np.sin(2 * np.pi * 0.7 * t) + 0.01 * rng.standard_normal(n))
+    fase = np.cumsum(f0_t) / rate
+    pulsos = (np.diff(np.floor(fase), prepend=0) > 0).astype(np.float32)
+
+    # Formantes de una vocal media (≈ /e/) como resonadores de 2º orden
+    from scipy.signal import lfilter
+    senal = pulsos
+    for formante, ancho in ((500, 80), (1700, 120), (2500, 160)):
+        r = np.exp(-np.pi * ancho / rate)
+        theta = 2 * np.pi * formante / rate
+        senal = senal + lfilter([1 - r], [1, -2 * r * np.cos(theta), r * r], pulsos)
+
+    # Sílabas: envolvente ~silabas_por_s con pausas de frase
+    envolvente = np.clip(np.sin(np.pi * silabas_por_s * t) ** 2, 0, 1)
+    frases = (np.sin(2 * np.pi * t / rng.uniform(2.5, 4.0)) > -0.4).astype(np.float32)
+    senal = senal * envolvente * frases
+
+    senal /= max(np.max(np.abs(senal)), 1e-9)
+    return (0.3 * senal).astype(np.float32)
+
+
+def _generar_muestra(clase, rng, duracion_s=CHUNK_S):
+    n = duracion_s * SAMPLE_RATE
+    if clase == "SILENCIO":
+        return (1e-4 * rng.standard_normal(n)).astype(np.float32)
+    ruido = rng.standard_normal(n).astype(np.float32)
+    if clase == "RUIDO":
+        # Ruido "rosa" aproximado (ventilador/teclado lejano)
+        return (0.05 * np.cumsum(ruido) / np.sqrt(n) + 0.01 * ruido).astype(np.float32)
+    if clase == "DOMESTICO":
+        voz = _voz_sintetica(rng, duracion_s, f0=rng.uniform(170, 230), silabas_por_s=4.0)
+    else:
+        voz = _voz_sintetica(rng, duracion_s, f0=rng.uniform(95, 140), silabas_por_s=5.5)
+    return voz + 0.005 * ruido
+
+
+def _codificar_webm(audio, rate=SAMPLE_RATE):
+    """float32 mono → bytes WebM/Opus (como los chunks del navegador)."""
+    import av
+
+    # Remuestreo lineal simple a 48 kHz (Opus no acepta 16 kHz en WebM)
+    n48 = len(audio) * OPUS_RATE // rate
+    audio48 = np.interp(np.arange(n48) * rate / OPUS_RATE, np.arange(len(audio)), audio).astype(np.float32)
+
+    buffer = io.BytesIO()
+    with av.open(buffer, mode="w", format="webm") as contenedor:
+        stream = contenedor.add_stream("libopus", rate=OPUS_RATE)
+        stream.layout = "mono"
+        paso = OPUS_RATE // 50   # frames de 20 ms
+        for inicio in range(0, len(audio48), paso):
+            frame = av.AudioFrame.from_ndarray(audio48[None, inicio:inicio + paso], format="flt", layout="mono")
+            frame.sample_rate = OPUS_RATE
+            frame.pts = inicio
+            for paquete in stream.encode(frame):
+                contenedor.mux(paquete)
+        for paquete in stream.encode(None):
+            contenedor.mux(paquete)
+    return buffer.getvalue()
+
+
+def generar_corpus(directorio, por_clase, semilla=42):
+    """Escribe `por_clase` chunks WebM por clase y el corpus.jsonl → ruta del JSONL."""
+    os.makedirs(directorio, exist_ok=True)
+    rng = np.random.default_rng(semilla)
+    ruta_jsonl = os.path.join(directorio, "corpus.jsonl")
+
+    with open(ruta_jsonl, "w", encoding="utf-8") as f:
+        for clase in ("SILENCIO", "RUIDO", "DOMESTICO", "SOSPECHOSO"):
+            for i in range(por_clase):
+                nombre = f"{clase.lower()}_{i:03d}.webm"
+                with open(os.path.join(directorio, nombre), "wb") as audio:
+                    audio.write(_codificar_webm(_generar_muestra(clase, rng)))
+                f.write(json.dumps({"audio": nombre, "label": clase}) + "\n")
+    return ruta_jsonl
+
+
+def cargar_corpus(ruta):
+    """JSONL → lista de (label, ruta absoluta del chunk)."""
+    base = os.path.dirname(os.path.abspath(ruta))
+    corpus = []
+    with open(ruta, "r", encoding="utf-8") as f:
+        for linea in f:
+            if linea.strip():
+                item = json.loads(linea)
+                corpus.append((item["label"].upper(), os.path.join(base, item["audio"])))
+    return corpus
+
+
+# ── Blob Storage local ───────────────────────────────────────
+
+def servir_directorio(directorio):
+    """Servidor HTTP en 127.0.0.1 (puerto libre) que simula Blob Storage → (server, url base)."""
+    handler = functools.partial(_HandlerSilencioso, directory=directorio)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class _HandlerSilencioso(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+# ── Instrumentación ──────────────────────────────────────────
+
+class Cronometro:
+    """Acumula (segundos, ítems) por llamada a cada etapa."""
+
+    def __init__(self):
+        self.llamadas = {etapa: [] for etapa in ETAPAS}
+
+    def envolver(self, objeto, atributo, etapa, items=lambda args: 1):
+        original = getattr(objeto, atributo)
+
+        @functools.wraps(original)
+        def medido(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.llamadas[etapa].append((time.perf_counter() - t0, items(args)))
+
+        setattr(objeto, atributo, medido)
+
+    def reiniciar(self):
+        for etapa in self.llamadas:
+            self.llamadas[etapa] = []
+
+
+def resumir(muestras):
+    """Lista de (segundos, ítems) → percentiles en ms y throughput."""
+    if not muestras:
+        return {"calls": 0, "items": 0}
+    segundos = np.array([s for s, _ in muestras])
+    items = int(sum(n for _, n in muestras))
+    p50, p95, p99 = np.percentile(segundos * 1000, [50, 95, 99])
+    total = float(segundos.sum())
+    return {
+        "calls": len(muestras),
+        "items": items,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(segundos.mean() * 1000), 3),
+        "total_s": round(total, 4),
+        "items_per_s": round(items / total, 3) if total > 0 else None,
+    }
+
+
+def instrumentar(worker):
+    """Envuelve las etapas del pipeline (los módulos se resuelven en cada llamada)."""
+    import audiocleaner
+    import transcriber
+    import vad
+
+    crono = Cronometro()
+    n_lista = lambda args: len(args[0])  # noqa: E731  (llamadas en lote)
+    crono.envolver(worker, "descargar_y_decodificar", "stream")
+    crono.envolver(worker, "descargar_audio_bytes", "download")
+    crono.envolver(audiocleaner, "convertir_a_numpy", "decode")
+    crono.envolver(audiocleaner.FrontEndVoz, "procesar", "rms", lambda args: len(args[1]))
+    crono.envolver(vad, "detectar_voz", "vad")
+    crono.envolver(audiocleaner, "aplicar_filtro_voz", "bandpass")
+    crono.envolver(transcriber, "transcribir_lote", "whisper", n_lista)
+    crono.envolver(transcriber, "transcribir_lote_rapido", "whisper", n_lista)
+    crono.envolver(worker.analyzer_service, "analizar_batch", "embedding", n_lista)
+    return crono
+
+
+# ── Ejecución ────────────────────────────────────────────────
+
+def correr(worker, corpus, url_base, lote, repeticiones, crono):
+    """Procesa el corpus `repeticiones` veces → latencias end-to-end por mensaje."""
+    if url_base is None:
+        # Sin HTTP: la "descarga" es leer el archivo local (sin streaming)
+        worker.AUDIO_STREAM_DOWNLOAD = False
+        def leer_local(ruta):
+            with open(ruta, "rb") as f:
+                return f.read()
+        original = worker.descargar_audio_bytes
+        worker.descargar_audio_bytes = leer_local
+        crono.envolver(worker, "descargar_audio_bytes", "download")
+
+    mensajes = []
+    for i, (_, ruta) in enumerate(corpus):
+        url = ruta if url_base is None else f"{url_base}/{os.path.basename(ruta)}"
+        mensajes.append((f"bench-user-{i}", f"bench-sesion-{i}", url))
+
+    # Calentamiento: primera llamada de cada modelo fuera de la medición
+    worker.procesar_lote_audio(mensajes[:max(1, lote)])
+    crono.reiniciar()
+
+    por_mensaje, eventos = [], []
+    t_inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for inicio in range(0, len(mensajes), lote):
+            ventana = mensajes[inicio:inicio + lote]
+            t0 = time.perf_counter()
+            if lote == 1:
+                salida = [worker.procesar_audio(*ventana[0])]
+            else:
+                salida = worker.procesar_lote_audio(ventana)
+            # En lote, cada mensaje espera a todo el lote
+            por_mensaje.extend([(time.perf_counter() - t0, 1)] * len(ventana))
+            eventos.extend(salida)
+    total = time.perf_counter() - t_inicio
+
+    if url_base is None:
+        worker.descargar_audio_bytes = original
+    return por_mensaje, eventos, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por etapa del worker de audio")
+    parser.add_argument("--corpus", help="JSONL de chunks (formato de benchmark_cascada.py)")
+    parser.add_argument("--dir", default=os.path.join(".cache", "bench_corpus"),
+                        help="Carpeta del corpus sintético")
+    parser.add_argument("--por-clase", type=int, default=10, help="Chunks sintéticos por clase")
+    parser.add_argument("--lote", type=int, default=1, help="1 = procesar_audio(); N = procesar_lote_audio()")
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--sin-http", action="store_true", help="Leer los chunks del disco en vez de HTTP local")
+    parser.add_argument("--solo-generar", action="store_true", help="Solo generar el corpus sintético")
+    parser.add_argument("--json", action="store_true", help="Imprimir el reporte como JSON")
+    parser.add_argument("--salida", help="Escribir el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    ruta_corpus = args.corpus
+    if ruta_corpus is None:
+        ruta_corpus = os.path.join(args.dir, "corpus.jsonl")
+        if not os.path.exists(ruta_corpus) or args.solo_generar:
+            print(f"⏳ Generando corpus sintético en {args.dir}...", file=sys.stderr)
+            ruta_corpus = generar_corpus(args.dir, args.por_clase)
+    if args.solo_generar:
+        print(ruta_corpus)
+        return
+
+    corpus = cargar_corpus(ruta_corpus)
+    lote = max(1, args.lote)
+
+    # Importar el worker carga Whisper + MiniLM: fuera de toda medición
+    import audiocleaner
+    import transcriber
+    import worker
+
+    crono = instrumentar(worker)
+    server, url_base = (None, None)
+    if not args.sin_http:
+        server, url_base = servir_directorio(os.path.dirname(os.path.abspath(ruta_corpus)))
+
+    try:
+        por_mensaje, eventos, total = correr(worker, corpus, url_base, lote, args.repeticiones, crono)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    reporte = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "chunks": len(corpus),
+            "repeticiones": args.repeticiones,
+            "lote": lote,
+            "blob": "file" if url_base is None else "http",
+            "stream_download": worker.AUDIO_STREAM_DOWNLOAD,
+            "early_stop_s": worker.AUDIO_EARLY_STOP_S,
+            "decoder": audiocleaner.AUDIO_DECODER if audiocleaner.av is not None else "ffmpeg",
+            "vad_gating": worker.AUDIO_VAD_GATING,
+            "whisper_model": transcriber.MODEL_SIZE,
+            "whisper_loaded": transcriber.model is not None,
+            "whisper_cascade": transcriber.WHISPER_CASCADE,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpus": os.cpu_count(),
+        },
+        "corpus": {label: sum(l == label for l, _ in corpus) for label in sorted({l for l, _ in corpus})},
+        "end_to_end": {
+            **resumir(por_mensaje),
+            "wall_s": round(total, 4),
+            "messages_per_s": round(len(por_mensaje) / total, 3) if total > 0 else None,
+            "failed": sum(e is None for e in eventos),
+        },
+        "stages": {etapa: resumir(crono.llamadas[etapa]) for etapa in ETAPAS},
+    }
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2)
+
+    if args.json:
+        print(json.dumps(reporte, indent=2))
+        return
+
+    print("=" * 72)
+    print(f"Pipeline de audio: {len(corpus)} chunks × {args.repeticiones}, lote {lote}, blob {reporte['config']['blob']}")
+    print("=" * 72)
+    print(f"  {'etapa':<11}{'llamadas':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ítems/s':>11}")
+    for nombre, stats in [*reporte["stages"].items(), ("end_to_end", reporte["end_to_end"])]:
+        if not stats["calls"]:
+            print(f"  {nombre:<11}{0:>9}")
+            continue
+        print(f"  {nombre:<11}{stats['calls']:>9}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{str(stats['items_per_s']):>11}")
+    print(f"\n  Throughput end-to-end: {reporte['end_to_end']['messages_per_s']} mensajes/s")
+
+
+if __name__ == "__main__":
+    main()
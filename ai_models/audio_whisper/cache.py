@@ -0,0 +1,166 @@
+"""
+cache.py — Cachés en memoria del Worker de Audio
+=================================================
+  • CacheLRU:    LRU acotada con expiración (TTL) y contadores hit/miss.
+  • CacheScores: transcripción normalizada → (raw_score_trampa, raw_score_domestico),
+                 con un segundo nivel opcional en Redis compartido entre réplicas.
+
+Las frases cortas se repiten muchísimo entre chunks y sesiones
+("ya voy", "espera", "cierra la puerta"); con esta caché no pasan por MiniLM.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+_RE_PUNTUACION = re.compile(r"[^\w\s]")
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Forma canónica de una transcripción para usarla como llave de caché:
+    minúsculas, sin acentos, sin puntuación y con espacios colapsados.
+
+    "¡Ya voy, Mamá!" → "ya voy mama"
+    """
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = _RE_PUNTUACION.sub(" ", texto)
+    return _RE_ESPACIOS.sub(" ", texto).strip()
+
+
+class CacheLRU:
+    """LRU acotada a `max_items` con expiración por entrada (`ttl_s`)."""
+
+    def __init__(self, max_items: int = 10000, ttl_s: float = 3600.0):
+        self.max_items = max_items
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, llave):
+        with self._lock:
+            entrada = self._datos.get(llave)
+            if entrada is None or entrada[1] < time.monotonic():
+                if entrada is not None:
+                    del self._datos[llave]
+                self.misses += 1
+                return None
+            self._datos.move_to_end(llave)
+            self.hits += 1
+            return entrada[0]
+
+    def set(self, llave, valor):
+        with self._lock:
+            self._datos[llave] = (valor, time.monotonic() + self.ttl_s)
+            self._datos.move_to_end(llave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+
+    def items(self) -> list:
+        """(llave, valor) de las entradas vigentes, sin tocar el orden LRU."""
+        ahora = time.monotonic()
+        with self._lock:
+            return [(llave, valor) for llave, (valor, expira) in self._datos.items() if expira >= ahora]
+
+    def __len__(self):
+        return len(self._datos)
+
+
+class CacheScores:
+    """
+    Caché de scores semánticos por transcripción normalizada.
+
+    Nivel 1: CacheLRU en memoria del proceso.
+    Nivel 2 (opcional): Redis, si se pasa un cliente. Los errores de Redis
+    nunca rompen el pipeline: se tratan como miss.
+    """
+
+    def __init__(self, namespace: str, max_items: int = 10000,
+                 ttl_s: float = 3600.0, cliente_redis=None):
+        self.namespace = namespace
+        self.local = CacheLRU(max_items, ttl_s)
+        self.redis = cliente_redis
+        self.redis_hits = 0
+        self.redis_misses = 0
+
+    def _llave_redis(self, llave: str) -> str:
+        digest = hashlib.sha1(llave.encode("utf-8")).hexdigest()
+        return f"audio:nlp:{self.namespace}:{digest}"
+
+    def obtener_muchos(self, llaves: list[str]) -> dict:
+        """Retorna {llave: (score_trampa, score_domestico)} para las llaves en caché."""
+        encontrados = {}
+        pendientes = []
+        for llave in llaves:
+            valor = self.local.get(llave)
+            if valor is not None:
+                encontrados[llave] = valor
+            else:
+                pendientes.append(llave)
+
+        if pendientes and self.redis is not None:
+            try:
+                valores = self.redis.mget([self._llave_redis(ll) for ll in pendientes])
+                for llave, crudo in zip(pendientes, valores):
+                    if crudo is None:
+                        self.redis_misses += 1
+                        continue
+                    valor = tuple(json.loads(crudo))
+                    self.redis_hits += 1
+                    self.local.set(llave, valor)
+                    encontrados[llave] = valor
+            except Exception as e:
+                print(f"⚠️ Caché Redis no disponible: {e}")
+
+        return encontrados
+
+    def guardar_muchos(self, valores: dict):
+        """Guarda {llave: (score_trampa, score_domestico)} en ambos niveles."""
+        for llave, valor in valores.items():
+            self.local.set(llave, valor)
+
+        if valores and self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for llave, valor in valores.items():
+                    pipe.set(self._llave_redis(llave), json.dumps(valor), ex=int(self.local.ttl_s))
+                pipe.execute()
+            except Exception as e:
+                print(f"⚠️ Caché Redis no disponible: {e}")
+
+    def estadisticas(self) -> dict:
+        return {
+            "hits": self.local.hits,
+            "misses": self.local.misses,
+            "items": len(self.local),
+            "redis_hits": self.redis_hits,
+            "redis_misses": self.redis_misses,
+        }
+
+
+def crear_cliente_redis():
+    """Cliente Redis a partir de REDIS_HOST/REDIS_PORT/REDIS_PASSWORD, o None."""
+    host = os.environ.get("REDIS_HOST")
+    if not host or redis is None:
+        return None
+    return redis.Redis(
+        host=host,
+        port=int(os.environ.get("REDIS_PORT", "6379")),
+        password=os.environ.get("REDIS_PASSWORD") or None,
+        socket_timeout=0.2,
+        socket_connect_timeout=0.5,
+    )
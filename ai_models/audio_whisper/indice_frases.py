@@ -0,0 +1,194 @@
+"""
+indice_frases.py — Índices de búsqueda top-k sobre el banco de frases
+======================================================================
+El analizador semántico necesita, por cada transcripción, la similitud
+coseno máxima contra cada categoría del banco (TRAMPA / DOMÉSTICO).
+Todos los vectores llegan normalizados (norma L2 = 1), así que la
+similitud coseno es un producto punto.
+
+Backends:
+  • IndiceExacto: matmul por bloques de filas del banco. Resultado exacto,
+                  memoria acotada. Ideal para bancos chicos/medianos.
+  • IndiceIVF:    índice aproximado de archivos invertidos (IVF). Agrupa el
+                  banco con k-means esférico y en la consulta solo revisa
+                  las `nprobe` listas cuyos centroides más se parecen.
+                  Costo ≈ nlist + nprobe · P/nlist en vez de P.
+                  Con `ruta_cache`, centroides y listas se guardan en disco
+                  (.npy + .json, junto a la caché de embeddings del banco) y
+                  se mapean con mmap en los arranques siguientes: el k-means
+                  solo corre cuando cambia el banco.
+
+crear_indice() elige el backend según PHRASE_INDEX_BACKEND y el tamaño.
+"""
+
+import json
+import os
+
+import numpy as np
+
+# "auto" | "exacto" | "ivf"
+PHRASE_INDEX_BACKEND = os.environ.get("PHRASE_INDEX_BACKEND", "auto")
+# En modo "auto", a partir de cuántas frases se usa el índice aproximado
+PHRASE_INDEX_APPROX_MIN = int(os.environ.get("PHRASE_INDEX_APPROX_MIN", "20000"))
+# Listas revisadas por consulta. 0 = automático: max(8, nlist / 16)
+PHRASE_INDEX_NPROBE = int(os.environ.get("PHRASE_INDEX_NPROBE", "0"))
+
+
+def _top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Top-k por fila (ordenado de mayor a menor) → (scores, columnas)."""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        cols = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        cols = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    vals = np.take_along_axis(scores, cols, axis=1)
+    orden = np.argsort(-vals, axis=1)
+    return np.take_along_axis(vals, orden, axis=1), np.take_along_axis(cols, orden, axis=1)
+
+
+class IndiceExacto:
+    """Búsqueda exacta con matmul por bloques de `bloque` frases."""
+
+    def __init__(self, matriz: np.ndarray, bloque: int = 8192):
+        self.matriz = matriz
+        self.bloque = bloque
+
+    def __len__(self):
+        return len(self.matriz)
+
+    def buscar(self, consultas: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Args:
+            consultas: Matriz (N, D) de embeddings normalizados.
+            k:         Vecinos a devolver por consulta.
+
+        Returns:
+            (scores, ids) de shape (N, k'), k' = min(k, P), ordenados desc.
+        """
+        mejores_s = np.full((len(consultas), 0), -np.inf, dtype=np.float32)
+        mejores_i = np.zeros((len(consultas), 0), dtype=np.int64)
+
+        for inicio in range(0, len(self.matriz), self.bloque):
+            scores = consultas @ self.matriz[inicio:inicio + self.bloque].T
+            s, i = _top_k(scores, k)
+            # Fusionar el top-k del bloque con el acumulado
+            mejores_s, cols = _top_k(np.concatenate([mejores_s, s], axis=1), k)
+            mejores_i = np.take_along_axis(np.concatenate([mejores_i, i + inicio], axis=1), cols, axis=1)
+
+        return mejores_s, mejores_i
+
+
+class IndiceIVF:
+    """Índice aproximado IVF (k-means esférico + `nprobe` listas por consulta)."""
+
+    # Arrays que se guardan en la caché (un .npy por campo)
+    _CAMPOS = ("centroides", "ids", "vectores", "offsets")
+
+    def __init__(self, matriz: np.ndarray, nlist: int | None = None,
+                 nprobe: int = PHRASE_INDEX_NPROBE, iteraciones: int = 10, semilla: int = 42,
+                 ruta_cache: str | None = None, llave: str | None = None):
+        """
+        `ruta_cache` (prefijo de archivos) + `llave` (hash del banco): si la
+        caché corresponde a la misma llave, cantidad de frases y nlist, se
+        mapea en vez de correr k-means; si no, se construye y se reescribe.
+        """
+        n = len(matriz)
+        self.nlist = max(1, min(n, nlist or int(4 * np.sqrt(n))))
+        self.nprobe = max(1, min(nprobe or max(8, self.nlist // 16), self.nlist))
+        meta = {"llave": llave, "frases": n, "nlist": self.nlist}
+
+        if ruta_cache is not None and self._cargar(ruta_cache, meta):
+            return
+
+        self.centroides = self._kmeans(matriz, iteraciones, semilla)
+        asignacion = np.argmax(matriz @ self.centroides.T, axis=1)
+
+        # Listas invertidas contiguas: las frases se reordenan por lista y
+        # `offsets[c]:offsets[c+1]` delimita la lista del centroide c.
+        orden = np.argsort(asignacion, kind="stable")
+        self.ids = orden
+        self.vectores = np.ascontiguousarray(matriz[orden], dtype=np.float32)
+        self.offsets = np.searchsorted(asignacion[orden], np.arange(self.nlist + 1))
+
+        if ruta_cache is not None:
+            self._guardar(ruta_cache, meta)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cargar(self, ruta_cache, meta) -> bool:
+        """Mapea la caché si corresponde a `meta`; False si no existe o no coincide."""
+        try:
+            with open(ruta_cache + ".json", 'r', encoding='utf-8') as f:
+                if json.load(f) != meta:
+                    return False
+            arrays = {c: np.load(f"{ruta_cache}_{c}.npy", mmap_mode='r') for c in self._CAMPOS}
+        except (OSError, ValueError):
+            return False
+        if (len(arrays["ids"]) != meta["frases"] or len(arrays["centroides"]) != self.nlist
+                or len(arrays["offsets"]) != self.nlist + 1):
+            return False
+        for campo, valor in arrays.items():
+            setattr(self, campo, valor)
+        return True
+
+    def _guardar(self, ruta_cache, meta):
+        """Escribe la caché de forma atómica; el .json va último (marca la caché como completa)."""
+        try:
+            os.makedirs(os.path.dirname(ruta_cache) or ".", exist_ok=True)
+            for campo in self._CAMPOS:
+                with open(f"{ruta_cache}_{campo}.npy.tmp", 'wb') as f:
+                    np.save(f, getattr(self, campo))
+                os.replace(f"{ruta_cache}_{campo}.npy.tmp", f"{ruta_cache}_{campo}.npy")
+            with open(ruta_cache + ".json.tmp", 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(ruta_cache + ".json.tmp", ruta_cache + ".json")
+        except OSError as e:
+            print(f"⚠️ No se pudo escribir la caché del índice IVF: {e}")
+
+    def _kmeans(self, matriz, iteraciones, semilla):
+        rng = np.random.default_rng(semilla)
+        centroides = matriz[rng.choice(len(matriz), self.nlist, replace=False)].astype(np.float32)
+        for _ in range(iteraciones):
+            asignacion = np.argmax(matriz @ centroides.T, axis=1)
+            orden = np.argsort(asignacion, kind="stable")
+            inicios = np.searchsorted(asignacion[orden], np.arange(self.nlist))
+            con_frases = np.bincount(asignacion, minlength=self.nlist) > 0
+            sumas = np.zeros_like(centroides)
+            sumas[con_frases] = np.add.reduceat(matriz[orden], inicios[con_frases], axis=0)
+            normas = np.linalg.norm(sumas, axis=1, keepdims=True)
+            # Un centroide sin frases conserva su posición anterior
+            centroides = np.where(normas > 0, sumas / np.maximum(normas, 1e-12), centroides)
+        return centroides
+
+    def buscar(self, consultas: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """Misma interfaz que IndiceExacto.buscar(), con resultado aproximado."""
+        _, listas = _top_k(consultas @ self.centroides.T, self.nprobe)
+        k = min(k, len(self.ids))
+        mejores_s = np.full((len(consultas), k), -np.inf, dtype=np.float32)
+        mejores_i = np.zeros((len(consultas), k), dtype=np.int64)
+
+        for q in range(len(consultas)):
+            filas = np.concatenate([
+                np.arange(self.offsets[c], self.offsets[c + 1]) for c in listas[q]
+            ])
+            if len(filas) == 0:
+                continue
+            s, cols = _top_k((self.vectores[filas] @ consultas[q])[None, :], k)
+            mejores_s[q, :s.shape[1]] = s[0]
+            mejores_i[q, :s.shape[1]] = self.ids[filas[cols[0]]]
+
+        return mejores_s, mejores_i
+
+
+def crear_indice(matriz: np.ndarray, backend: str = PHRASE_INDEX_BACKEND,
+                 ruta_cache: str | None = None, llave: str | None = None):
+    """
+    Construye el índice de una categoría del banco según el backend
+    configurado. `ruta_cache`/`llave` solo los usa el IVF (ver IndiceIVF).
+    """
+    if len(matriz) == 0:
+        return IndiceExacto(matriz)
+    if backend == "ivf" or (backend == "auto" and len(matriz) >= PHRASE_INDEX_APPROX_MIN):
+        return IndiceIVF(matriz, ruta_cache=ruta_cache, llave=llave)
+    return IndiceExacto(matriz)
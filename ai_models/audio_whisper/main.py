@@ -16,7 +16,7 @@ from datetime import datetime, timezone
 from dotenv import load_dotenv
 load_dotenv()
 
-from worker import procesar_audio
+from worker import procesar_audio, procesar_lote_audio, vaciar_colas_pendientes
 
 # --- LOGGER ESTRUCTURADO ---
 class JSONFormatter(logging.Formatter):
@@ -39,6 +39,17 @@ logger.addHandler(console_handler)
 # --- COLA DE SALIDA ---
 QUEUE_OUTPUT = 'q_infracciones'
 
+# --- MICRO-BATCHING ---
+# Se acumulan hasta AUDIO_BATCH_SIZE mensajes o AUDIO_BATCH_WINDOW_S segundos
+# (lo que ocurra primero) y se procesan juntos. AUDIO_BATCH_SIZE=1 desactiva
+# el modo por lotes y vuelve al consumo mensaje a mensaje.
+AUDIO_BATCH_SIZE = int(os.environ.get('AUDIO_BATCH_SIZE', '8'))
+AUDIO_BATCH_WINDOW_S = float(os.environ.get('AUDIO_BATCH_WINDOW_S', '0.5'))
+
+# --- STREAMING ---
+# Cada cuántos segundos se revisan las colas de voz retenidas sin chunk siguiente
+INTERVALO_VACIADO_S = 5.0
+
 def publicar_evidencia(channel, evento):
     """Publica el evento de soft evidence en la cola q_infracciones."""
     channel.basic_publish(
@@ -51,6 +62,15 @@ def publicar_evidencia(channel, evento):
         )
     )
 
+def vaciar_colas(channel):
+    """Publica los eventos de las colas de voz vencidas (worker.vaciar_colas_pendientes)."""
+    try:
+        for evento in vaciar_colas_pendientes():
+            publicar_evidencia(channel, evento)
+            logger.info("Evidencia suave publicada (cola retenida)", extra={"payload": evento})
+    except Exception as e:
+        logger.error(f"Error vaciando colas retenidas: {e}")
+
 # --- CALLBACK ---
 def on_message(ch, method, properties, body):
     try:
@@ -74,6 +94,73 @@ def on_message(ch, method, properties, body):
         logger.error(f"Error procesando mensaje: {e}")
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
 
+def procesar_lote(ch, lote):
+    """
+    Procesa una ventana de mensajes con worker.procesar_lote_audio().
+    Cada mensaje se confirma (ack/nack) de forma individual.
+    """
+    validos = []
+    for method, body in lote:
+        try:
+            payload = json.loads(body)
+            validos.append((method, (
+                payload.get("user_id"),
+                payload.get("sesion_id"),
+                payload.get("url_storage"),
+            )))
+        except Exception as e:
+            logger.error(f"Error procesando mensaje: {e}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+    if not validos:
+        return
+
+    logger.info(f"Procesando lote de {len(validos)} audios...")
+
+    try:
+        eventos = procesar_lote_audio([mensaje for _, mensaje in validos])
+    except Exception as e:
+        # Aislamiento de errores: si falla el lote, cada mensaje se reintenta solo
+        logger.error(f"Error procesando lote: {e}. Reintentando mensaje a mensaje...")
+        for method, (user_id, sesion_id, url_storage) in validos:
+            try:
+                evento = procesar_audio(user_id, sesion_id, url_storage)
+                if evento:
+                    publicar_evidencia(ch, evento)
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+            except Exception as e_item:
+                logger.error(f"Error procesando mensaje: {e_item}")
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        return
+
+    for (method, _), evento in zip(validos, eventos):
+        if evento:
+            publicar_evidencia(ch, evento)
+            logger.info("Evidencia suave publicada", extra={"payload": evento})
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+def consumir_en_lotes(channel, queue):
+    """Consume la cola acumulando ventanas de mensajes por tamaño o por tiempo."""
+    lote = []
+    limite = None
+    proximo_vaciado = time.monotonic() + INTERVALO_VACIADO_S
+
+    for method, _properties, body in channel.consume(queue, inactivity_timeout=AUDIO_BATCH_WINDOW_S):
+        if method is not None:
+            lote.append((method, body))
+            if limite is None:
+                limite = time.monotonic() + AUDIO_BATCH_WINDOW_S
+
+        # method is None → no llegó nada durante la ventana: vaciar lo acumulado
+        if lote and (method is None or len(lote) >= AUDIO_BATCH_SIZE or time.monotonic() >= limite):
+            procesar_lote(channel, lote)
+            lote = []
+            limite = None
+
+        if time.monotonic() >= proximo_vaciado:
+            vaciar_colas(channel)
+            proximo_vaciado = time.monotonic() + INTERVALO_VACIADO_S
+
 # --- ARRANQUE CON RETRY ---
 def iniciar_worker():
     RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'localhost')
@@ -93,13 +180,23 @@ def iniciar_worker():
             channel.queue_declare(queue=QUEUE_INPUT, durable=True)
             channel.queue_declare(queue=QUEUE_OUTPUT, durable=True)
 
-            channel.basic_qos(prefetch_count=1)
-            channel.basic_consume(queue=QUEUE_INPUT, on_message_callback=on_message)
+            channel.basic_qos(prefetch_count=max(1, AUDIO_BATCH_SIZE))
 
             retry_delay = 5
             print(f"[*] Worker Audio (Whisper + NLP) (Soft Evidence) iniciado.")
             print(f"    Consumiendo: '{QUEUE_INPUT}' → Publicando: '{QUEUE_OUTPUT}'")
-            channel.start_consuming()
+
+            if AUDIO_BATCH_SIZE > 1:
+                print(f"    Lotes de hasta {AUDIO_BATCH_SIZE} mensajes / {AUDIO_BATCH_WINDOW_S}s")
+                consumir_en_lotes(channel, QUEUE_INPUT)
+            else:
+                def vaciado_periodico():
+                    vaciar_colas(channel)
+                    connection.call_later(INTERVALO_VACIADO_S, vaciado_periodico)
+
+                connection.call_later(INTERVALO_VACIADO_S, vaciado_periodico)
+                channel.basic_consume(queue=QUEUE_INPUT, on_message_callback=on_message)
+                channel.start_consuming()
 
         except pika.exceptions.AMQPConnectionError:
             logger.warning(f"RabbitMQ no disponible. Reintentando en {retry_delay}s...")
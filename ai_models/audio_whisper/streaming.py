@@ -0,0 +1,198 @@
+"""
+streaming.py — Estado de transcripción entre chunks por sesión
+==============================================================
+Cada chunk de 15 s se transcribía aislado: las palabras que cruzan el
+borde entre chunks se cortaban y Whisper arrancaba sin contexto.
+
+Por `sesion_id` se guarda:
+  • prompt:            cola del texto ya transcrito (initial_prompt de Whisper).
+  • cola:              audio de voz que llegó al final del chunk anterior y
+                       que NO se transcribió todavía; se antepone al siguiente
+                       chunk. Así ese audio se decodifica una sola vez, entero.
+  • user_id, cola_desde: dueño de la cola y epoch (s) en que se retuvo.
+
+Backends (AUDIO_STREAMING_BACKEND en worker.py):
+  • memoria: LRU/TTL en el proceso (cache.CacheLRU), compartido por los
+    AUDIO_WORKERS consumidores (hilos) de supervisor.py. El siguiente chunk
+    de la sesión tiene que caer en el MISMO proceso: sirve con una sola
+    réplica del contenedor.
+  • redis:   hash por sesión con EXPIRE = TTL, compartido entre réplicas.
+
+Una cola que nadie reclama (la sesión no mandó otro chunk) no se pierde:
+colas_vencidas() la entrega para transcribirla sola (worker.vaciar_colas_pendientes).
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from cache import CacheLRU
+
+SAMPLE_RATE = 16000
+
+
+def separar_cola(segmentos: list[tuple[int, int]], total_muestras: int,
+                 max_cola_s: float = 3.0, margen_s: float = 0.3,
+                 rate: int = SAMPLE_RATE) -> tuple[list[tuple[int, int]], tuple[int, int] | None]:
+    """
+    Si el último segmento de voz toca el final del chunk (a menos de
+    `margen_s`), probablemente la frase sigue en el siguiente chunk: se separa
+    como cola para transcribirla junto con él.
+
+    Solo se separa si dura ≤ `max_cola_s` y si queda otro segmento por
+    transcribir ahora (un chunk nunca se queda sin transcripción por la cola).
+
+    Returns:
+        (segmentos a transcribir ahora, segmento de cola o None)
+    """
+    if len(segmentos) < 2:
+        return segmentos, None
+
+    inicio, fin = segmentos[-1]
+    if total_muestras - fin > margen_s * rate or fin - inicio > max_cola_s * rate:
+        return segmentos, None
+    return segmentos[:-1], (inicio, fin)
+
+
+class EstadosStreaming:
+    """Estado de streaming por sesión con expulsión LRU/TTL de sesiones inactivas."""
+
+    def __init__(self, max_sesiones: int = 5000, ttl_s: float = 120.0,
+                 max_prompt_chars: int = 200):
+        self.max_prompt_chars = max_prompt_chars
+        self._estados = CacheLRU(max_sesiones, ttl_s)
+        # Leer-modificar-guardar del estado: varios hilos consumidores
+        self._lock = threading.Lock()
+
+    def _estado(self, sesion_id: str) -> dict:
+        estado = self._estados.get(sesion_id)
+        if estado is None:
+            estado = {"prompt": "", "cola": None, "user_id": None, "cola_desde": 0.0,
+                      "ultima_actividad": 0.0}
+        estado["ultima_actividad"] = time.time()
+        return estado
+
+    def tomar_cola(self, sesion_id: str) -> np.ndarray | None:
+        """Retorna (y consume) el audio pendiente del chunk anterior."""
+        with self._lock:
+            estado = self._estado(sesion_id)
+            cola, estado["cola"] = estado["cola"], None
+            self._estados.set(sesion_id, estado)
+            return cola
+
+    def guardar_cola(self, sesion_id: str, cola: np.ndarray, user_id: str | None = None):
+        with self._lock:
+            estado = self._estado(sesion_id)
+            # Copia compacta: no retener el buffer completo del chunk
+            estado["cola"] = np.array(cola, dtype=np.float32)
+            estado["user_id"] = user_id
+            estado["cola_desde"] = time.time()
+            self._estados.set(sesion_id, estado)
+
+    def colas_vencidas(self, antiguedad_s: float) -> list[tuple[str, str | None, np.ndarray]]:
+        """
+        Retorna (y consume) las colas retenidas hace más de `antiguedad_s`:
+        lista de (sesion_id, user_id, cola).
+        """
+        limite = time.time() - antiguedad_s
+        vencidas = []
+        with self._lock:
+            for sesion_id, estado in self._estados.items():
+                if estado["cola"] is not None and estado["cola_desde"] <= limite:
+                    vencidas.append((sesion_id, estado["user_id"], estado["cola"]))
+                    estado["cola"] = None
+        return vencidas
+
+    def prompt(self, sesion_id: str) -> str | None:
+        return self._estado(sesion_id)["prompt"] or None
+
+    def registrar_texto(self, sesion_id: str, texto: str):
+        """Agrega la transcripción final al contexto (recortado) de la sesión."""
+        with self._lock:
+            estado = self._estado(sesion_id)
+            if texto:
+                estado["prompt"] = f"{estado['prompt']} {texto}".strip()[-self.max_prompt_chars:]
+            self._estados.set(sesion_id, estado)
+
+    def __len__(self):
+        return len(self._estados)
+
+
+class EstadosStreamingRedis:
+    """
+    Mismo estado en Redis, para varias réplicas del worker: hash por
+    sesión (prompt, cola float32, user_id) con EXPIRE = TTL y un sorted set
+    de colas pendientes por antigüedad. Tomar una cola es atómico (MULTI):
+    cada cola la consume un solo consumidor.
+    """
+
+    def __init__(self, cliente, ttl_s: float = 120.0, max_prompt_chars: int = 200,
+                 prefijo: str = "audio:streaming"):
+        self.cliente = cliente
+        self.ttl_s = ttl_s
+        self.max_prompt_chars = max_prompt_chars
+        self.prefijo = prefijo
+        self._pendientes = f"{prefijo}:pendientes"
+
+    def _clave(self, sesion_id: str) -> str:
+        return f"{self.prefijo}:{sesion_id}"
+
+    def _consumir(self, sesion_id: str):
+        """(cola, user_id, este proceso la consumió) en una transacción."""
+        pipe = self.cliente.pipeline(transaction=True)
+        pipe.hget(self._clave(sesion_id), "cola")
+        pipe.hget(self._clave(sesion_id), "user_id")
+        pipe.hdel(self._clave(sesion_id), "cola")
+        pipe.zrem(self._pendientes, sesion_id)
+        cola, user_id, _, removidos = pipe.execute()
+        if cola is None:
+            return None, None, False
+        user_id = user_id.decode() if user_id else None
+        return np.frombuffer(cola, dtype=np.float32).copy(), user_id, bool(removidos)
+
+    def tomar_cola(self, sesion_id: str) -> np.ndarray | None:
+        """Retorna (y consume) el audio pendiente del chunk anterior."""
+        return self._consumir(sesion_id)[0]
+
+    def guardar_cola(self, sesion_id: str, cola: np.ndarray, user_id: str | None = None):
+        pipe = self.cliente.pipeline(transaction=True)
+        pipe.hset(self._clave(sesion_id), mapping={
+            "cola": np.asarray(cola, dtype=np.float32).tobytes(), "user_id": user_id or "",
+        })
+        pipe.expire(self._clave(sesion_id), int(self.ttl_s))
+        pipe.zadd(self._pendientes, {sesion_id: time.time()})
+        pipe.execute()
+
+    def colas_vencidas(self, antiguedad_s: float) -> list[tuple[str, str | None, np.ndarray]]:
+        """Como EstadosStreaming.colas_vencidas(), entre todos los consumidores."""
+        candidatas = self.cliente.zrangebyscore(self._pendientes, 0, time.time() - antiguedad_s)
+        vencidas = []
+        for sesion_id in candidatas:
+            sesion_id = sesion_id.decode() if isinstance(sesion_id, bytes) else sesion_id
+            cola, user_id, consumida = self._consumir(sesion_id)
+            if cola is not None and consumida:
+                vencidas.append((sesion_id, user_id, cola))
+        return vencidas
+
+    def prompt(self, sesion_id: str) -> str | None:
+        prompt = self.cliente.hget(self._clave(sesion_id), "prompt")
+        return prompt.decode() if prompt else None
+
+    def registrar_texto(self, sesion_id: str, texto: str):
+        if not texto:
+            return
+        prompt = f"{self.prompt(sesion_id) or ''} {texto}".strip()[-self.max_prompt_chars:]
+        pipe = self.cliente.pipeline(transaction=True)
+        pipe.hset(self._clave(sesion_id), "prompt", prompt)
+        pipe.expire(self._clave(sesion_id), int(self.ttl_s))
+        pipe.execute()
+
+
+def crear_estados(backend: str, max_sesiones: int, ttl_s: float, cliente_redis=None):
+    """Backend de estado según AUDIO_STREAMING_BACKEND (Redis cae a memoria si no hay cliente)."""
+    if backend == "redis":
+        if cliente_redis is not None:
+            return EstadosStreamingRedis(cliente_redis, ttl_s)
+        print("⚠️ AUDIO_STREAMING_BACKEND=redis sin REDIS_HOST o sin paquete redis: estado en memoria.")
+    return EstadosStreaming(max_sesiones, ttl_s)
@@ -0,0 +1,129 @@
+"""
+supervisor.py — Varios consumidores de audio sobre un solo juego de modelos
+===========================================================================
+Un solo contenedor con AUDIO_WORKERS consumidores de q_audios, todos en
+ESTE proceso (un hilo por consumidor, cada uno con su conexión AMQP) y
+compartiendo los modelos, que se cargan una sola vez:
+
+  Whisper:  un único WhisperModel de CTranslate2 con num_workers =
+            AUDIO_WORKERS réplicas de cómputo (WHISPER_NUM_WORKERS). En CPU
+            las réplicas comparten los pesos; cada una usa cpu_threads =
+            AUDIO_THREADS_PER_WORKER. CTranslate2 suelta el GIL, así que N
+            hilos transcriben en paralelo sobre una copia de los pesos.
+  MiniLM:   una instancia (analyzer_semantic.analyzer_service) con el banco
+            de frases y su índice; torch suelta el GIL durante el forward.
+
+La RAM de los modelos no crece con AUDIO_WORKERS: solo crecen los buffers
+de las inferencias en curso. No hay fork: CTranslate2 arranca sus hilos
+al construir el modelo y un hijo forkeado con el modelo ya cargado queda
+colgado en su primera inferencia.
+
+  proceso:  fija hilos (variables de entorno) → importa main (carga los
+            modelos) → AUDIO_WORKERS hilos con main.iniciar_worker()
+
+Cada consumidor ya reconecta solo (main.iniciar_worker); si uno termina
+igual, se relanza (con backoff si se cae en bucle). SIGTERM/SIGINT
+terminan el proceso: los mensajes sin ack vuelven a la cola al cerrarse
+las conexiones.
+
+AUDIO_WORKERS=1 (default) corre el consumidor en el hilo principal.
+
+Ejecutar:  python supervisor.py
+"""
+
+import importlib
+import os
+import signal
+import threading
+import time
+
+
+def _nucleos_disponibles():
+    """Núcleos asignados al proceso (respeta cpusets/affinity del contenedor)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+AUDIO_WORKERS = max(1, int(os.environ.get("AUDIO_WORKERS", "1")))
+AUDIO_THREADS_PER_WORKER = int(os.environ.get(
+    "AUDIO_THREADS_PER_WORKER", str(max(1, _nucleos_disponibles() // AUDIO_WORKERS))
+))
+# Un consumidor que termina antes de esto se considera caído en bucle → backoff
+MIN_VIDA_S = 10
+MAX_BACKOFF = 60
+
+# ── Hilos: ANTES de importar los modelos ─────────────────────
+# CTranslate2 fija réplicas (num_workers) e hilos por réplica (cpu_threads)
+# al construir el modelo y OpenMP lee OMP_NUM_THREADS al iniciar.
+os.environ.setdefault("WHISPER_NUM_WORKERS", str(AUDIO_WORKERS))
+os.environ.setdefault("WHISPER_CPU_THREADS", str(AUDIO_THREADS_PER_WORKER))
+os.environ.setdefault("OMP_NUM_THREADS", str(AUDIO_THREADS_PER_WORKER))
+os.environ.setdefault("MKL_NUM_THREADS", str(AUDIO_THREADS_PER_WORKER))
+
+
+def _cargar_worker():
+    """Importa main (carga transcriber + analyzer_semantic) una sola vez en este proceso."""
+    try:
+        import torch
+        torch.set_num_threads(AUDIO_THREADS_PER_WORKER)
+    except ImportError:
+        pass
+    return importlib.import_module("main")
+
+
+def _lanzar_consumidor(main, slot):
+    """Hilo daemon que corre main.iniciar_worker() para `slot`."""
+    def correr():
+        try:
+            main.iniciar_worker()
+        except Exception as e:
+            print(f"❌ Consumidor {slot} terminó con error: {e}")
+
+    hilo = threading.Thread(target=correr, name=f"consumidor-{slot}", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def supervisar(main):
+    """Lanza AUDIO_WORKERS consumidores y relanza los que terminen hasta recibir SIGTERM/SIGINT."""
+    deteniendo = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: deteniendo.set())
+    signal.signal(signal.SIGINT, lambda *_: deteniendo.set())
+
+    hilos, inicios, backoff, relanzar_en = {}, {}, {}, {}
+    for slot in range(AUDIO_WORKERS):
+        hilos[slot] = _lanzar_consumidor(main, slot)
+        inicios[slot] = time.monotonic()
+
+    print(f"[*] Supervisor de audio: {AUDIO_WORKERS} consumidores sobre un modelo "
+          f"({AUDIO_WORKERS} réplicas × {AUDIO_THREADS_PER_WORKER} hilos).")
+
+    while not deteniendo.wait(1.0):
+        ahora = time.monotonic()
+        for slot, hilo in hilos.items():
+            if hilo.is_alive():
+                continue
+            if slot not in relanzar_en:
+                vida = ahora - inicios[slot]
+                espera = 0
+                if vida < MIN_VIDA_S:
+                    espera = backoff[slot] = min(max(1, backoff.get(slot, 0) * 2), MAX_BACKOFF)
+                else:
+                    backoff[slot] = 0
+                print(f"⚠️ Consumidor {slot} terminó tras {vida:.0f}s. Relanzando en {espera}s...")
+                relanzar_en[slot] = ahora + espera
+            if ahora >= relanzar_en[slot]:
+                del relanzar_en[slot]
+                hilos[slot] = _lanzar_consumidor(main, slot)
+                inicios[slot] = ahora
+
+    print("[*] Supervisor detenido.")
+
+
+if __name__ == "__main__":
+    if AUDIO_WORKERS == 1:
+        _cargar_worker().iniciar_worker()
+    else:
+        supervisar(_cargar_worker())
@@ -1,14 +1,34 @@
 """
 test.py — Tests unitarios para el Worker de Audio (Whisper + NLP)
 =================================================================
-Testea soft_evidence.normalizar_audio() sin necesidad de cargar
-Whisper ni SentenceTransformers.
+Testea soft_evidence.normalizar_audio(), la caché de scores (cache.py),
+los índices del banco de frases (indice_frases.py), el front end DSP
+(audiocleaner.py), el VAD por energía (vad.py) y el estado de streaming
+por sesión (streaming.py) sin necesidad de cargar Whisper ni
+SentenceTransformers. Las partes de worker.py / analyzer_semantic.py / main.py
+se prueban con modelos simulados (WhisperFalso, CodificadorFalso); las
+que importan worker.py necesitan además requests, y main.py pika y dotenv.
 
 Ejecutar:  python test.py
 """
 
+import hashlib
+import io
 import json
+import os
+import sys
+import tempfile
+import time
+import types
+import wave
 from soft_evidence import normalizar_audio
+import numpy as np
+from cache import CacheLRU, normalizar_texto
+from indice_frases import IndiceExacto, IndiceIVF
+from vad import _vad_energia, extraer_voz
+import audiocleaner
+from audiocleaner import FrontEndVoz, aplicar_filtro_voz, analizar_senal, es_silencio
+from streaming import EstadosStreaming, EstadosStreamingRedis, separar_cola
 
 # ====================================================================
 # CONSTANTES
@@ -110,6 +130,507 @@ d_high_t = normalizar_audio(False, 0.8, 0.2, temperatura=3.0)
 assert max(d_low_t.values()) > max(d_high_t.values()), \
     "T baja debería producir distribución más puntiaguda que T alta"
 
+# ====================================================================
+# TESTS: cache.py
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: cache.normalizar_texto() / CacheLRU")
+print("=" * 60)
+
+assert normalizar_texto("¡Ya voy, Mamá!") == "ya voy mama"
+assert normalizar_texto("  Cierra   la PUERTA... ") == "cierra la puerta"
+assert normalizar_texto("¿Espera?") == normalizar_texto("espera")
+
+c = CacheLRU(max_items=2, ttl_s=60)
+c.set("a", (0.1, 0.2))
+c.set("b", (0.3, 0.4))
+assert c.get("a") == (0.1, 0.2)
+c.set("c", (0.5, 0.6))               # expulsa "b" (menos reciente)
+assert c.get("b") is None, "LRU debería expulsar la entrada menos usada"
+assert c.get("c") == (0.5, 0.6)
+assert (c.hits, c.misses) == (2, 1), f"Contadores: {(c.hits, c.misses)}"
+
+c = CacheLRU(max_items=10, ttl_s=0.01)
+c.set("a", (0.1, 0.2))
+time.sleep(0.02)
+assert c.get("a") is None, "TTL debería expirar la entrada"
+print("✅ Caché LRU/TTL y normalización de texto")
+
+# ====================================================================
+# TESTS: indice_frases.py
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: indice_frases.IndiceExacto / IndiceIVF")
+print("=" * 60)
+
+rng = np.random.default_rng(0)
+banco = rng.standard_normal((500, 32)).astype(np.float32)
+banco /= np.linalg.norm(banco, axis=1, keepdims=True)
+consultas = banco[:20] + 0.1 * rng.standard_normal((20, 32)).astype(np.float32)
+consultas /= np.linalg.norm(consultas, axis=1, keepdims=True)
+fuerza_bruta = consultas @ banco.T
+
+# Bloques chicos para forzar la fusión de top-k entre bloques
+s, i = IndiceExacto(banco, bloque=64).buscar(consultas, k=3)
+assert np.allclose(s[:, 0], fuerza_bruta.max(axis=1)), "Exacto: max distinto a fuerza bruta"
+assert np.array_equal(i[:, 0], fuerza_bruta.argmax(axis=1)), "Exacto: argmax distinto"
+assert np.all(np.diff(s, axis=1) <= 0), "Exacto: top-k no está ordenado"
+
+# Revisando todas las listas, el IVF debe coincidir con la búsqueda exacta
+ivf = IndiceIVF(banco, nlist=16, nprobe=16)
+s_ivf, i_ivf = ivf.buscar(consultas, k=1)
+assert np.array_equal(i_ivf[:, 0], fuerza_bruta.argmax(axis=1)), "IVF (nprobe=nlist) distinto a exacto"
+assert np.allclose(s_ivf[:, 0], fuerza_bruta.max(axis=1))
+
+# Caché en disco: el segundo arranque mapea centroides y listas sin k-means;
+# otra llave (banco distinto) reconstruye
+with tempfile.TemporaryDirectory() as dir_ivf:
+    ruta_ivf = os.path.join(dir_ivf, "banco_ivf_trampa")
+    ivf = IndiceIVF(banco, nlist=16, nprobe=4, ruta_cache=ruta_ivf, llave="h1")
+    kmeans_original, llamadas_kmeans = IndiceIVF._kmeans, []
+    IndiceIVF._kmeans = lambda self, *a: llamadas_kmeans.append(1) or kmeans_original(self, *a)
+    try:
+        ivf_cache = IndiceIVF(banco, nlist=16, nprobe=4, ruta_cache=ruta_ivf, llave="h1")
+        assert not llamadas_kmeans, "IVF: con caché válida no debe correr k-means"
+        assert isinstance(ivf_cache.centroides, np.memmap), "IVF: la caché debe mapearse con mmap"
+        assert all(np.array_equal(a, b) for a, b in zip(ivf.buscar(consultas, k=3), ivf_cache.buscar(consultas, k=3)))
+        IndiceIVF(banco, nlist=16, nprobe=4, ruta_cache=ruta_ivf, llave="h2")
+        assert len(llamadas_kmeans) == 1, "IVF: otra llave debe reconstruir el índice"
+    finally:
+        IndiceIVF._kmeans = kmeans_original
+
+s_vacio, _ = IndiceExacto(banco[:0]).buscar(consultas, k=1)
+assert s_vacio.shape == (20, 0), "Banco vacío debería devolver 0 columnas"
+print("✅ Índice exacto por bloques e IVF")
+
+# ====================================================================
+# TESTS: vad.py (VAD de respaldo por energía)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: vad._vad_energia / extraer_voz")
+print("=" * 60)
+
+sr = 16000
+ruido = (0.003 * rng.standard_normal(sr * 15)).astype(np.float32)
+assert _vad_energia(ruido) == [], "Ruido de fondo constante no debería ser voz"
+
+con_voz = ruido.copy()
+t = np.arange(sr * 2) / sr
+con_voz[sr * 5:sr * 7] += (0.2 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+segmentos = _vad_energia(con_voz)
+assert len(segmentos) == 1, f"Se esperaba 1 segmento de voz: {segmentos}"
+inicio, fin = segmentos[0]
+assert abs(inicio - sr * 5) < sr * 0.05 and abs(fin - sr * 7) < sr * 0.05, f"Segmento: {segmentos}"
+assert len(extraer_voz(con_voz, segmentos)) == fin - inicio
+print("✅ VAD por energía")
+
+# ====================================================================
+# TESTS: audiocleaner.py (front end DSP por bloques)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: audiocleaner.FrontEndVoz")
+print("=" * 60)
+
+frontend = FrontEndVoz(capacidad=1000)       # fuerza varias realocaciones
+for inicio in range(0, len(con_voz), 960):   # bloques de 60 ms, como el decoder
+    frontend.procesar(con_voz[inicio:inicio + 960])
+entero = aplicar_filtro_voz(con_voz)
+assert entero.dtype == np.float32 and frontend.filtrado.dtype == np.float32
+assert np.allclose(frontend.filtrado, entero, atol=1e-6), "Filtrar por bloques ≠ filtrar entero"
+rms = np.sqrt(np.mean(con_voz.astype(np.float64) ** 2))
+assert abs(frontend.rms - rms) < 1e-6 * max(rms, 1)
+assert frontend.metricas()["peak"] == float(np.max(np.abs(con_voz)))
+assert frontend.es_silencio(-45) == es_silencio(con_voz, -45) == False
+assert analizar_senal(np.zeros(sr, dtype=np.float32)).es_silencio(-45)
+# 220 Hz cae fuera de la banda 300-3400 Hz; 1 kHz cae dentro
+tono = lambda f: (0.2 * np.sin(2 * np.pi * f * np.arange(sr) / sr)).astype(np.float32)  # noqa: E731
+assert analizar_senal(tono(1000)).metricas()["ratio_voz"] > 0.8
+assert analizar_senal(tono(100)).metricas()["ratio_voz"] < 0.1
+solo_nivel = FrontEndVoz(filtrar=False)
+solo_nivel.procesar(con_voz)
+assert abs(solo_nivel.rms - frontend.rms) < 1e-6 and solo_nivel.metricas()["energia_voz"] is None
+print("✅ Filtro SOS por bloques y métricas en una pasada")
+
+if audiocleaner.av is not None:
+    def wav_bytes(audio):
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(sr)
+            w.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+        return buffer.getvalue()
+
+    class Goteo:
+        """Stream no rebobinable que entrega pocos bytes por read() (como HTTP)."""
+        def __init__(self, datos):
+            self.datos, self.pos = datos, 0
+        def read(self, n=-1):
+            n = len(self.datos) - self.pos if n is None or n < 0 else min(n, 4096)
+            trozo = self.datos[self.pos:self.pos + n]
+            self.pos += len(trozo)
+            return trozo
+
+    lectores = []
+    LectorOriginal = audiocleaner.LectorConCopia
+    audiocleaner.LectorConCopia = lambda fuente: lectores.append(LectorOriginal(fuente)) or lectores[-1]
+    try:
+        audio, detenido = audiocleaner.decodificar_stream(Goteo(wav_bytes(con_voz)), FrontEndVoz(filtrar=False))
+    finally:
+        audiocleaner.LectorConCopia = LectorOriginal
+    assert not detenido and abs(len(audio) - len(con_voz)) < sr // 100
+    assert np.allclose(audio[:len(con_voz)], con_voz, atol=1e-3)
+    assert not lectores[0].copiando, "La copia comprimida se suelta al primer bloque decodificado"
+
+    # Mientras copia, resto() devuelve el archivo entero para FFmpeg
+    lector = audiocleaner.LectorConCopia(Goteo(b"x" * 10000))
+    lector.read(100)
+    assert lector.resto() == b"x" * 10000
+
+    # Parada temprana: el chunk es silencio en sus primeros 2 s
+    goteo = Goteo(wav_bytes(np.concatenate([np.zeros(sr * 3, np.float32), con_voz])))
+    audio, detenido = audiocleaner.decodificar_stream(
+        goteo, FrontEndVoz(filtrar=False), lambda f: f.muestras >= 2 * sr and f.es_silencio(-45)
+    )
+    assert detenido and len(audio) < sr * 3 and goteo.pos < len(goteo.datos) / 2
+    print("✅ Decodificación en streaming con parada temprana")
+
+# ====================================================================
+# TESTS: streaming.py
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: streaming.separar_cola / EstadosStreaming")
+print("=" * 60)
+
+total_muestras = sr * 15
+# El último segmento toca el final del chunk → se separa como cola
+ahora, cola = separar_cola([(0, sr * 3), (sr * 13, total_muestras)], total_muestras)
+assert ahora == [(0, sr * 3)] and cola == (sr * 13, total_muestras), f"{ahora} / {cola}"
+# El último segmento termina lejos del final → no hay cola
+ahora, cola = separar_cola([(0, sr * 3), (sr * 8, sr * 10)], total_muestras)
+assert cola is None and len(ahora) == 2
+# Un único segmento nunca se difiere (el chunk se quedaría sin transcripción)
+ahora, cola = separar_cola([(sr * 13, total_muestras)], total_muestras)
+assert cola is None
+# Un segmento largo en el borde no se difiere
+ahora, cola = separar_cola([(0, sr), (sr * 5, total_muestras)], total_muestras)
+assert cola is None
+
+estados = EstadosStreaming(max_sesiones=2, ttl_s=60, max_prompt_chars=20)
+estados.guardar_cola("s1", np.ones(100, dtype=np.float32))
+assert len(estados.tomar_cola("s1")) == 100
+assert estados.tomar_cola("s1") is None, "La cola se consume al tomarla"
+estados.registrar_texto("s1", "hola profesor buenos días")
+estados.registrar_texto("s1", "ya voy")
+prompt = estados.prompt("s1")
+assert prompt.endswith("días ya voy") and len(prompt) <= 20, f"Prompt: {prompt!r}"
+estados.registrar_texto("s2", "a")
+estados.registrar_texto("s3", "b")          # expulsa la sesión menos reciente
+assert len(estados) == 2
+print("✅ Estado de streaming por sesión")
+
+# Cola sin chunk siguiente: colas_vencidas() la entrega (con su user_id) una sola vez
+estados.guardar_cola("s3", np.ones(50, dtype=np.float32), user_id="u3")
+assert estados.colas_vencidas(60) == []
+vencidas = estados.colas_vencidas(0)
+assert [(s, u, len(c)) for s, u, c in vencidas] == [("s3", "u3", 50)], vencidas
+assert estados.colas_vencidas(0) == [] and estados.tomar_cola("s3") is None
+print("✅ Colas retenidas vencidas")
+
+
+class RedisEnMemoria:
+    """Subconjunto de redis-py que usa EstadosStreamingRedis (hashes + sorted set)."""
+
+    def __init__(self):
+        self.hashes, self.zsets = {}, {}
+
+    def pipeline(self, transaction=True):
+        return PipelineEnMemoria(self)
+
+    def hget(self, clave, campo):
+        valor = self.hashes.get(clave, {}).get(campo)
+        return valor.encode() if isinstance(valor, str) else valor
+
+    def hset(self, clave, campo=None, valor=None, mapping=None):
+        self.hashes.setdefault(clave, {}).update(mapping or {campo: valor})
+
+    def hdel(self, clave, campo):
+        return int(self.hashes.get(clave, {}).pop(campo, None) is not None)
+
+    def expire(self, clave, segundos):
+        return True
+
+    def zadd(self, clave, miembros):
+        self.zsets.setdefault(clave, {}).update(miembros)
+
+    def zrem(self, clave, miembro):
+        return int(self.zsets.get(clave, {}).pop(miembro, None) is not None)
+
+    def zrangebyscore(self, clave, minimo, maximo):
+        return [m.encode() for m, p in self.zsets.get(clave, {}).items() if minimo <= p <= maximo]
+
+
+class PipelineEnMemoria:
+    def __init__(self, cliente):
+        self.cliente, self.operaciones = cliente, []
+
+    def __getattr__(self, nombre):
+        return lambda *a, **kw: self.operaciones.append((nombre, a, kw))
+
+    def execute(self):
+        return [getattr(self.cliente, n)(*a, **kw) for n, a, kw in self.operaciones]
+
+
+# Dos consumidores de q_audios comparten el estado: la cola que guarda uno la toma el otro
+cliente = RedisEnMemoria()
+consumidor_a = EstadosStreamingRedis(cliente, ttl_s=60, max_prompt_chars=20)
+consumidor_b = EstadosStreamingRedis(cliente, ttl_s=60, max_prompt_chars=20)
+consumidor_a.guardar_cola("s1", np.arange(10, dtype=np.float32), user_id="u1")
+assert np.array_equal(consumidor_b.tomar_cola("s1"), np.arange(10, dtype=np.float32))
+assert consumidor_a.tomar_cola("s1") is None and consumidor_a.colas_vencidas(0) == []
+consumidor_a.registrar_texto("s1", "hola profesor buenos días")
+consumidor_b.registrar_texto("s1", "ya voy")
+assert consumidor_a.prompt("s1") == "profesor buenos días ya voy"[-20:]
+consumidor_b.guardar_cola("s2", np.ones(5, dtype=np.float32), user_id="u2")
+vencidas = consumidor_a.colas_vencidas(0)
+assert [(s, u, len(c)) for s, u, c in vencidas] == [("s2", "u2", 5)], vencidas
+assert consumidor_b.colas_vencidas(0) == [], "Cada cola vencida la vacía un solo consumidor"
+print("✅ Estado de streaming compartido en Redis")
+
+# ====================================================================
+# TESTS: pipeline con modelos simulados (analyzer_semantic.py / worker.py / main.py)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: pipeline con Whisper y SentenceTransformer simulados")
+print("=" * 60)
+
+
+class WhisperFalso:
+    """faster_whisper.WhisperModel de prueba: no carga pesos."""
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class CodificadorFalso:
+    """
+    SentenceTransformer de prueba: bolsa de trigramas de caracteres → vector
+    normalizado. Textos parecidos dan vectores parecidos y el resultado es
+    determinista. Registra los textos codificados.
+    """
+    DIMENSION = 64
+
+    def __init__(self, *args, **kwargs):
+        self.codificados = []
+
+    def get_sentence_embedding_dimension(self):
+        return self.DIMENSION
+
+    def encode(self, textos, convert_to_numpy=True, normalize_embeddings=True):
+        self.codificados.extend(textos)
+        vectores = np.zeros((len(textos), self.DIMENSION), dtype=np.float32)
+        for i, texto in enumerate(textos):
+            texto = f"  {normalizar_texto(texto)} "
+            for j in range(len(texto) - 2):
+                digest = hashlib.md5(texto[j:j + 3].encode("utf-8")).digest()
+                vectores[i, digest[0] % self.DIMENSION] += 1.0
+        return vectores / np.maximum(np.linalg.norm(vectores, axis=1, keepdims=True), 1e-12)
+
+
+sys.modules["faster_whisper"] = types.SimpleNamespace(
+    WhisperModel=WhisperFalso, BatchedInferencePipeline=lambda model: model,
+)
+sys.modules["sentence_transformers"] = types.SimpleNamespace(SentenceTransformer=CodificadorFalso)
+# La caché de embeddings del banco no se escribe en la carpeta del worker
+os.environ["EMBEDDINGS_CACHE_DIR"] = tempfile.mkdtemp(prefix="banco_test_")
+
+import analyzer_semantic
+from cache import CacheScores
+
+analizador = analyzer_semantic.analyzer_service
+
+
+def cache_vacia():
+    return CacheScores(namespace="test", max_items=100, ttl_s=60)
+
+
+# analizar_batch() = analizar() texto a texto (un solo encode para todo el lote)
+textos = [
+    analizador.frases_trampa[0], "¡Ya voy, mamá!", "ya voy mama", "hola", "", None,
+    analizador.frases_domesticas[0], "me pasas la respuesta de la tres", analizador.frases_trampa[0],
+]
+analizador.cache = cache_vacia()
+individuales = [analizador.analizar(t) for t in textos]
+analizador.cache = cache_vacia()
+analizador.model.codificados.clear()
+en_lote = analizador.analizar_batch(textos)
+assert en_lote == individuales, (en_lote, individuales)
+assert len(analizador.model.codificados) == 4, "Un encode por transcripción normalizada distinta"
+assert en_lote[0]["category"] == "SOSPECHOSO" and en_lote[6]["category"] == "DOMESTICO"
+assert en_lote[3]["category"] == en_lote[4]["category"] == en_lote[5]["category"] == "NEUTRAL"
+print("✅ analizar_batch() igual a analizar() texto a texto")
+
+
+# Caché en disco del banco de frases (_cargar_banco): carpeta temporal propia
+def dataset(ruta, trampa, domesticas, indent=None):
+    items = [{"text": t, "label": "SOSPECHOSO"} for t in trampa]
+    items += [{"text": t, "label": "DOMESTICO"} for t in domesticas]
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump({"dataset": items}, f, ensure_ascii=False, indent=indent)
+
+
+def construir(ruta):
+    """SemanticAnalyzer sobre `ruta` → (analizador, textos que codificó para el banco)."""
+    nuevo = analyzer_semantic.SemanticAnalyzer(dataset_path=ruta)
+    return nuevo, list(nuevo.model.codificados)
+
+
+cache_real = analyzer_semantic.EMBEDDINGS_CACHE_DIR
+modelo_real = analyzer_semantic.MODEL_NAME
+try:
+    carpeta = tempfile.mkdtemp(prefix="banco_cache_")
+    analyzer_semantic.EMBEDDINGS_CACHE_DIR = carpeta
+    ruta = os.path.join(carpeta, "frases.json")
+    trampa, domesticas = ["pasame la respuesta", "busca en google"], ["cierra la puerta", "baja la musica"]
+    dataset(ruta, trampa, domesticas)
+
+    a, codificados = construir(ruta)
+    assert codificados == trampa + domesticas, codificados
+    # Mismo archivo y mismo modelo → banco desde el .npy, sin correr el modelo
+    b, codificados = construir(ruta)
+    assert codificados == [] and np.array_equal(a.banco, b.banco)
+
+    # Mismas frases con otro hash de archivo (reformateado) → nada que codificar, meta al día
+    dataset(ruta, trampa, domesticas, indent=2)
+    _, codificados = construir(ruta)
+    with open(analyzer_semantic._rutas_cache(modelo_real)[1], encoding="utf-8") as f:
+        meta = json.load(f)
+    assert codificados == [] and meta["file_hash"] == analyzer_semantic._hash_banco(ruta, None)
+
+    # Frases nuevas → solo se codifican esas; el banco es el mismo que desde cero
+    dataset(ruta, trampa + ["dime la cuatro"], ["ya voy"] + domesticas)
+    c, codificados = construir(ruta)
+    assert codificados == ["dime la cuatro", "ya voy"], codificados
+    desde_cero = CodificadorFalso().encode(c.frases_trampa + c.frases_domesticas)
+    assert np.allclose(c.banco, desde_cero) and c.n_trampa == 3
+
+    # Otro modelo → su propia caché; todo se vuelve a codificar
+    analyzer_semantic.MODEL_NAME = "otro/modelo"
+    _, codificados = construir(ruta)
+    assert len(codificados) == 6
+    analyzer_semantic.MODEL_NAME = modelo_real
+
+    # Meta de otro modelo en la ruta del actual (p. ej. escrita a mano) → se descarta
+    ruta_meta = analyzer_semantic._rutas_cache(modelo_real)[1]
+    with open(ruta_meta, encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["model"] = "otro/modelo"
+    with open(ruta_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    _, codificados = construir(ruta)
+    assert len(codificados) == 6
+finally:
+    analyzer_semantic.EMBEDDINGS_CACHE_DIR = cache_real
+    analyzer_semantic.MODEL_NAME = modelo_real
+print("✅ Caché del banco: se invalida por modelo y por archivo, y solo codifica frases nuevas")
+
+# Con AUDIO_STREAMING los chunks traen prompt: igual se decodifican en lote
+import transcriber
+
+
+class ModeloContador:
+    """WhisperModel/BatchedInferencePipeline de prueba: registra las llamadas a transcribe()."""
+    def __init__(self):
+        self.en_lote, self.sueltos = [], []
+
+    def transcribe(self, audio, clip_timestamps=None, initial_prompt=None, **kwargs):
+        if clip_timestamps is not None:
+            self.en_lote.append(len(clip_timestamps))
+            return iter([types.SimpleNamespace(start=c["start"] + 1, end=c["start"] + 2, text=f"v{k}", avg_logprob=-0.1)
+                         for k, c in enumerate(clip_timestamps)]), None
+        self.sueltos.append(initial_prompt)
+        return iter([types.SimpleNamespace(start=0, end=1, text="suelto", avg_logprob=-0.2)]), None
+
+
+contador = ModeloContador()
+voz = [np.ones(sr * 15, dtype=np.float32)] * 3
+resultados = transcriber._transcribir_lote(contador, contador, voz, beam_size=1, prompts=["a", "b", None])
+assert contador.en_lote == [3] and contador.sueltos == [], (contador.en_lote, contador.sueltos)
+assert [texto for texto, _ in resultados] == ["v0", "v1", "v2"]
+# Un solo chunk con voz se decodifica solo, con su prompt
+transcriber._transcribir_lote(contador, contador, voz[:1], beam_size=1, prompts=["contexto"])
+assert contador.sueltos == ["contexto"]
+print("✅ Chunks con prompt de sesión: en lote (sin prompt) salvo si van solos")
+
+try:
+    import worker
+except ImportError as e:
+    worker = None
+    print(f"⏭️  worker.py omitido ({e})")
+
+if worker is not None:
+    umbral, banda = worker.UMBRAL_ALERTA, worker.WHISPER_CASCADE_BAND
+    confiable = worker.WHISPER_CASCADE_MIN_LOGPROB + 0.5
+
+    def rapido(trampa, domestico, confianza=confiable):
+        return {"stt_confidence": confianza,
+                "analisis": {"raw_score_trampa": trampa, "raw_score_domestico": domestico}}
+
+    assert worker._requiere_modelo_completo({"stt_confidence": confiable}), "Voz sin texto útil"
+    assert worker._requiere_modelo_completo(rapido(0.1, 0.1, worker.WHISPER_CASCADE_MIN_LOGPROB - 0.1))
+    assert not worker._requiere_modelo_completo(rapido(umbral + banda + 0.05, 0.1)), "Trampa clara"
+    assert not worker._requiere_modelo_completo(rapido(0.1, umbral - banda - 0.05)), "Nada cerca del umbral"
+    assert worker._requiere_modelo_completo(rapido(umbral + banda / 2, 0.1)), "Trampa en la banda"
+    assert worker._requiere_modelo_completo(rapido(0.1, umbral - banda / 2)), "Doméstico en la banda"
+    print("✅ Cascada: qué resultados del modelo rápido se re-transcriben")
+
+try:
+    import main
+except ImportError as e:
+    main = None
+    print(f"⏭️  main.py omitido ({e})")
+
+if main is not None:
+    class CanalFalso:
+        def __init__(self):
+            self.acks, self.nacks, self.publicados = [], [], []
+        def basic_ack(self, delivery_tag):
+            self.acks.append(delivery_tag)
+        def basic_nack(self, delivery_tag, requeue=True):
+            self.nacks.append(delivery_tag)
+        def basic_publish(self, exchange, routing_key, body, properties=None):
+            self.publicados.append(json.loads(body))
+
+    def mensaje(tag, url):
+        metodo = types.SimpleNamespace(delivery_tag=tag)
+        return metodo, json.dumps({"user_id": f"u{tag}", "sesion_id": "s", "url_storage": url})
+
+    def audio_individual(user_id, sesion_id, url_storage):
+        if url_storage == "roto":
+            raise RuntimeError("audio corrupto")
+        return {"user_id": user_id} if url_storage == "voz" else None
+
+    def lote_roto(mensajes):
+        raise RuntimeError("falla del lote")
+
+    procesar_audio_real, procesar_lote_audio_real = main.procesar_audio, main.procesar_lote_audio
+    try:
+        main.procesar_audio, main.procesar_lote_audio = audio_individual, lote_roto
+        canal = CanalFalso()
+        lote = [mensaje(1, "voz"), mensaje(2, "roto"), mensaje(3, "silencio"),
+                (types.SimpleNamespace(delivery_tag=4), b"{no es json")]
+        main.procesar_lote(canal, lote)
+        assert canal.acks == [1, 3] and sorted(canal.nacks) == [2, 4], (canal.acks, canal.nacks)
+        assert canal.publicados == [{"user_id": "u1"}]
+
+        # Sin falla: un ack por mensaje y un evento por chunk que lo produjo
+        main.procesar_lote_audio = lambda mensajes: [{"user_id": u} if u != "u2" else None for u, _, _ in mensajes]
+        canal = CanalFalso()
+        main.procesar_lote(canal, [mensaje(1, "a"), mensaje(2, "b")])
+        assert canal.acks == [1, 2] and canal.nacks == [] and canal.publicados == [{"user_id": "u1"}]
+    finally:
+        main.procesar_audio, main.procesar_lote_audio = procesar_audio_real, procesar_lote_audio_real
+    print("✅ procesar_lote(): si falla el lote, ack/nack mensaje a mensaje")
+
 print(f"\n{'=' * 60}")
 print(f"Resultado: {passed}/{total} tests pasaron")
 if passed == total:
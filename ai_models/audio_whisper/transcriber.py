@@ -1,36 +1,199 @@
-from faster_whisper import WhisperModel
+from faster_whisper import WhisperModel, BatchedInferencePipeline
+import numpy as np
 import os
+import threading
 
 # Configuración: 'tiny' es súper rápido. 'base' es más preciso.
 # Int8 = True hace que ocupe menos RAM.
-MODEL_SIZE = "medium" 
+MODEL_SIZE = "medium"
+
+# Cascada: todo chunk pasa primero por un modelo chico (greedy) y solo los
+# dudosos se re-transcriben con MODEL_SIZE (ver worker.py).
+WHISPER_CASCADE = os.environ.get("WHISPER_CASCADE", "0") == "1"
+FAST_MODEL_SIZE = os.environ.get("WHISPER_FAST_MODEL", "base")
+
+# Whisper decodifica ventanas fijas de 30 s a 16 kHz.
+SAMPLE_RATE = 16000
+VENTANA_S = 30
+# Ventanas que el pipeline por lotes decodifica juntas en un forward.
+WHISPER_BATCH_SIZE = int(os.environ.get("WHISPER_BATCH_SIZE", "8"))
+# Hilos intra-op de CTranslate2 por réplica (0 = default de CTranslate2).
+# supervisor.py lo fija para que réplicas × hilos = núcleos.
+WHISPER_CPU_THREADS = int(os.environ.get("WHISPER_CPU_THREADS", "0"))
+# Réplicas de cómputo del MISMO modelo (num_workers de CTranslate2): en CPU
+# comparten los pesos y permiten transcribir desde varios hilos en paralelo.
+# supervisor.py lo fija a AUDIO_WORKERS (un consumidor por réplica).
+WHISPER_NUM_WORKERS = int(os.environ.get("WHISPER_NUM_WORKERS", "1"))
 
 print(f"⏳ Cargando modelo Whisper ({MODEL_SIZE})...")
 try:
     # run_opts={"device": "cpu"} fuerza el uso de CPU
-    model = WhisperModel(MODEL_SIZE, device="cpu", compute_type="int8")
+    model = WhisperModel(MODEL_SIZE, device="cpu", compute_type="int8",
+                         cpu_threads=WHISPER_CPU_THREADS, num_workers=WHISPER_NUM_WORKERS)
+    # Reutiliza los mismos pesos: no duplica el modelo en memoria
+    batched_model = BatchedInferencePipeline(model=model)
     print("✅ Modelo de Audio cargado en memoria.")
 except Exception as e:
     print(f"❌ Error cargando modelo: {e}")
     model = None
+    batched_model = None
 
-def transcribir_audio(audio_numpy):
-    if model is None: return ""
+fast_model = None
+fast_batched_model = None
+if WHISPER_CASCADE:
+    print(f"⏳ Cargando modelo Whisper rápido ({FAST_MODEL_SIZE}) para la cascada...")
+    try:
+        fast_model = WhisperModel(FAST_MODEL_SIZE, device="cpu", compute_type="int8",
+                                  cpu_threads=WHISPER_CPU_THREADS, num_workers=WHISPER_NUM_WORKERS)
+        fast_batched_model = BatchedInferencePipeline(model=fast_model)
+        print("✅ Modelo rápido cargado en memoria.")
+    except Exception as e:
+        print(f"❌ Error cargando modelo rápido, se usará solo {MODEL_SIZE}: {e}")
+        fast_model = None
+        fast_batched_model = None
+
+# Un BatchedInferencePipeline por hilo consumidor (supervisor.py): el objeto
+# no está documentado como thread-safe y crearlo es barato; los pesos son
+# los del modelo compartido.
+_pipelines = threading.local()
+
+def _pipeline_del_hilo(modelo, pipeline):
+    """BatchedInferencePipeline de este hilo sobre `modelo` (None si el pipeline no cargó)."""
+    if pipeline is None:
+        return None
+    propios = _pipelines.__dict__.setdefault("por_modelo", {})
+    if id(modelo) not in propios:
+        propios[id(modelo)] = BatchedInferencePipeline(model=modelo)
+    return propios[id(modelo)]
+
+def _unir_segmentos(segments):
+    """
+    Une los segmentos en un texto y calcula la confianza de la transcripción:
+    avg_logprob promedio ponderado por la duración de cada segmento
+    (0.0 = certeza total; valores muy negativos = poca confianza).
+    """
+    texto_completo = ""
+    suma_logprob = 0.0
+    duracion = 0.0
+    for segment in segments:
+        texto_completo += segment.text + " "
+        peso = max(segment.end - segment.start, 1e-3)
+        suma_logprob += segment.avg_logprob * peso
+        duracion += peso
+
+    confianza = suma_logprob / duracion if duracion else float("-inf")
+    return texto_completo.strip(), confianza
+
+def _transcribir(modelo, audio_numpy, beam_size, prompt=None):
+    """
+    Transcribe un chunk → (texto, confianza). Nunca lanza: ("", -inf) si falla.
+    `prompt` (texto previo de la sesión) condiciona la decodificación.
+    """
+    if modelo is None: return "", float("-inf")
     try:
         # vad_filter=True es VITAL. Ignora partes donde no hay voz humana clara.
         # min_silence_duration_ms: Ignora ruidos cortos (golpes, clicks)
-        segments, info = model.transcribe(
-            audio_numpy, 
-            beam_size=5, 
-            language="es", 
+        segments, info = modelo.transcribe(
+            audio_numpy,
+            beam_size=beam_size,
+            language="es",
             vad_filter=True,
-            vad_parameters=dict(min_silence_duration_ms=500)
+            vad_parameters=dict(min_silence_duration_ms=500),
+            initial_prompt=prompt,
         )
-        texto_completo = ""
-        for segment in segments:
-            texto_completo += segment.text + " "
-            
-        return texto_completo.strip()
+        return _unir_segmentos(segments)
     except Exception as e:
         print(f"Error transcribiendo: {e}")
-        return ""
\ No newline at end of file
+        return "", float("-inf")
+
+def transcribir_audio(audio_numpy):
+    return _transcribir(model, audio_numpy, beam_size=5)[0]
+
+def _transcribir_ventanas(pipeline, audios, beam_size):
+    """
+    Transcribe varios chunks (≤ 30 s c/u) en una sola pasada del pipeline
+    por lotes. Cada chunk se coloca en su propia ventana de 30 s y se marca
+    con clip_timestamps, así el pipeline nunca fusiona audio de sesiones
+    distintas y cada segmento se puede devolver a su chunk de origen.
+    """
+    muestras_ventana = VENTANA_S * SAMPLE_RATE
+    buffer = np.zeros(len(audios) * muestras_ventana, dtype=np.float32)
+    clips = []
+
+    for k, audio in enumerate(audios):
+        inicio = k * muestras_ventana
+        buffer[inicio:inicio + len(audio)] = audio
+        # Whisper rellena a 30 s de todas formas: la ventana completa no cuesta más
+        clips.append({"start": k * VENTANA_S, "end": (k + 1) * VENTANA_S})
+
+    segments, info = pipeline.transcribe(
+        buffer,
+        beam_size=beam_size,
+        language="es",
+        batch_size=WHISPER_BATCH_SIZE,
+        vad_filter=False,
+        clip_timestamps=clips,
+    )
+
+    por_ventana = [[] for _ in audios]
+    for segment in segments:
+        # +10 ms evita que un start de 29.999 caiga en la ventana anterior
+        k = min(int((segment.start + 0.01) // VENTANA_S), len(audios) - 1)
+        por_ventana[k].append(segment)
+
+    return [_unir_segmentos(segs) for segs in por_ventana]
+
+def _transcribir_lote(modelo, pipeline, audios, beam_size, prompts=None):
+    """
+    Transcribe varios chunks de audio (de distintas sesiones) juntos.
+
+    Los chunks de hasta 30 s se decodifican en lote; los más largos, o todo
+    el lote si el pipeline falla, caen a _transcribir() uno por uno.
+
+    Gana el lote sobre el prompt de sesión (AUDIO_STREAMING): el pipeline
+    admite un solo initial_prompt para todo el lote, así que los chunks que
+    van en lote se decodifican SIN prompt. El prompt solo se usa cuando un
+    chunk se decodifica solo (único chunk con voz del lote, o > 30 s). La
+    voz del borde retenida (streaming.py) ya viene antepuesta al audio, así
+    que las palabras entre chunks no se cortan igual.
+
+    Returns:
+        Lista de (texto, confianza) alineada con `audios`.
+    """
+    resultados = [("", float("-inf"))] * len(audios)
+    if modelo is None: return resultados
+
+    prompts = prompts or [None] * len(audios)
+    muestras_ventana = VENTANA_S * SAMPLE_RATE
+    en_lote = [i for i, a in enumerate(audios) if a is not None and 0 < len(a) <= muestras_ventana]
+    sueltos = [i for i, a in enumerate(audios) if a is not None and len(a) > muestras_ventana]
+
+    pipeline = _pipeline_del_hilo(modelo, pipeline)
+    if len(en_lote) > 1 and pipeline is not None:
+        try:
+            for i, resultado in zip(en_lote, _transcribir_ventanas(pipeline, [audios[i] for i in en_lote], beam_size)):
+                resultados[i] = resultado
+        except Exception as e:
+            print(f"Error transcribiendo lote: {e}. Transcribiendo por separado...")
+            sueltos.extend(en_lote)
+    else:
+        sueltos.extend(en_lote)
+
+    # Aislamiento de errores: _transcribir() nunca lanza
+    for i in sueltos:
+        resultados[i] = _transcribir(modelo, audios[i], beam_size, prompts[i])
+
+    return resultados
+
+def transcribir_lote(audios, prompts=None):
+    """Transcribe varios chunks con MODEL_SIZE (beam 5). Lista de textos alineada."""
+    return [texto for texto, _ in _transcribir_lote(model, batched_model, audios, beam_size=5, prompts=prompts)]
+
+def transcribir_lote_rapido(audios, prompts=None):
+    """
+    Primer nivel de la cascada: modelo chico con decodificación greedy.
+
+    Returns:
+        Lista de (texto, confianza) alineada con `audios`.
+    """
+    return _transcribir_lote(fast_model, fast_batched_model, audios, beam_size=1, prompts=prompts)
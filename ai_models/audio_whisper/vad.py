@@ -0,0 +1,100 @@
+"""
+vad.py — Detección de actividad de voz (VAD) previa a Whisper
+=============================================================
+La mayor parte del audio de un examen no es voz (ventilador, teclado,
+TV de fondo). Esta etapa calcula qué fracción del chunk es voz y en qué
+segmentos está, para que solo esos segmentos lleguen a transcriber.
+
+Backend principal: Silero VAD incluido en faster-whisper (ONNX, CPU,
+pocos ms por chunk). Si no está disponible se usa un VAD por energía
+en la banda de voz, sin dependencias extra.
+"""
+
+import os
+
+import numpy as np
+
+try:
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+except ImportError:
+    VadOptions = None
+    get_speech_timestamps = None
+
+SAMPLE_RATE = 16000
+# Fracción mínima de voz en el chunk para considerarlo "con voz"
+AUDIO_VAD_MIN_SPEECH_RATIO = float(os.environ.get("AUDIO_VAD_MIN_SPEECH_RATIO", "0.02"))
+# Duración mínima total de voz (ms): por debajo no hay nada transcribible
+AUDIO_VAD_MIN_SPEECH_MS = int(os.environ.get("AUDIO_VAD_MIN_SPEECH_MS", "250"))
+
+
+def _vad_energia(audio: np.ndarray, rate: int = SAMPLE_RATE,
+                 frame_ms: int = 30, umbral_db: float = -45.0,
+                 margen_db: float = 12.0, hangover_frames: int = 8) -> list[tuple[int, int]]:
+    """
+    VAD de respaldo por energía: un frame es voz si su nivel supera tanto
+    `umbral_db` como el piso de ruido del chunk + `margen_db`. Los huecos de
+    hasta `hangover_frames` frames entre frames de voz se rellenan.
+    """
+    n = rate * frame_ms // 1000
+    total = len(audio) // n
+    if total == 0:
+        return []
+
+    frames = audio[:total * n].reshape(total, n)
+    db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+    piso = np.percentile(db, 10)
+    voz = db > max(umbral_db, piso + margen_db)
+
+    segmentos = []
+    inicio = fin = None
+    for i in np.flatnonzero(voz):
+        if inicio is None:
+            inicio = fin = i
+        elif i - fin <= hangover_frames:
+            fin = i
+        else:
+            segmentos.append((int(inicio * n), int((fin + 1) * n)))
+            inicio = fin = i
+    if inicio is not None:
+        segmentos.append((int(inicio * n), int((fin + 1) * n)))
+    return segmentos
+
+
+def detectar_voz(audio: np.ndarray, rate: int = SAMPLE_RATE) -> dict:
+    """
+    Calcula la actividad de voz de un chunk.
+
+    Returns:
+        dict con:
+          - segmentos:    lista de (inicio, fin) en muestras
+          - speech_ratio: fracción del chunk que es voz [0, 1]
+          - hay_voz:      True si la voz supera los mínimos configurados
+    """
+    segmentos = None
+    if get_speech_timestamps is not None:
+        try:
+            marcas = get_speech_timestamps(
+                audio, VadOptions(min_silence_duration_ms=500, speech_pad_ms=200)
+            )
+            segmentos = [(m["start"], m["end"]) for m in marcas]
+        except Exception as e:
+            print(f"Error en Silero VAD, usando VAD por energía: {e}")
+    if segmentos is None:
+        segmentos = _vad_energia(audio, rate)
+
+    muestras_voz = sum(fin - inicio for inicio, fin in segmentos)
+    speech_ratio = muestras_voz / len(audio) if len(audio) else 0.0
+
+    return {
+        "segmentos": segmentos,
+        "speech_ratio": round(speech_ratio, 4),
+        "hay_voz": (speech_ratio >= AUDIO_VAD_MIN_SPEECH_RATIO
+                    and muestras_voz * 1000 >= AUDIO_VAD_MIN_SPEECH_MS * rate),
+    }
+
+
+def extraer_voz(audio: np.ndarray, segmentos: list[tuple[int, int]]) -> np.ndarray:
+    """Concatena solo los segmentos con voz (lo único que se transcribe)."""
+    if not segmentos:
+        return audio[:0]
+    return np.concatenate([audio[inicio:fin] for inicio, fin in segmentos])
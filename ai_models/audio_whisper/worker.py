@@ -7,16 +7,61 @@ NO conoce RabbitMQ ni colas — eso es trabajo de main.py.
 """
 
 import logging
+import os
 from datetime import datetime, timezone
 
+import numpy as np
+
 import audiocleaner as audio_cleaner
+import streaming
+from cache import crear_cliente_redis
 import transcriber
-from analyzer_semantic import analyzer_service
+import vad
+from analyzer_semantic import analyzer_service, UMBRAL_ALERTA
 from soft_evidence import normalizar_audio
 import requests
 
 logger = logging.getLogger("AudioWorker")
 
+# VAD antes de Whisper: solo los segmentos con voz se transcriben y los
+# chunks sin voz van directo a la distribución de silencio. "0" lo desactiva.
+AUDIO_VAD_GATING = os.environ.get("AUDIO_VAD_GATING", "1") == "1"
+
+# Cascada de Whisper (transcriber.WHISPER_CASCADE): un chunk transcrito por el
+# modelo rápido se re-transcribe con el modelo completo si algún score crudo
+# cae a ±WHISPER_CASCADE_BAND de UMBRAL_ALERTA, o si la confianza del modelo
+# rápido (avg_logprob) es menor que WHISPER_CASCADE_MIN_LOGPROB.
+WHISPER_CASCADE_BAND = float(os.environ.get("WHISPER_CASCADE_BAND", "0.1"))
+WHISPER_CASCADE_MIN_LOGPROB = float(os.environ.get("WHISPER_CASCADE_MIN_LOGPROB", "-0.7"))
+
+# Estado de streaming por sesión (prompt con el texto previo + cola de audio
+# en el borde entre chunks). Las sesiones inactivas se expulsan por LRU/TTL.
+AUDIO_STREAMING = os.environ.get("AUDIO_STREAMING", "0") == "1"
+AUDIO_STREAMING_MAX_SESIONES = int(os.environ.get("AUDIO_STREAMING_MAX_SESIONES", "5000"))
+AUDIO_STREAMING_TTL_S = float(os.environ.get("AUDIO_STREAMING_TTL_S", "120"))
+# "memoria" (una réplica del worker) | "redis" (varias réplicas)
+AUDIO_STREAMING_BACKEND = os.environ.get("AUDIO_STREAMING_BACKEND", "memoria")
+# Una cola de voz retenida sin que llegue otro chunk de la sesión se
+# transcribe sola pasado este tiempo (ver vaciar_colas_pendientes)
+AUDIO_STREAMING_FLUSH_S = float(os.environ.get("AUDIO_STREAMING_FLUSH_S", "30"))
+
+
+# El estado en memoria lo comparten los consumidores (hilos) de supervisor.py;
+# con varias réplicas del contenedor hace falta Redis.
+estados_streaming = streaming.crear_estados(
+    AUDIO_STREAMING_BACKEND, AUDIO_STREAMING_MAX_SESIONES, AUDIO_STREAMING_TTL_S,
+    cliente_redis=crear_cliente_redis() if AUDIO_STREAMING_BACKEND == "redis" else None,
+) if AUDIO_STREAMING else None
+
+# Descarga en streaming: el cuerpo HTTP se decodifica a medida que llega
+# (descarga y decode se solapan; nunca se tiene el chunk entero en bytes).
+AUDIO_STREAM_DOWNLOAD = os.environ.get("AUDIO_STREAM_DOWNLOAD", "1") == "1"
+# Parada temprana: si los primeros AUDIO_EARLY_STOP_S segundos son silencio,
+# el chunk se da por silencioso sin descargar/decodificar el resto.
+# 0 (default) la desactiva: la voz que empiece después se perdería.
+AUDIO_EARLY_STOP_S = float(os.environ.get("AUDIO_EARLY_STOP_S", "0"))
+UMBRAL_SILENCIO_DB = -45
+
 
 def descargar_audio_bytes(url: str) -> bytes | None:
     """Descarga el chunk de audio desde Azure Blob Storage."""
@@ -29,6 +74,237 @@ def descargar_audio_bytes(url: str) -> bytes | None:
         return None
 
 
+def _construir_evento(user_id: str, sesion_id: str, distribucion: dict,
+                      chunk: dict) -> dict:
+    """Construye el evento universal de soft evidence del worker de audio."""
+    details = {
+        "transcript": chunk["texto"] if chunk["texto"] else None,
+        "silence_detected": chunk["silencio"],
+    }
+    if chunk["speech_ratio"] is not None:
+        details["speech_ratio"] = chunk["speech_ratio"]
+    if chunk.get("stt_tier"):
+        # Modelo de Whisper que produjo la transcripción final
+        details["stt_tier"] = chunk["stt_tier"]
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "user_id": user_id,
+        "sesion_id": sesion_id,
+        "source": "audio_nlp",
+        "evidence_type": "soft",
+        "soft_evidence": distribucion,
+        "details": details,
+    }
+
+
+def _crear_parada_temprana():
+    """detener(frontend) para decodificar_stream(), o None si está desactivada."""
+    if AUDIO_EARLY_STOP_S <= 0:
+        return None
+    limite = int(AUDIO_EARLY_STOP_S * audio_cleaner.SAMPLE_RATE)
+    evaluado = False
+
+    def detener(frontend):
+        # Se evalúa una sola vez, al cruzar el límite
+        nonlocal evaluado
+        if evaluado or frontend.muestras < limite:
+            return False
+        evaluado = True
+        return frontend.es_silencio(umbral_db=UMBRAL_SILENCIO_DB)
+
+    return detener
+
+
+def descargar_y_decodificar(url: str):
+    """
+    Etapas 1-2 en streaming: el cuerpo de la respuesta se pasa al decoder
+    a medida que llega y cada bloque PCM alimenta el front end DSP.
+
+    Returns:
+        (audio float32, frontend, detenido) o None si falla la descarga
+        o la decodificación. `detenido` = parada temprana por silencio.
+    """
+    try:
+        response = requests.get(url, timeout=15, stream=True)
+        response.raise_for_status()
+    except Exception as e:
+        logger.error(f"Error descargando audio de {url}: {e}")
+        return None
+
+    with response:
+        response.raw.decode_content = True
+        frontend = audio_cleaner.FrontEndVoz(filtrar=False)
+        try:
+            audio_np, detenido = audio_cleaner.decodificar_stream(
+                response.raw, frontend, _crear_parada_temprana()
+            )
+        except Exception as e:
+            logger.error(f"Error descargando audio de {url}: {e}")
+            return None
+
+    if audio_np is None:
+        logger.warning("Error convirtiendo bytes a numpy.")
+        return None
+    return audio_np, frontend, detenido
+
+
+def _preparar_chunk(sesion_id: str, url_storage: str, user_id: str | None = None) -> dict | None:
+    """Etapas 1-3 del pipeline: descarga (+ decode en streaming) → preparar_audio()."""
+    if not AUDIO_STREAM_DOWNLOAD:
+        # 1. Descargar el audio
+        audio_bytes = descargar_audio_bytes(url_storage)
+        if audio_bytes is None:
+            return None
+        return preparar_audio(audio_bytes, sesion_id, user_id)
+
+    # 1-2. Descargar y convertir a numpy en streaming
+    decodificado = descargar_y_decodificar(url_storage)
+    if decodificado is None:
+        return None
+    audio_np, frontend, detenido = decodificado
+    return preparar_pcm(audio_np, frontend, sesion_id, silencio_temprano=detenido, user_id=user_id)
+
+
+def preparar_audio(audio_bytes: bytes, sesion_id: str | None = None,
+                   user_id: str | None = None) -> dict | None:
+    """
+    Etapas 2-3 del pipeline: numpy → silencio/VAD (+ filtro de voz).
+
+    El RMS/pico se mide mientras se decodifica (audiocleaner.FrontEndVoz,
+    sin otra pasada para el silencio). El filtro de voz se aplica solo a lo
+    que sobrevive al silencio y al VAD.
+
+    Con AUDIO_STREAMING y `sesion_id`, se antepone la cola de voz pendiente
+    del chunk anterior de la sesión y se guarda la nueva cola (ver streaming.py).
+
+    Returns:
+        dict con `silencio`, `audio` (solo voz, ya filtrada; None si es
+        silencio), `speech_ratio`, `prompt` y `texto` (lo llena la etapa de
+        STT), o None si el audio no se pudo procesar.
+    """
+    # 2. Convertir a numpy (+ RMS/pico por bloque, sin otra pasada)
+    frontend = audio_cleaner.FrontEndVoz(filtrar=False)
+    audio_np = audio_cleaner.convertir_a_numpy(audio_bytes, frontend)
+    if audio_np is None:
+        logger.warning("Error convirtiendo bytes a numpy.")
+        return None
+    return preparar_pcm(audio_np, frontend, sesion_id, user_id=user_id)
+
+
+def preparar_pcm(audio_np: np.ndarray, frontend, sesion_id: str | None = None,
+                 silencio_temprano: bool = False, user_id: str | None = None) -> dict:
+    """
+    Etapa 3 sobre audio ya decodificado (ver preparar_audio()).
+    `frontend` trae el RMS ya medido; `silencio_temprano` marca un chunk
+    cuya decodificación se cortó por parada temprana. `user_id` queda con
+    la cola retenida, por si hay que transcribirla sola.
+    """
+    chunk = {"silencio": True, "audio": None, "speech_ratio": None, "texto": None,
+             "sesion_id": sesion_id, "prompt": None}
+
+    cola_previa = None
+    if estados_streaming is not None and sesion_id:
+        cola_previa = estados_streaming.tomar_cola(sesion_id)
+        chunk["prompt"] = estados_streaming.prompt(sesion_id)
+
+    # 3. Detectar silencio (umbral: -45dB RMS)
+    if silencio_temprano or frontend.es_silencio(umbral_db=UMBRAL_SILENCIO_DB):
+        return _solo_cola(chunk, cola_previa)
+
+    # 3.1 VAD: ¿hay voz o solo ruido de fondo (ventilador, teclado, TV)?
+    if AUDIO_VAD_GATING:
+        actividad = vad.detectar_voz(audio_np)
+        chunk["speech_ratio"] = actividad["speech_ratio"]
+        if not actividad["hay_voz"]:
+            return _solo_cola(chunk, cola_previa)
+
+        segmentos = actividad["segmentos"]
+        if estados_streaming is not None and sesion_id:
+            # La voz que llega al borde del chunk se transcribe con el siguiente
+            segmentos, cola = streaming.separar_cola(segmentos, len(audio_np))
+            if cola is not None:
+                estados_streaming.guardar_cola(sesion_id, audio_np[cola[0]:cola[1]], user_id)
+        audio_np = vad.extraer_voz(audio_np, segmentos)
+
+    if cola_previa is not None:
+        audio_np = np.concatenate([cola_previa, audio_np])
+
+    # ── Caso Voz Detectada ──────────────────────────────────────────
+    # Filtrar frecuencias de voz humana
+    chunk["silencio"] = False
+    chunk["audio"] = audio_cleaner.aplicar_filtro_voz(audio_np)
+    return chunk
+
+
+def _solo_cola(chunk: dict, cola_previa) -> dict:
+    """
+    Chunk sin voz: si la sesión tenía voz pendiente del chunk anterior,
+    esa cola es lo único que se transcribe; si no, queda como silencio.
+    """
+    if cola_previa is not None and len(cola_previa):
+        chunk["silencio"] = False
+        chunk["audio"] = audio_cleaner.aplicar_filtro_voz(cola_previa)
+    return chunk
+
+
+def _analizar(chunks: list[dict]):
+    """Etapa 5 — NLP en lote sobre los chunks con texto útil (llena `analisis`)."""
+    con_texto = [c for c in chunks if c["texto"] and len(c["texto"].strip()) >= 2]
+    for chunk, resultado in zip(con_texto, analyzer_service.analizar_batch([c["texto"] for c in con_texto])):
+        chunk["analisis"] = resultado
+
+
+def _requiere_modelo_completo(chunk: dict) -> bool:
+    """¿El resultado del modelo rápido es demasiado dudoso para publicarlo?"""
+    # El VAD dijo que hay voz pero el modelo rápido no sacó nada útil
+    if "analisis" not in chunk:
+        return True
+    if chunk["stt_confidence"] < WHISPER_CASCADE_MIN_LOGPROB:
+        return True
+    analisis = chunk["analisis"]
+    return any(
+        abs(analisis[campo] - UMBRAL_ALERTA) <= WHISPER_CASCADE_BAND
+        for campo in ("raw_score_trampa", "raw_score_domestico")
+    )
+
+
+def transcribir_y_analizar(chunks: list[dict]):
+    """
+    Etapas 4-5 — STT + NLP de los chunks con voz.
+
+    Sin cascada: todo se transcribe con el modelo completo.
+    Con cascada: todo pasa por el modelo rápido; solo los chunks dudosos
+    (ver _requiere_modelo_completo) se re-transcriben con el completo.
+    """
+    if not chunks:
+        return
+
+    pendientes = chunks
+    if transcriber.WHISPER_CASCADE and transcriber.fast_model is not None:
+        rapidos = transcriber.transcribir_lote_rapido([c["audio"] for c in chunks],
+                                                      [c.get("prompt") for c in chunks])
+        for chunk, (texto, confianza) in zip(chunks, rapidos):
+            chunk["texto"] = texto
+            chunk["stt_tier"] = transcriber.FAST_MODEL_SIZE
+            chunk["stt_confidence"] = confianza
+        _analizar(chunks)
+        pendientes = [c for c in chunks if _requiere_modelo_completo(c)]
+
+    textos = transcriber.transcribir_lote([c["audio"] for c in pendientes],
+                                          [c.get("prompt") for c in pendientes])
+    for chunk, texto in zip(pendientes, textos):
+        chunk["texto"] = texto
+        chunk["stt_tier"] = transcriber.MODEL_SIZE
+        chunk.pop("analisis", None)
+    _analizar(pendientes)
+
+    for chunk in chunks:
+        chunk["audio"] = None
+        if estados_streaming is not None and chunk.get("sesion_id"):
+            estados_streaming.registrar_texto(chunk["sesion_id"], chunk["texto"])
+
+
 def procesar_audio(user_id: str, sesion_id: str, url_storage: str) -> dict | None:
     """
     Pipeline completo de audio: descarga → silencio/voz → STT → NLP → soft evidence.
@@ -42,46 +318,42 @@ def procesar_audio(user_id: str, sesion_id: str, url_storage: str) -> dict | Non
         dict con el evento universal de soft evidence listo para encolar,
         o None si el audio no se pudo procesar.
     """
-    # 1. Descargar el audio
-    audio_bytes = descargar_audio_bytes(url_storage)
-    if audio_bytes is None:
-        return None
+    return procesar_lote_audio([(user_id, sesion_id, url_storage)])[0]
 
-    # 2. Convertir a numpy
-    audio_np = audio_cleaner.convertir_a_numpy(audio_bytes)
-    if audio_np is None:
-        logger.warning("Error convirtiendo bytes a numpy.")
-        return None
 
-    # 3. Detectar silencio (umbral: -45dB RMS)
-    silencio = audio_cleaner.es_silencio(audio_np, umbral_db=-45)
+def procesar_lote_audio(mensajes: list[tuple[str, str, str]]) -> list[dict | None]:
+    """
+    Igual que procesar_audio(), pero para una ventana de mensajes de q_audios.
+    Los chunks con voz se transcriben juntos con transcriber.transcribir_lote()
+    y las transcripciones con texto se analizan con una sola llamada a
+    analyzer_service.analizar_batch() (un forward de MiniLM por lote).
 
-    if silencio:
-        # ── Caso Silencio ───────────────────────────────────────────
-        # En Soft Evidence, el silencio NO es un early-return silencioso.
-        # Generamos su distribución para que la Red Bayesiana lo observe.
-        distribucion = normalizar_audio(es_silencio=True)
-        return {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "user_id": user_id,
-            "sesion_id": sesion_id,
-            "source": "audio_nlp",
-            "evidence_type": "soft",
-            "soft_evidence": distribucion,
-            "details": {
-                "transcript": None,
-                "silence_detected": True,
-            }
-        }
+    Args:
+        mensajes: Lista de tuplas (user_id, sesion_id, url_storage).
 
-    # ── Caso Voz Detectada ──────────────────────────────────────────
-    # Filtrar frecuencias de voz humana
-    audio_filtrado = audio_cleaner.aplicar_filtro_voz(audio_np)
+    Returns:
+        Lista alineada con `mensajes`: evento de soft evidence o None por chunk.
+    """
+    chunks = [_preparar_chunk(sesion_id, url_storage, user_id) for user_id, sesion_id, url_storage in mensajes]
+
+    # 4-5. Transcripción (STT con Faster-Whisper) + Análisis Semántico de NLP,
+    #      todos los chunks con voz juntos
+    transcribir_y_analizar([c for c in chunks if c is not None and not c["silencio"]])
+
+    return [
+        _evento_chunk(user_id, sesion_id, chunk) if chunk is not None else None
+        for (user_id, sesion_id, _), chunk in zip(mensajes, chunks)
+    ]
 
-    # 4. Transcripción (STT con Faster-Whisper)
-    texto = transcriber.transcribir_audio(audio_filtrado)
 
-    if not texto or len(texto.strip()) < 2:
+def _evento_chunk(user_id: str, sesion_id: str, chunk: dict) -> dict:
+    """Etapa 6 — distribución del chunk ya transcrito/analizado → evento."""
+    if chunk["silencio"]:
+        # ── Caso Silencio / Sin Voz ─────────────────────────────
+        # En Soft Evidence, el silencio NO es un early-return silencioso.
+        # Generamos su distribución para que la Red Bayesiana lo observe.
+        distribucion = normalizar_audio(es_silencio=True)
+    elif "analisis" not in chunk:
         # Ruido de fondo que parece voz: distribución neutral
         distribucion = normalizar_audio(
             es_silencio=False,
@@ -89,26 +361,36 @@ def procesar_audio(user_id: str, sesion_id: str, url_storage: str) -> dict | Non
             score_domestico=0.0,
         )
     else:
-        # 5. Análisis Semántico de NLP
-        analisis = analyzer_service.analizar(texto)
-
         # 6. Softmax con temperatura sobre las similitudes coseno crudas
+        resultado = chunk["analisis"]
         distribucion = normalizar_audio(
             es_silencio=False,
-            score_trampa=analisis["raw_score_trampa"],
-            score_domestico=analisis["raw_score_domestico"],
+            score_trampa=resultado["raw_score_trampa"],
+            score_domestico=resultado["raw_score_domestico"],
             temperatura=1.5,
         )
+    return _construir_evento(user_id, sesion_id, distribucion, chunk)
 
-    return {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "user_id": user_id,
-        "sesion_id": sesion_id,
-        "source": "audio_nlp",
-        "evidence_type": "soft",
-        "soft_evidence": distribucion,
-        "details": {
-            "transcript": texto if texto else None,
-            "silence_detected": False,
-        }
-    }
+
+def vaciar_colas_pendientes() -> list[dict]:
+    """
+    Transcribe la voz retenida en el borde del último chunk de las sesiones
+    que no mandaron otro chunk en AUDIO_STREAMING_FLUSH_S (fin del examen,
+    cámara/micrófono cortado). main.py lo llama periódicamente.
+
+    Returns:
+        Eventos de soft evidence a publicar, uno por cola vaciada.
+    """
+    if estados_streaming is None:
+        return []
+    pendientes = estados_streaming.colas_vencidas(AUDIO_STREAMING_FLUSH_S)
+    chunks = [
+        {"silencio": False, "audio": audio_cleaner.aplicar_filtro_voz(cola), "speech_ratio": None,
+         "texto": None, "sesion_id": sesion_id, "prompt": estados_streaming.prompt(sesion_id)}
+        for sesion_id, _, cola in pendientes
+    ]
+    transcribir_y_analizar(chunks)
+    return [
+        _evento_chunk(user_id, sesion_id, chunk)
+        for (sesion_id, user_id, _), chunk in zip(pendientes, chunks)
+    ]
@@ -5,11 +5,17 @@ Responsabilidad: procesamiento de imágenes, vectorización de rostros,
 y comparación de embeddings. Stateless — no guarda nada.
 """
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 import requests
 import face_recognition
 
+# Descargas + vectorizaciones simultáneas en comparar_lote()
+MAX_DESCARGAS = int(os.getenv("MAX_DESCARGAS", "8"))
+
 
 def clean_image(image: np.ndarray) -> np.ndarray | None:
     """
@@ -107,4 +113,73 @@ def comparar_vectores(vector_db: list | np.ndarray,
         "is_match": es_match,
         "similarity_percent": round(similarity, 2),
         "distance": round(float(distancia), 4),
-    }
\ No newline at end of file
+    }
+
+# ── Lotes (/api/compare/batch) ──
+
+def vectorizar_urls(urls: list[str], max_workers: int = MAX_DESCARGAS) -> dict:
+    """
+    Descarga y vectoriza cada URL distinta UNA sola vez, varias a la vez
+    (la espera de red de Azure Blob domina el tiempo de cada ítem).
+
+    Returns:
+        dict url → (vector (128,) | None, error | None), con error
+        (código HTTP, detalle) como en /api/compare.
+    """
+    def procesar(url):
+        imagen = descargar_imagen(url)
+        if imagen is None:
+            return None, (400, "No se pudo descargar o decodificar la imagen desde la URL proporcionada.")
+        vector = generar_vector(imagen)
+        if vector is None:
+            return None, (422, "No se detectó un rostro en la nueva imagen.")
+        return vector, None
+
+    unicas = list(dict.fromkeys(urls))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unicas)))) as pool:
+        return dict(zip(unicas, pool.map(procesar, unicas)))
+
+
+def comparar_vectores_lote(vectores_db: np.ndarray, vectores_nuevos: np.ndarray,
+                           umbral: float = 0.5) -> list[dict]:
+    """
+    comparar_vectores() para N pares a la vez: una sola operación numpy
+    sobre (N, 128) × (N, 128). Misma salida por par.
+    """
+    distancias = np.linalg.norm(
+        np.asarray(vectores_db, dtype=np.float64) - np.asarray(vectores_nuevos, dtype=np.float64), axis=1,
+    )
+    similitudes = np.maximum(0.0, 1.0 - distancias) * 100
+    return [
+        {"is_match": bool(d < umbral), "similarity_percent": round(float(s), 2), "distance": round(float(d), 4)}
+        for d, s in zip(distancias, similitudes)
+    ]
+
+
+def comparar_lote(pares: list[tuple[str, np.ndarray]], umbral: float = 0.5) -> list[dict]:
+    """
+    Compara N pares (image_url, vector_db): cada imagen distinta se
+    descarga y vectoriza una vez, y todas las distancias salen de una
+    sola operación vectorizada.
+
+    Returns:
+        Lista alineada con `pares`: resultado de comparar_vectores() o
+        {"error": {"status_code", "detail"}} por par.
+    """
+    vectores = vectorizar_urls([url for url, _ in pares])
+    validos = [i for i, (url, _) in enumerate(pares) if vectores[url][0] is not None]
+
+    resultados = [None] * len(pares)
+    if validos:
+        comparaciones = comparar_vectores_lote(
+            np.stack([pares[i][1] for i in validos]),
+            np.stack([vectores[pares[i][0]][0] for i in validos]),
+            umbral,
+        )
+        for i, comparacion in zip(validos, comparaciones):
+            resultados[i] = comparacion
+    for i, (url, _) in enumerate(pares):
+        if resultados[i] is None:
+            codigo, detalle = vectores[url][1]
+            resultados[i] = {"error": {"status_code": codigo, "detail": detalle}}
+    return resultados
@@ -8,6 +8,8 @@ del almacenamiento de vectores en su BD.
 Endpoints:
   POST /api/vectorize  → Recibe URL de imagen → Devuelve embedding
   POST /api/compare    → Recibe URL de imagen + vector de BD → Devuelve similitud
+  POST /api/compare/batch → Varios pares (URL, vector) o varias URLs contra un vector
+                            → Devuelve similitud o error por ítem
   GET  /               → Health check
 """
 
@@ -25,6 +27,7 @@ load_dotenv()
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8000"))
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "64"))
 
 app = FastAPI(title="Biometric AI Service", version="2.0.0")
 
@@ -55,6 +58,25 @@ class CompareRequest(BaseModel):
     umbral: float = 0.5
 
 
+class CompareBatchItem(BaseModel):
+    """Un par a comparar; sin vector_db se usa el vector_db del lote."""
+    image_url: str
+    vector_db: list[float] | None = None
+
+
+class CompareBatchRequest(BaseModel):
+    """
+    El backend envía una de dos formas (o ambas):
+      - items:      pares (image_url, vector_db)
+      - image_urls: varias fotos contra el vector_db del lote
+    y el umbral común (opcional, default 0.5).
+    """
+    items: list[CompareBatchItem] = []
+    image_urls: list[str] = []
+    vector_db: list[float] | None = None
+    umbral: float = 0.5
+
+
 # --- Health Check ---
 @app.get("/")
 def health_check():
@@ -136,6 +158,61 @@ async def comparar(req: CompareRequest):
     return resultado
 
 
+# --- ENDPOINT 3: COMPARAR EN LOTE ---
+@app.post("/api/compare/batch")
+def comparar_lote(req: CompareBatchRequest):
+    """
+    Igual que /api/compare para muchos ítems en una sola petición: las
+    imágenes se descargan y vectorizan en paralelo (una vez por URL
+    distinta) y las distancias se calculan juntas.
+
+    Endpoint síncrono: FastAPI lo corre en su threadpool y el lote no
+    bloquea el event loop.
+
+    Retorna un resultado por ítem (mismo orden: items y luego image_urls);
+    los errores de un ítem no afectan al resto.
+    """
+    # 1. Armar los pares (image_url, vector_db)
+    pares = [(item.image_url, item.vector_db if item.vector_db is not None else req.vector_db)
+             for item in req.items]
+    pares += [(url, req.vector_db) for url in req.image_urls]
+
+    if not pares:
+        raise HTTPException(status_code=400, detail="El lote no tiene ítems (items o image_urls).")
+    if len(pares) > MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El lote admite hasta {MAX_BATCH_ITEMS} ítems, recibí {len(pares)}."
+        )
+
+    # 2. Validar vectores por ítem (como /api/compare, pero sin cortar el lote)
+    resultados = [None] * len(pares)
+    validos = []
+    for i, (url, vector_db) in enumerate(pares):
+        if vector_db is None or len(vector_db) != 128:
+            recibido = 0 if vector_db is None else len(vector_db)
+            resultados[i] = {"error": {
+                "status_code": 400,
+                "detail": f"El vector de BD debe tener 128 dimensiones, recibí {recibido}.",
+            }}
+        else:
+            validos.append(i)
+
+    # 3. Descargar, vectorizar y comparar los válidos
+    if validos:
+        comparaciones = biometrics.comparar_lote(
+            [(pares[i][0], pares[i][1]) for i in validos], umbral=req.umbral,
+        )
+        for i, comparacion in zip(validos, comparaciones):
+            resultados[i] = comparacion
+
+    return {
+        "total": len(pares),
+        "errors": sum("error" in r for r in resultados),
+        "results": [{"image_url": url, **r} for (url, _), r in zip(pares, resultados)],
+    }
+
+
 if __name__ == "__main__":
     print(f"Iniciando Biometric AI Service en {API_HOST}:{API_PORT}")
     uvicorn.run(app, host=API_HOST, port=API_PORT)
\ No newline at end of file
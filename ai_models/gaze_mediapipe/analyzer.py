@@ -1,7 +1,15 @@
+import os
+
 import numpy as np
 from sklearn.cluster import DBSCAN
 from sklearn.ensemble import IsolationForest
 
+from grid_clustering import grid_cluster_labels
+
+# Backend del sub-pipeline 2 en la ruta vectorizada:
+# "dbscan" (sklearn) | "grid" (DBSCAN sobre grilla, ~O(N), ver grid_clustering.py)
+GAZE_CLUSTER_BACKEND = os.environ.get("GAZE_CLUSTER_BACKEND", "dbscan")
+
 def is_out_of_bounds(x, y, limit=1.0):
     """Verifica si una coordenada individual está fuera de la pantalla."""
     return abs(x) > limit or abs(y) > limit
@@ -82,4 +90,100 @@ def analyze_gaze_buffer(buffer):
         "oob_ratio": round(total_oob_ratio, 4),
         "secondary_cluster_ratio": round(secondary_cluster_ratio, 4),
         "anomaly_ratio": round(anomaly_ratio, 4),
-    }
\ No newline at end of file
+    }
+
+# ── Ruta vectorizada (buffers como ndarray) ─────────────────────
+# Mismas métricas que analyze_gaze_buffer(), bit a bit, sin bucles de
+# Python por punto. Se calcula en float64 como la ruta de tuplas (np.array
+# de floats de Python), así que un buffer float32 da el mismo resultado
+# que analyze_gaze_buffer(buffer.tolist()).
+
+def _resultado_vacio(status):
+    return {
+        "status": status,
+        "oob_ratio": 0.0,
+        "secondary_cluster_ratio": 0.0,
+        "anomaly_ratio": 0.0,
+    }
+
+def out_of_bounds_mask(puntos, limit=1.0):
+    """Versión vectorizada de is_out_of_bounds() → máscara booleana (N,)."""
+    return np.any(np.abs(puntos) > limit, axis=1)
+
+def saccade_mask(puntos, max_distance=0.5):
+    """
+    Versión vectorizada de detect_saccade_noise() → máscara de puntos a
+    conservar. Igual que la original, cada punto se compara con el punto
+    ANTERIOR del buffer (no con el último conservado).
+    """
+    mascara = np.ones(len(puntos), dtype=bool)
+    if len(puntos) > 1:
+        dx = puntos[1:, 0] - puntos[:-1, 0]
+        dy = puntos[1:, 1] - puntos[:-1, 1]
+        mascara[1:] = np.sqrt(dx ** 2 + dy ** 2) <= max_distance
+    return mascara
+
+def secondary_cluster_ratio_from_labels(labels):
+    """Tamaño del 2do clúster más grande / total de puntos (ruido = -1)."""
+    tamanos = np.bincount(labels[labels >= 0])
+    tamanos = tamanos[tamanos > 0]
+    if len(tamanos) < 2:
+        return 0.0
+    return int(np.partition(tamanos, -2)[-2]) / len(labels)
+
+def analyze_gaze_array(puntos, modelo_anomalias=None):
+    """
+    Igual que analyze_gaze_buffer(), pero recibe un ndarray (N, 2)
+    (float32 o float64) y hace limpieza de sacadas, OOB y conteo de
+    clústeres con operaciones vectorizadas.
+
+    Con `modelo_anomalias` (IsolationForest ya ajustado, p. ej. el modelo
+    base de la sesión) solo se llama a predict() en vez de ajustar un
+    bosque nuevo para este buffer.
+    """
+    puntos = np.asarray(puntos, dtype=np.float64)
+    if puntos.ndim != 2 or puntos.shape[1] != 2:
+        raise ValueError(f"Se esperaba un buffer (N, 2), llegó {puntos.shape}")
+
+    if len(puntos) < 15:
+        return _resultado_vacio("insufficient_data")
+
+    # 1. Limpieza de ruido (micromovimientos falsos)
+    X = puntos[saccade_mask(puntos)]
+    if len(X) < 15:
+        return _resultado_vacio("too_much_noise")
+
+    # ── Sub-pipeline 1: Heurística OOB (Out of Bounds) ──────────────
+    total_oob_ratio = int(np.count_nonzero(out_of_bounds_mask(X))) / len(X)
+
+    return analyze_clean_points(X, total_oob_ratio, modelo_anomalias)
+
+def cluster_labels(X, backend=None):
+    """Etiquetas de clúster del sub-pipeline 2 (-1 = ruido) según el backend."""
+    if (backend or GAZE_CLUSTER_BACKEND) == "grid":
+        return grid_cluster_labels(X, eps=0.3, min_samples=5)
+    return DBSCAN(eps=0.3, min_samples=5).fit_predict(X)
+
+def analyze_clean_points(X, oob_ratio, modelo_anomalias=None):
+    """
+    Sub-pipelines 2 y 3 (DBSCAN + Isolation Forest) sobre puntos ya sin
+    sacadas, con el oob_ratio ya calculado (p. ej. con los contadores
+    incrementales de la ventana deslizante, ver ventana.py).
+    """
+    # ── Sub-pipeline 2: DBSCAN — Clústeres de atención ─────────────
+    labels = cluster_labels(X)
+    secondary_cluster_ratio = secondary_cluster_ratio_from_labels(labels)
+
+    # ── Sub-pipeline 3: Isolation Forest — Anomalías ────────────────
+    if modelo_anomalias is None:
+        anomalies = IsolationForest(contamination=0.2, random_state=42).fit_predict(X)
+    else:
+        anomalies = modelo_anomalias.predict(X)
+    anomaly_ratio = int(np.count_nonzero(anomalies == -1)) / len(anomalies)
+
+    return {
+        "status": "ok",
+        "oob_ratio": round(oob_ratio, 4),
+        "secondary_cluster_ratio": round(secondary_cluster_ratio, 4),
+        "anomaly_ratio": round(anomaly_ratio, 4),
+    }
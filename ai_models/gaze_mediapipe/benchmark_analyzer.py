@@ -0,0 +1,107 @@
+"""
+benchmark_analyzer.py — Ruta de tuplas vs ruta vectorizada del analizador
+=========================================================================
+Mide, para buffers de 15 a 10k puntos:
+
+  • prep:  limpieza de sacadas + OOB + conteo de clústeres (lo que cambió
+           entre analyze_gaze_buffer y analyze_gaze_array), con las mismas
+           etiquetas DBSCAN para ambos.
+  • total: análisis completo (incluye DBSCAN e Isolation Forest, que son
+           idénticos en ambas rutas).
+
+y verifica que ambas rutas den exactamente las mismas métricas.
+
+Ejecutar:  python benchmark_analyzer.py [--json]
+"""
+
+import json
+import sys
+import time
+
+import numpy as np
+from sklearn.cluster import DBSCAN
+
+from analyzer import (
+    analyze_gaze_array, analyze_gaze_buffer, detect_saccade_noise, is_out_of_bounds,
+    out_of_bounds_mask, saccade_mask, secondary_cluster_ratio_from_labels,
+)
+
+TAMANOS = [15, 100, 1000, 10000]
+
+
+def buffer_sintetico(rng, n):
+    """Fijación central + 2do foco + puntos fuera de pantalla."""
+    centro = rng.normal(0.0, 0.08, (n, 2))
+    foco = rng.normal([0.6, -0.5], 0.05, (n, 2))
+    fuera = rng.uniform(-1.6, 1.6, (n, 2))
+    tipo = rng.choice(3, n, p=[0.6, 0.25, 0.15])
+    return np.where(tipo[:, None] == 0, centro, np.where(tipo[:, None] == 1, foco, fuera))
+
+
+def prep_tuplas(buffer, labels):
+    clean = detect_saccade_noise(buffer)
+    oob = sum([is_out_of_bounds(x, y) for x, y in clean]) / len(clean)
+    validos = set(labels) - {-1}
+    if len(validos) >= 2:
+        conteos = sorted((list(labels).count(c) for c in validos), reverse=True)
+        return oob, conteos[1] / len(labels)
+    return oob, 0.0
+
+
+def prep_vectorizado(puntos, labels):
+    X = puntos[saccade_mask(puntos)]
+    oob = int(np.count_nonzero(out_of_bounds_mask(X))) / len(X)
+    return oob, secondary_cluster_ratio_from_labels(labels)
+
+
+def cronometrar(fn, *args, minimo_s=0.2):
+    """ms por llamada (repite hasta acumular `minimo_s`)."""
+    repeticiones, t0 = 0, time.perf_counter()
+    while True:
+        fn(*args)
+        repeticiones += 1
+        transcurrido = time.perf_counter() - t0
+        if transcurrido >= minimo_s:
+            return transcurrido / repeticiones * 1000
+
+
+def main():
+    rng = np.random.default_rng(42)
+    filas = []
+
+    for n in TAMANOS:
+        puntos = buffer_sintetico(rng, n)
+        buffer = puntos.tolist()
+        labels = DBSCAN(eps=0.3, min_samples=5).fit_predict(puntos[saccade_mask(puntos)])
+
+        tuplas = cronometrar(prep_tuplas, buffer, labels)
+        vectorizado = cronometrar(prep_vectorizado, puntos, labels)
+        total_tuplas = cronometrar(analyze_gaze_buffer, buffer, minimo_s=0.5)
+        total_vectorizado = cronometrar(analyze_gaze_array, puntos, minimo_s=0.5)
+
+        filas.append({
+            "points": n,
+            "prep_tuples_ms": round(tuplas, 4),
+            "prep_array_ms": round(vectorizado, 4),
+            "prep_speedup": round(tuplas / vectorizado, 1),
+            "total_tuples_ms": round(total_tuplas, 3),
+            "total_array_ms": round(total_vectorizado, 3),
+            "identical": analyze_gaze_buffer(buffer) == analyze_gaze_array(puntos),
+        })
+
+    if "--json" in sys.argv:
+        print(json.dumps(filas, indent=2))
+        return
+
+    print("=" * 78)
+    print("Analizador de gaze: tuplas vs ndarray (ms por buffer)")
+    print("=" * 78)
+    print(f"  {'puntos':>7}{'prep tuplas':>13}{'prep array':>12}{'x':>7}"
+          f"{'total tuplas':>14}{'total array':>13}{'idéntico':>10}")
+    for f in filas:
+        print(f"  {f['points']:>7}{f['prep_tuples_ms']:>13}{f['prep_array_ms']:>12}{f['prep_speedup']:>7}"
+              f"{f['total_tuples_ms']:>14}{f['total_array_ms']:>13}{str(f['identical']):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+benchmark_clustering.py — Clustering por grilla vs DBSCAN de sklearn
+=====================================================================
+Reporte de acuerdo y tiempos entre grid_cluster_labels() y
+DBSCAN(eps=0.3, min_samples=5) sobre buffers sintéticos (fijación
+central + 2do foco + puntos fuera de pantalla) de 150 a 100k puntos.
+
+Por tamaño:
+  • ari:                  Adjusted Rand Index entre ambas etiquetas (1 = iguales).
+  • same_n_clusters:      fracción de buffers con la misma cantidad de clústeres.
+  • secondary_ratio_mae:  error absoluto medio de secondary_cluster_ratio.
+  • secondary_ratio_max:  peor diferencia de secondary_cluster_ratio.
+  • dbscan_ms / grid_ms:  mediana de ms por buffer.
+
+Por encima de DBSCAN_MAX_PUNTOS solo se mide la grilla: en una fijación
+densa casi todos los puntos son vecinos entre sí y sklearn guarda las
+listas de vecinos completas (memoria ~N²; 100k puntos no entran en RAM).
+
+Ejecutar:  python benchmark_clustering.py [--json]
+"""
+
+import json
+import sys
+import time
+
+import numpy as np
+from sklearn.cluster import DBSCAN
+from sklearn.metrics import adjusted_rand_score
+
+from analyzer import secondary_cluster_ratio_from_labels
+from benchmark_analyzer import buffer_sintetico
+from grid_clustering import grid_cluster_labels
+
+# (puntos, buffers por tamaño)
+ESCENARIOS = [(150, 30), (1000, 20), (10000, 5), (20000, 2), (100000, 2), (1000000, 1)]
+DBSCAN_MAX_PUNTOS = 20000
+
+
+def medir(fn, X):
+    t0 = time.perf_counter()
+    labels = fn(X)
+    return labels, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    rng = np.random.default_rng(42)
+    filas = []
+
+    for n, buffers in ESCENARIOS:
+        aris, mismos, difs, t_dbscan, t_grid = [], [], [], [], []
+        for _ in range(buffers):
+            X = buffer_sintetico(rng, n)
+            grid, ms_grid = medir(grid_cluster_labels, X)
+            t_grid.append(ms_grid)
+            if n > DBSCAN_MAX_PUNTOS:
+                continue
+            ref, ms_ref = medir(lambda p: DBSCAN(eps=0.3, min_samples=5).fit_predict(p), X)
+
+            aris.append(adjusted_rand_score(ref, grid))
+            mismos.append(len(set(ref) - {-1}) == len(set(grid) - {-1}))
+            difs.append(abs(secondary_cluster_ratio_from_labels(ref) - secondary_cluster_ratio_from_labels(grid)))
+            t_dbscan.append(ms_ref)
+
+        comparado = bool(t_dbscan)
+        filas.append({
+            "points": n,
+            "buffers": buffers,
+            "ari": round(float(np.mean(aris)), 4) if comparado else None,
+            "same_n_clusters": round(float(np.mean(mismos)), 4) if comparado else None,
+            "secondary_ratio_mae": round(float(np.mean(difs)), 4) if comparado else None,
+            "secondary_ratio_max": round(float(np.max(difs)), 4) if comparado else None,
+            "dbscan_ms": round(float(np.median(t_dbscan)), 3) if comparado else None,
+            "grid_ms": round(float(np.median(t_grid)), 3),
+            "speedup": round(float(np.median(t_dbscan) / np.median(t_grid)), 1) if comparado else None,
+        })
+
+    if "--json" in sys.argv:
+        print(json.dumps(filas, indent=2))
+        return
+
+    print("=" * 86)
+    print("Clustering por grilla vs DBSCAN(eps=0.3, min_samples=5)")
+    print("=" * 86)
+    print(f"  {'puntos':>8}{'ARI':>8}{'=#clúst':>9}{'MAE 2do':>9}{'máx 2do':>9}"
+          f"{'dbscan ms':>11}{'grid ms':>10}{'x':>7}")
+    for f in filas:
+        v = {k: "-" if val is None else val for k, val in f.items()}
+        print(f"  {v['points']:>8}{v['ari']:>8}{v['same_n_clusters']:>9}{v['secondary_ratio_mae']:>9}"
+              f"{v['secondary_ratio_max']:>9}{v['dbscan_ms']:>11}{v['grid_ms']:>10}{v['speedup']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+benchmark_formato.py — Tamaño y parseo de mensajes de q_gaze por formato
+========================================================================
+Compara el mensaje JSON original (lista de pares) con el formato compacto
+de formato_gaze.py, desde el cuerpo recibido hasta el ndarray (N, 2) que
+consume el analizador:
+
+  • json_lista:   json.loads + np.asarray(float64) (ruta original).
+  • json_b64_f32: JSON con gaze_buffer en base64, float32.
+  • json_b64_i16: JSON con gaze_buffer en base64, int16 cuantizado.
+  • binario_f32:  cuerpo binario (metadatos en headers AMQP), float32.
+  • binario_i16:  cuerpo binario, int16 cuantizado.
+
+Ejecutar:  python benchmark_formato.py [--json]
+"""
+
+import json
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+from benchmark_analyzer import buffer_sintetico, cronometrar
+from formato_gaze import (
+    CONTENT_TYPE_BINARIO, DTYPE_FLOAT32, DTYPE_INT16, codificar_base64, codificar_buffer, extraer_mensaje,
+)
+
+TAMANOS = [150, 1500, 15000]
+META = {"user_id": "u-1", "sesion_id": "s-1"}
+
+
+def mensajes(puntos):
+    """{formato: (cuerpo, properties)} para el mismo buffer."""
+    binario = SimpleNamespace(content_type=CONTENT_TYPE_BINARIO, headers=META)
+    return {
+        "json_lista": (json.dumps({**META, "gaze_buffer": puntos.tolist()}).encode(), None),
+        "json_b64_f32": (json.dumps({**META, "gaze_buffer": codificar_base64(puntos, DTYPE_FLOAT32)}).encode(), None),
+        "json_b64_i16": (json.dumps({**META, "gaze_buffer": codificar_base64(puntos, DTYPE_INT16)}).encode(), None),
+        "binario_f32": (codificar_buffer(puntos, DTYPE_FLOAT32), binario),
+        "binario_i16": (codificar_buffer(puntos, DTYPE_INT16), binario),
+    }
+
+
+def parsear(cuerpo, properties):
+    _, buffer_coordenadas = extraer_mensaje(cuerpo, properties)
+    # La ruta original termina en el ndarray float64 del analizador
+    return np.asarray(buffer_coordenadas, dtype=np.float64)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    filas = []
+    for n in TAMANOS:
+        puntos = buffer_sintetico(rng, n)
+        base = None
+        for formato, (cuerpo, properties) in mensajes(puntos).items():
+            ms = cronometrar(parsear, cuerpo, properties)
+            error = float(np.abs(parsear(cuerpo, properties) - puntos).max())
+            fila = {"points": n, "format": formato, "bytes": len(cuerpo),
+                    "parse_us": round(ms * 1000, 2), "max_abs_error": error}
+            if base is None:
+                base = fila
+            fila["size_ratio"] = round(base["bytes"] / fila["bytes"], 1)
+            fila["parse_speedup"] = round(base["parse_us"] / fila["parse_us"], 1)
+            filas.append(fila)
+
+    if "--json" in sys.argv:
+        print(json.dumps(filas, indent=2))
+        return
+
+    print("=" * 88)
+    print("Mensajes de q_gaze: JSON (lista de pares) vs formato compacto")
+    print("=" * 88)
+    print(f"  {'puntos':>7} {'formato':<14}{'bytes':>10}{'x tamaño':>10}{'µs parseo':>12}{'x parseo':>10}{'error máx':>12}")
+    for f in filas:
+        print(f"  {f['points']:>7} {f['format']:<14}{f['bytes']:>10}{f['size_ratio']:>10}"
+              f"{f['parse_us']:>12}{f['parse_speedup']:>10}{f['max_abs_error']:>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
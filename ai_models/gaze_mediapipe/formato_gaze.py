@@ -0,0 +1,158 @@
+"""
+formato_gaze.py — Formato binario compacto para buffers de mirada
+=================================================================
+El formato original de q_gaze es JSON con `gaze_buffer` como lista de
+pares [x, y]: ~40 bytes por punto, json.loads crea dos floats de Python
+por punto y el analizador los vuelve a convertir a numpy.
+
+Formato compacto (little-endian), autodescriptivo por su cabecera:
+
+    offset  tipo     campo
+    0       2s       magia  b"GZ"
+    2       uint8    versión (1)
+    3       uint8    dtype: 1 = float32, 2 = int16 cuantizado
+    4       uint32   N (puntos)
+    8       float32  escala (int16: coordenada = q / escala; float32: 1.0)
+    12      ...      N × 2 valores (x0, y0, x1, y1, ...)
+
+Llega de dos formas:
+  • JSON (clientes actuales): `gaze_buffer` es un string base64 del frame
+    en lugar de la lista de pares. El resto del mensaje no cambia.
+  • Cuerpo binario: content_type = CONTENT_TYPE_BINARIO, el cuerpo es el
+    frame y user_id / sesion_id / calibration van en los headers AMQP
+    (los headers suelen llegar como texto: ver leer_bandera()).
+
+float32 se decodifica sin copia (np.frombuffer sobre el cuerpo); int16
+cuesta una sola conversión a float32.
+"""
+
+import base64
+import binascii
+import json
+import struct
+
+import numpy as np
+
+CONTENT_TYPE_BINARIO = "application/x-gaze-buffer"
+
+MAGIA = b"GZ"
+VERSION = 1
+DTYPE_FLOAT32 = 1
+DTYPE_INT16 = 2
+# Con 8192 el rango es ±4.0 (la pantalla normalizada es ±1) y el paso 1.2e-4
+ESCALA_INT16 = 8192.0
+
+_CABECERA = struct.Struct("<2sBBIf")
+_DTYPES = {DTYPE_FLOAT32: np.dtype("<f4"), DTYPE_INT16: np.dtype("<i2")}
+
+_VERDADEROS = {"1", "true", "yes", "si", "sí"}
+_FALSOS = {"0", "false", "no", ""}
+
+
+def codificar_buffer(puntos, dtype: int = DTYPE_FLOAT32, escala: float = ESCALA_INT16) -> bytes:
+    """
+    Codifica puntos (N, 2) en un frame binario.
+
+    Args:
+        puntos: Lista de pares [x, y] o ndarray (N, 2).
+        dtype:  DTYPE_FLOAT32 o DTYPE_INT16.
+        escala: Solo int16: unidades por 1.0 de coordenada.
+    """
+    puntos = np.asarray(puntos, dtype=np.float32).reshape(-1, 2)
+    if dtype == DTYPE_FLOAT32:
+        datos, escala = puntos.astype("<f4", copy=False), 1.0
+    elif dtype == DTYPE_INT16:
+        if not np.isfinite(escala) or escala == 0:
+            raise ValueError(f"Escala int16 inválida: {escala}")
+        datos = np.clip(np.rint(puntos * escala), -32768, 32767).astype("<i2")
+    else:
+        raise ValueError(f"dtype de gaze desconocido: {dtype}")
+    return _CABECERA.pack(MAGIA, VERSION, dtype, len(puntos), escala) + datos.tobytes()
+
+
+def codificar_base64(puntos, dtype: int = DTYPE_FLOAT32, escala: float = ESCALA_INT16) -> str:
+    """Frame en base64, para el campo `gaze_buffer` de un mensaje JSON."""
+    return base64.b64encode(codificar_buffer(puntos, dtype, escala)).decode("ascii")
+
+
+def decodificar_buffer(frame) -> np.ndarray:
+    """
+    Decodifica un frame (bytes o base64) a ndarray (N, 2) float32.
+
+    Con float32 y bytes de entrada el resultado es una vista de solo
+    lectura sobre el mismo buffer (sin copia).
+
+    Raises:
+        ValueError: cabecera inválida, versión/dtype desconocido, escala
+                    int16 nula o no finita, o largo que no coincide con N.
+    """
+    if isinstance(frame, str):
+        try:
+            frame = base64.b64decode(frame, validate=True)
+        except binascii.Error as e:
+            raise ValueError(f"gaze_buffer base64 inválido: {e}") from e
+    if len(frame) < _CABECERA.size:
+        raise ValueError("Frame de gaze más corto que la cabecera")
+
+    magia, version, dtype, n, escala = _CABECERA.unpack_from(frame)
+    if magia != MAGIA:
+        raise ValueError("Frame de gaze sin la magia b'GZ'")
+    if version != VERSION:
+        raise ValueError(f"Versión de frame de gaze no soportada: {version}")
+    if dtype not in _DTYPES:
+        raise ValueError(f"dtype de gaze desconocido: {dtype}")
+    if dtype == DTYPE_INT16 and (not np.isfinite(escala) or escala == 0):
+        raise ValueError(f"Escala int16 inválida en el frame de gaze: {escala}")
+
+    tipo = _DTYPES[dtype]
+    esperado = _CABECERA.size + n * 2 * tipo.itemsize
+    if len(frame) != esperado:
+        raise ValueError(f"Frame de gaze de {len(frame)} bytes, se esperaban {esperado} para {n} puntos")
+
+    valores = np.frombuffer(frame, dtype=tipo, count=n * 2, offset=_CABECERA.size).reshape(n, 2)
+    if dtype == DTYPE_INT16:
+        return valores.astype(np.float32) * np.float32(1.0 / escala)
+    return valores
+
+
+def leer_bandera(valor) -> bool:
+    """
+    Booleano de un mensaje: True/False de JSON o texto de un header AMQP
+    ("true", "1", "false", "0", ...). bool("false") sería True.
+
+    Raises:
+        ValueError: texto o tipo que no es un booleano reconocible.
+    """
+    if isinstance(valor, bytes):
+        valor = valor.decode()
+    if isinstance(valor, str):
+        texto = valor.strip().lower()
+        if texto in _VERDADEROS:
+            return True
+        if texto in _FALSOS:
+            return False
+        raise ValueError(f"Valor booleano inválido: {valor!r}")
+    if valor is None or isinstance(valor, (bool, int)):
+        return bool(valor)
+    raise ValueError(f"Valor booleano inválido: {valor!r}")
+
+
+def extraer_mensaje(body: bytes, properties=None) -> tuple[dict, object]:
+    """
+    Separa un mensaje de q_gaze en (metadatos, buffer de coordenadas).
+
+    El buffer es la lista JSON original (clientes viejos) o un ndarray
+    (N, 2) float32 si vino en formato compacto (cuerpo binario o string
+    base64 en `gaze_buffer`).
+    """
+    content_type = getattr(properties, "content_type", None)
+    if content_type == CONTENT_TYPE_BINARIO:
+        headers = getattr(properties, "headers", None) or {}
+        metadatos = {k: v.decode() if isinstance(v, bytes) else v for k, v in headers.items()}
+        return metadatos, decodificar_buffer(body)
+
+    payload = json.loads(body)
+    buffer_coordenadas = payload.pop("gaze_buffer", [])
+    if isinstance(buffer_coordenadas, str):
+        buffer_coordenadas = decodificar_buffer(buffer_coordenadas)
+    return payload, buffer_coordenadas
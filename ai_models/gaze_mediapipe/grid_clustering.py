@@ -0,0 +1,229 @@
+"""
+grid_clustering.py — Clustering por grilla como alternativa a DBSCAN
+====================================================================
+Los puntos de mirada son 2-D y viven en un espacio de pantalla acotado;
+DBSCAN de sklearn paga una búsqueda de vecinos general (árbol + lista de
+vecinos por punto, ~N² en una fijación densa).
+
+Este backend reproduce DBSCAN(eps, min_samples) sobre una grilla de
+celdas de lado eps/√2 (dos puntos de la misma celda siempre están a ≤ eps):
+
+  1. Core: todos los puntos de una celda con ≥ min_samples puntos son
+     core sin medir distancias. Solo los puntos de celdas ralas cuentan
+     vecinos exactos en las 21 celdas alcanzables (5×5 sin esquinas).
+  2. Clústeres: componentes conexas de celdas con puntos core; dos celdas
+     se enlazan si tienen un par de puntos core a ≤ eps. Por celda se
+     miden a lo sumo MAX_REPRESENTANTES puntos core: los más cercanos a
+     la otra celda (única aproximación respecto de sklearn).
+  3. Border: punto no core con un core a ≤ eps → clúster de ese core.
+     El resto es ruido (-1). Un border alcanzable desde dos clústeres
+     puede quedar en otro que con sklearn (allí depende del orden de
+     recorrido); core, ruido y cantidad de clústeres coinciden.
+
+El costo es lineal en N más el de los puntos ralos del borde de cada
+fijación. Con pocos puntos (≤ MAX_PUNTOS_DENSO, el buffer típico de 5 s)
+la grilla no compensa su costo fijo y se usa la matriz de vecindad N×N.
+
+Devuelve etiquetas con la convención de DBSCAN.fit_predict(), así que
+secondary_cluster_ratio se calcula igual. Ver benchmark_clustering.py
+para el acuerdo con sklearn y los tiempos.
+"""
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# Celdas que pueden contener puntos a ≤ eps (lado eps/√2): 5×5 sin esquinas
+_ALCANZABLES = [(dx, dy) for dx in range(-2, 3) for dy in range(-2, 3) if abs(dx) + abs(dy) < 4]
+# Puntos core por celda usados para decidir si dos celdas se enlazan
+MAX_REPRESENTANTES = 32
+# Niveles de distancia (al cuadrado) para elegir representantes sin ordenar
+_NIVELES = 256
+# Representantes por lado en la primera pasada de enlaces
+_PRIMERA_RONDA = 4
+# Hasta este tamaño se usa la matriz de vecindad N×N (exacta)
+MAX_PUNTOS_DENSO = 256
+
+
+def _expandir(inicios: np.ndarray, largos: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rangos [inicio, inicio + largo) concatenados.
+
+    Returns:
+        (dueño, posición): índice del rango y posición de cada elemento.
+    """
+    total = int(largos.sum())
+    duenio = np.repeat(np.arange(len(largos)), largos)
+    desplazamiento = np.arange(total) - np.repeat(np.cumsum(largos) - largos, largos)
+    return duenio, inicios[duenio] + desplazamiento
+
+
+def _renumerar(etiquetas: np.ndarray) -> np.ndarray:
+    """Numera los clústeres 0..k-1 por orden de primera aparición (como DBSCAN)."""
+    asignados = etiquetas >= 0
+    _, primera, inversa = np.unique(etiquetas[asignados], return_index=True, return_inverse=True)
+    renumero = np.empty(len(primera), dtype=np.int64)
+    renumero[np.argsort(primera, kind="stable")] = np.arange(len(primera))
+    etiquetas[asignados] = renumero[inversa]
+    return etiquetas
+
+
+def _labels_densos(X: np.ndarray, eps: float, min_samples: int) -> np.ndarray:
+    """DBSCAN exacto con la matriz de vecindad N×N (buffers chicos)."""
+    dif = X[:, None, :] - X[None, :, :]
+    vecinos = np.einsum("ijk,ijk->ij", dif, dif) <= eps * eps
+    core = vecinos.sum(axis=1) >= min_samples
+    etiquetas = np.full(len(X), -1, dtype=np.int64)
+    if not core.any():
+        return etiquetas
+
+    _, componente = connected_components(vecinos[np.ix_(core, core)], directed=False)
+    etiquetas[core] = componente
+    # Border: primer core vecino
+    a_core = vecinos[np.ix_(~core, core)]
+    tiene = a_core.any(axis=1)
+    borde = np.flatnonzero(~core)[tiene]
+    etiquetas[borde] = componente[a_core[tiene].argmax(axis=1)]
+    return _renumerar(etiquetas)
+
+
+def grid_cluster_labels(X, eps=0.3, min_samples=5):
+    """
+    Args:
+        X:           Puntos (N, 2).
+        eps:         Radio de vecindad (mismo significado que en DBSCAN).
+        min_samples: Vecinos (incluido el propio punto) para ser core.
+
+    Returns:
+        ndarray (N,) de etiquetas int64: 0..k-1 por clúster, -1 = ruido.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n = len(X)
+    etiquetas = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return etiquetas
+    if n <= MAX_PUNTOS_DENSO:
+        return _labels_densos(X, eps, min_samples)
+
+    # ── Grilla: clave entera por celda, puntos ordenados por celda ──
+    lado = eps / np.sqrt(2)
+    celdas = np.floor(X / lado).astype(np.int64)
+    minimo = celdas.min(axis=0)
+    # ±2 de margen para que las celdas alcanzables de los bordes no se solapen
+    alto = int(celdas[:, 1].max() - minimo[1]) + 5
+    claves_punto = (celdas[:, 0] - minimo[0] + 2) * alto + (celdas[:, 1] - minimo[1] + 2)
+
+    orden = np.argsort(claves_punto, kind="stable")
+    claves, inicio, conteo = np.unique(claves_punto[orden], return_index=True, return_counts=True)
+    celda_de = np.empty(n, dtype=np.int64)
+    celda_de[orden] = np.repeat(np.arange(len(claves)), conteo)
+
+    def vecina(celda_idx, dx, dy):
+        """Índice de la celda desplazada (dx, dy), o -1 si está vacía."""
+        buscada = claves[celda_idx] + dx * alto + dy
+        pos = np.minimum(np.searchsorted(claves, buscada), len(claves) - 1)
+        return np.where(claves[pos] == buscada, pos, -1)
+
+    def pares_cercanos(origen):
+        """Pares (i, j) con j en una celda alcanzable desde i y dist ≤ eps."""
+        pares_i, pares_j = [], []
+        for dx, dy in _ALCANZABLES:
+            v = vecina(celda_de[origen], dx, dy)
+            con = v >= 0
+            duenio, pos = _expandir(inicio[v[con]], conteo[v[con]])
+            i, j = origen[con][duenio], orden[pos]
+            cerca = np.einsum("ij,ij->i", X[i] - X[j], X[i] - X[j]) <= eps * eps
+            pares_i.append(i[cerca])
+            pares_j.append(j[cerca])
+        return np.concatenate(pares_i), np.concatenate(pares_j)
+
+    # ── 1. Puntos core ──
+    densa = conteo >= min_samples
+    core = densa[celda_de]
+    ralos = np.flatnonzero(~core)
+    vec_i, vec_j = pares_cercanos(ralos)
+    core[ralos] = np.bincount(vec_i, minlength=n)[ralos] >= min_samples
+    if not core.any():
+        return etiquetas
+
+    # ── 2. Enlaces entre celdas con puntos core ──
+    idx_core = np.flatnonzero(core)
+    idx_core = idx_core[np.argsort(celda_de[idx_core], kind="stable")]
+    celdas_core, ini_core, n_core = np.unique(celda_de[idx_core], return_index=True, return_counts=True)
+    es_core_celda = np.full(len(claves), -1, dtype=np.int64)
+    es_core_celda[celdas_core] = np.arange(len(celdas_core))
+    # Posición de cada punto core dentro de su celda, en unidades de celda
+    locales = X[idx_core] / lado - celdas[idx_core]
+    celda_core_de = np.repeat(np.arange(len(celdas_core)), n_core)
+
+    def representantes(dx, dy):
+        """
+        Por celda core, ~MAX_REPRESENTANTES puntos core más cerca de la celda
+        desplazada (dx, dy). Sin ordenar (O(N)): la distancia se cuantiza en
+        _NIVELES y por celda se corta en el primer nivel que junta
+        MAX_REPRESENTANTES puntos.
+
+        Returns:
+            (inicio, cantidad, puntos): los elegidos de la celda c son
+            puntos[inicio[c] : inicio[c] + cantidad[c]].
+        """
+        d = np.clip(locales, (dx, dy), (dx + 1, dy + 1)) - locales
+        # Nivel 0.._NIVELES-1 si es alcanzable (distancia ≤ eps = √2 celdas)
+        nivel = (np.einsum("ij,ij->i", d, d) * (_NIVELES / 2)).astype(np.int64)
+        alcanzable = nivel < _NIVELES
+        duenio, p, nivel = celda_core_de[alcanzable], idx_core[alcanzable], nivel[alcanzable]
+
+        por_nivel = np.bincount(duenio * _NIVELES + nivel, minlength=len(celdas_core) * _NIVELES)
+        acumulado = np.cumsum(por_nivel.reshape(-1, _NIVELES), axis=1)
+        corte = (acumulado < MAX_REPRESENTANTES).sum(axis=1)
+        elegido = nivel <= corte[duenio]
+        duenio, p = duenio[elegido], p[elegido]
+        # Tope duro por si el nivel de corte está muy poblado (duenio viene agrupado)
+        cantidad = np.bincount(duenio, minlength=len(celdas_core))
+        inicio_sel = np.cumsum(cantidad) - cantidad
+        elegido = np.arange(len(p)) - inicio_sel[duenio] < MAX_REPRESENTANTES
+        cantidad = np.minimum(cantidad, MAX_REPRESENTANTES)
+        return np.cumsum(cantidad) - cantidad, cantidad, p[elegido]
+
+    origenes, destinos = [], []
+    for dx, dy in _ALCANZABLES:
+        if (dx, dy) <= (0, 0):
+            continue  # cada par de celdas una sola vez; la propia no hace falta
+        v = vecina(celdas_core, dx, dy)
+        a = np.flatnonzero(v >= 0)
+        b = es_core_celda[v[a]]
+        a, b = a[b >= 0], b[b >= 0]
+        if len(a) == 0:
+            continue
+        ia, na, pa = representantes(dx, dy)
+        ib, nb, pb = representantes(-dx, -dy)
+        ia, na, ib, nb = ia[a], na[a], ib[b], nb[b]
+        # Primero unos pocos representantes por lado (alcanza para casi todas
+        # las celdas densas vecinas); los pares sin enlace, con todos
+        for tope in (_PRIMERA_RONDA, MAX_REPRESENTANTES):
+            ra, rb = np.minimum(na, tope), np.minimum(nb, tope)
+            # Producto cartesiano representantes(a) × representantes(b) por par
+            par, k = _expandir(np.zeros(len(a), dtype=np.int64), ra * rb)
+            p = pa[ia[par] + k // rb[par]]
+            q = pb[ib[par] + k % rb[par]]
+            cerca = np.einsum("ij,ij->i", X[p] - X[q], X[p] - X[q]) <= eps * eps
+            enlazados = np.unique(par[cerca])
+            origenes.append(a[enlazados])
+            destinos.append(b[enlazados])
+            resto = np.ones(len(a), dtype=bool)
+            resto[enlazados] = False
+            a, b, ia, na, ib, nb = a[resto], b[resto], ia[resto], na[resto], ib[resto], nb[resto]
+
+    m = len(celdas_core)
+    origen = np.concatenate(origenes) if origenes else np.zeros(0, dtype=np.int64)
+    destino = np.concatenate(destinos) if destinos else np.zeros(0, dtype=np.int64)
+    grafo = coo_matrix((np.ones(len(origen), dtype=np.int8), (origen, destino)), shape=(m, m))
+    _, componente = connected_components(grafo, directed=False)
+    etiquetas[idx_core] = componente[es_core_celda[celda_de[idx_core]]]
+
+    # ── 3. Border: no core con algún core a ≤ eps ──
+    vecino_core = core[vec_j] & ~core[vec_i]
+    borde_i, borde_j = vec_i[vecino_core], vec_j[vecino_core]
+    etiquetas[borde_i] = etiquetas[borde_j]
+
+    return _renumerar(etiquetas)
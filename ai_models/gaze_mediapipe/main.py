@@ -16,6 +16,7 @@ from datetime import datetime, timezone
 from dotenv import load_dotenv
 load_dotenv()
 
+from formato_gaze import extraer_mensaje, leer_bandera
 from worker import procesar_gaze
 
 # --- LOGGER ESTRUCTURADO ---
@@ -54,15 +55,17 @@ def publicar_evidencia(channel, evento):
 # --- CALLBACK ---
 def on_message(ch, method, properties, body):
     try:
-        payload = json.loads(body)
+        # JSON con lista de pares (clientes viejos) o formato compacto
+        # (base64 en gaze_buffer o cuerpo binario, ver formato_gaze.py)
+        payload, buffer_coordenadas = extraer_mensaje(body, properties)
         user_id = payload.get("user_id")
         sesion_id = payload.get("sesion_id")
-        buffer_coordenadas = payload.get("gaze_buffer", [])
 
         logger.info(f"Procesando buffer de mirada de {user_id}...")
 
         # Delegar TODA la lógica al worker
-        evento = procesar_gaze(user_id, sesion_id, buffer_coordenadas)
+        evento = procesar_gaze(user_id, sesion_id, buffer_coordenadas,
+                               calibracion=leer_bandera(payload.get("calibration", False)))
 
         if evento:
             publicar_evidencia(ch, evento)
@@ -0,0 +1,125 @@
+"""
+modelos_sesion.py — Modelo base de anomalías de mirada por sesión
+=================================================================
+analyze_gaze_buffer() reajusta un IsolationForest(contamination=0.2) en
+cada buffer: 100 árboles por mensaje y, por construcción, ~20% de los
+puntos de CUALQUIER buffer salen como anomalía.
+
+Con GAZE_ANOMALY_MODE=sesion, cada sesión ajusta UNA vez un modelo base
+con su calibración (mensajes con "calibration": true) o con sus primeros
+GAZE_BASELINE_BUFFERS buffers; los buffers siguientes solo se puntúan con
+predict(). anomaly_ratio pasa a significar "fracción de puntos atípicos
+respecto del comportamiento habitual de ESTE estudiante" (≈
+GAZE_BASELINE_CONTAMINATION si no cambió nada).
+
+Los modelos viven en memoria del proceso con expulsión LRU/TTL.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+from analyzer import saccade_mask
+
+# "refit" (default, ajuste por buffer) | "sesion" (modelo base por sesión)
+GAZE_ANOMALY_MODE = os.environ.get("GAZE_ANOMALY_MODE", "refit")
+# Buffers acumulados antes de ajustar el modelo base (si no hubo calibración)
+GAZE_BASELINE_BUFFERS = int(os.environ.get("GAZE_BASELINE_BUFFERS", "3"))
+# Fracción de puntos del propio baseline que se consideran atípicos
+GAZE_BASELINE_CONTAMINATION = float(os.environ.get("GAZE_BASELINE_CONTAMINATION", "0.05"))
+GAZE_BASELINE_MAX_SESIONES = int(os.environ.get("GAZE_BASELINE_MAX_SESIONES", "5000"))
+# Un examen dura horas: el TTL cuenta desde el último buffer de la sesión
+GAZE_BASELINE_TTL_S = float(os.environ.get("GAZE_BASELINE_TTL_S", "3600"))
+
+
+class ModelosSesion:
+    """Modelo base IsolationForest por sesión, con expulsión LRU/TTL."""
+
+    def __init__(self, buffers_baseline: int = 3, contamination: float = 0.05,
+                 max_sesiones: int = 5000, ttl_s: float = 3600.0,
+                 min_puntos: int = 45, max_puntos: int = 5000):
+        self.buffers_baseline = buffers_baseline
+        self.contamination = contamination
+        self.max_sesiones = max_sesiones
+        self.ttl_s = ttl_s
+        self.min_puntos = min_puntos
+        self.max_puntos = max_puntos
+        self._sesiones = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _estado(self, sesion_id: str) -> dict:
+        """Estado vigente de la sesión (lo crea o lo renueva). Requiere el lock."""
+        ahora = time.time()
+        estado = self._sesiones.get(sesion_id)
+        if estado is None or ahora - estado["ultimo"] > self.ttl_s:
+            estado = {"modelo": None, "pendientes": [], "buffers": 0,
+                      "calibracion": np.zeros((0, 2)), "ultimo": ahora}
+        estado["ultimo"] = ahora
+        self._sesiones[sesion_id] = estado
+        self._sesiones.move_to_end(sesion_id)
+        while len(self._sesiones) > self.max_sesiones:
+            self._sesiones.popitem(last=False)
+        return estado
+
+    def _ajustar(self, puntos: np.ndarray) -> IsolationForest:
+        return IsolationForest(contamination=self.contamination, random_state=42).fit(puntos)
+
+    @staticmethod
+    def _limpiar(puntos) -> np.ndarray:
+        puntos = np.asarray(puntos, dtype=np.float64)
+        return puntos[saccade_mask(puntos)]
+
+    def obtener(self, sesion_id: str) -> IsolationForest | None:
+        """Modelo base de la sesión, o None si todavía no hay."""
+        with self._lock:
+            return self._estado(sesion_id)["modelo"]
+
+    def acumular(self, sesion_id: str, puntos) -> IsolationForest | None:
+        """
+        Suma un buffer (ya sin sacadas) al baseline pendiente y ajusta el
+        modelo al completar `buffers_baseline` buffers con puntos suficientes.
+        """
+        limpios = self._limpiar(puntos)
+        with self._lock:
+            estado = self._estado(sesion_id)
+            if estado["modelo"] is not None:
+                return estado["modelo"]
+            estado["pendientes"].append(limpios)
+            estado["buffers"] += 1
+            base = np.concatenate(estado["pendientes"])[-self.max_puntos:]
+            if estado["buffers"] < self.buffers_baseline or len(base) < self.min_puntos:
+                estado["pendientes"] = [base]
+                return None
+
+        # El ajuste (100 árboles) corre fuera del lock
+        modelo = self._ajustar(base)
+        with self._lock:
+            estado = self._estado(sesion_id)
+            estado["modelo"], estado["pendientes"] = modelo, []
+        return modelo
+
+    def calibrar(self, sesion_id: str, puntos) -> IsolationForest | None:
+        """
+        Suma un buffer de calibración y reajusta el modelo base con toda la
+        calibración de la sesión (tiene prioridad sobre los primeros buffers).
+        """
+        limpios = self._limpiar(puntos)
+        with self._lock:
+            estado = self._estado(sesion_id)
+            base = np.concatenate([estado["calibracion"], limpios])[-self.max_puntos:]
+            estado["calibracion"] = base
+        if len(base) < self.min_puntos:
+            return None
+
+        modelo = self._ajustar(base)
+        with self._lock:
+            estado = self._estado(sesion_id)
+            estado["modelo"], estado["pendientes"] = modelo, []
+        return modelo
+
+    def __len__(self):
+        return len(self._sesiones)
@@ -2,13 +2,26 @@
 test.py — Tests unitarios para el Worker de Gaze Tracking
 ==========================================================
 Testea soft_evidence.normalizar_gaze() sin necesidad de tener
-coordenadas de mirada reales ni DBSCAN/IsolationForest.
+coordenadas de mirada reales, y la paridad de la ruta vectorizada
+analyzer.analyze_gaze_array() con analyze_gaze_buffer() sobre buffers
+sintéticos, el modelo base de anomalías por sesión (modelos_sesion.py),
+la ventana deslizante por sesión (ventana.py) y el backend de clustering
+por grilla (grid_clustering.py) contra DBSCAN de sklearn, y el formato
+binario compacto de q_gaze (formato_gaze.py).
 
 Ejecutar:  python test.py
 """
 
 import json
+import numpy as np
 from soft_evidence import normalizar_gaze
+from analyzer import analyze_gaze_buffer, analyze_gaze_array
+from modelos_sesion import ModelosSesion
+from analyzer import saccade_mask, out_of_bounds_mask
+from ventana import AnilloGaze, EstadosMemoria, agregar_y_ventana
+from analyzer import cluster_labels, secondary_cluster_ratio_from_labels
+from types import SimpleNamespace
+import formato_gaze
 
 # ====================================================================
 # CONSTANTES
@@ -112,6 +125,177 @@ d2 = normalizar_gaze(0.5, 0.2, 0.3)
 assert d1["Concentrado"] > d2["Concentrado"], \
     "Concentrado debería ser inversamente proporcional a las alertas"
 
+# ====================================================================
+# TESTS: analyzer.analyze_gaze_array (paridad con la ruta de tuplas)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: analyzer.analyze_gaze_array() == analyze_gaze_buffer()")
+print("=" * 60)
+
+
+def buffer_sintetico(rng, n):
+    """Fijación central + 2do foco + puntos fuera de pantalla + sacadas."""
+    centro = rng.normal(0.0, 0.08, (n, 2))
+    foco = rng.normal([0.6, -0.5], 0.05, (n, 2))
+    fuera = rng.uniform(-1.6, 1.6, (n, 2))
+    tipo = rng.choice(3, n, p=[0.6, 0.25, 0.15])
+    puntos = np.where(tipo[:, None] == 0, centro, np.where(tipo[:, None] == 1, foco, fuera))
+    return np.cumsum(rng.normal(0, 0.02, (n, 2)), axis=0) * 0.1 + puntos
+
+
+rng = np.random.default_rng(7)
+casos = [buffer_sintetico(rng, n) for n in (10, 15, 16, 40, 150, 600)]
+casos += [buffer_sintetico(rng, 150).astype(np.float32)]
+# Sacadas justo en el umbral (0.5) y saltos que vacían el buffer
+casos.append(np.array([[0.0, 0.0], [0.5, 0.0], [0.3, 0.4], [0.0, 0.0]] * 6))
+casos.append(np.array([[0.0, 0.0], [0.9, 0.9]] * 10))
+
+for puntos in casos:
+    esperado = analyze_gaze_buffer(puntos.tolist())
+    obtenido = analyze_gaze_array(puntos)
+    assert obtenido == esperado, f"{len(puntos)} pts ({puntos.dtype}): {obtenido} != {esperado}"
+print(f"✅ Paridad bit a bit en {len(casos)} buffers (float64 y float32)")
+
+# ====================================================================
+# TESTS: modelos_sesion.ModelosSesion
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: modelos_sesion.ModelosSesion")
+print("=" * 60)
+
+modelos = ModelosSesion(buffers_baseline=3, contamination=0.05, max_sesiones=2, ttl_s=60)
+fijacion = lambda: rng.normal(0.0, 0.08, (150, 2))  # noqa: E731
+assert modelos.acumular("s1", fijacion()) is None
+assert modelos.acumular("s1", fijacion()) is None
+assert modelos.acumular("s1", fijacion()) is not None, "El 3er buffer debería ajustar el modelo base"
+modelo = modelos.obtener("s1")
+
+# Mismo comportamiento que el baseline → pocas anomalías; errático → muchas
+normal = analyze_gaze_array(fijacion(), modelo)["anomaly_ratio"]
+erratico = analyze_gaze_array(np.cumsum(rng.normal(0, 0.1, (150, 2)), axis=0) * 0.3, modelo)["anomaly_ratio"]
+assert normal < 0.15 and erratico > 0.5, f"normal={normal}, errático={erratico}"
+# Con refit por buffer, ~20% de anomalías en cualquier buffer
+assert analyze_gaze_array(fijacion())["anomaly_ratio"] >= 0.19
+
+assert modelos.calibrar("s2", fijacion()[:10]) is None, "Calibración con muy pocos puntos"
+assert modelos.calibrar("s2", fijacion()) is not None
+modelos.obtener("s3")                           # expulsa la sesión menos reciente
+assert len(modelos) == 2 and modelos.obtener("s1") is None
+print("✅ Modelo base por sesión (baseline, calibración, LRU)")
+
+# ====================================================================
+# TESTS: ventana.AnilloGaze (contadores incrementales)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: ventana.AnilloGaze / agregar_y_ventana")
+print("=" * 60)
+
+flujo = buffer_sintetico(rng, 1000).astype(np.float32)
+flujo[::37] += 0.9                              # sacadas repartidas
+anillo = AnilloGaze(150)
+inicio = 0
+for tam in rng.integers(1, 60, 40):            # mensajes de tamaño variable (incluye cortos)
+    anillo.agregar(flujo[inicio:inicio + tam])
+    inicio += tam
+    # Los contadores deben coincidir con recalcular todo sobre la ventana
+    f64 = flujo[:inicio].astype(np.float64)
+    limpio = saccade_mask(f64)[-150:]
+    oob = out_of_bounds_mask(f64)[-150:]
+    assert anillo.n_limpios == int(limpio.sum()), f"limpios tras {inicio} pts"
+    assert anillo.n_oob == int((limpio & oob).sum()), f"OOB tras {inicio} pts"
+    assert np.array_equal(anillo.limpios(), f64[-150:][limpio])
+
+copia = AnilloGaze.desde_dict(anillo.a_dict())
+assert copia.n_oob == anillo.n_oob and np.array_equal(copia.limpios(), anillo.limpios())
+
+estados_v = EstadosMemoria(max_sesiones=10, ttl_s=60)
+emisiones = [agregar_y_ventana(estados_v, "s1", flujo[i:i + 10], capacidad=150, hop=75)
+             for i in range(0, 300, 10)]
+# Se emite al cruzar 75 puntos nuevos: a los 80, 160 y 240 (mensajes de 10)
+assert sum(e is not None for e in emisiones) == 3, "Una evidencia cada ≥75 puntos nuevos"
+assert emisiones[0] is None, "Un buffer de 10 puntos se acumula, no se descarta"
+print("✅ Ventana deslizante con contadores OOB incrementales")
+
+# ====================================================================
+# TESTS: grid_clustering (backend "grid" vs DBSCAN)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: cluster_labels(backend='grid') vs DBSCAN")
+print("=" * 60)
+
+# Buffers chicos (matriz N×N) → etiquetas idénticas; grandes (grilla) →
+# mismo ruido y cantidad de clústeres (solo un border alcanzable desde dos
+# clústeres puede cambiar de clúster)
+for n in (15, 150, 256, 1000, 5000):
+    X = buffer_sintetico(rng, n)
+    ref, grid = cluster_labels(X, "dbscan"), cluster_labels(X, "grid")
+    if n <= 256:
+        assert np.array_equal(ref, grid), f"{n} pts: etiquetas distintas"
+    assert np.array_equal(ref < 0, grid < 0), f"{n} pts: ruido distinto"
+    assert ref.max() == grid.max(), f"{n} pts: cantidad de clústeres distinta"
+    dif = abs(secondary_cluster_ratio_from_labels(ref) - secondary_cluster_ratio_from_labels(grid))
+    assert dif < 0.01, f"{n} pts: secondary_cluster_ratio difiere en {dif}"
+print("✅ Clustering por grilla equivalente a DBSCAN")
+
+# ====================================================================
+# TESTS: formato_gaze (formato compacto de q_gaze)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: formato_gaze.extraer_mensaje()")
+print("=" * 60)
+
+puntos = buffer_sintetico(rng, 150)
+f32 = puntos.astype(np.float32)
+meta = {"user_id": "u1", "sesion_id": "s1"}
+
+# JSON viejo: la lista pasa intacta
+payload, buf = formato_gaze.extraer_mensaje(json.dumps({**meta, "gaze_buffer": puntos.tolist()}).encode())
+assert buf == puntos.tolist() and payload == meta
+
+# base64 float32 en JSON: exacto a float32, vista sin copia del frame
+payload, buf = formato_gaze.extraer_mensaje(json.dumps({**meta, "gaze_buffer": formato_gaze.codificar_base64(puntos)}).encode())
+assert payload == meta and buf.dtype == np.float32 and np.array_equal(buf, f32)
+frame = formato_gaze.codificar_buffer(puntos)
+assert not formato_gaze.decodificar_buffer(frame).flags.owndata, "float32 debería decodificarse sin copia"
+
+# Cuerpo binario int16 con metadatos en headers: error ≤ medio paso de cuantización
+props = SimpleNamespace(content_type=formato_gaze.CONTENT_TYPE_BINARIO, headers={**meta, "calibration": True})
+payload, buf = formato_gaze.extraer_mensaje(formato_gaze.codificar_buffer(puntos, formato_gaze.DTYPE_INT16), props)
+assert payload["calibration"] is True and payload["sesion_id"] == "s1"
+assert np.abs(buf - puntos).max() <= 0.5 / formato_gaze.ESCALA_INT16 + 1e-6
+
+# El analizador da lo mismo con el frame float32 que con la lista de esos float32
+assert analyze_gaze_array(formato_gaze.decodificar_buffer(frame)) == analyze_gaze_buffer(f32.tolist())
+
+for malo in (frame[:-4], b"XX" + frame[2:], frame[:2] + bytes([9]) + frame[3:], "no-es-base64!"):
+    try:
+        formato_gaze.decodificar_buffer(malo)
+        raise AssertionError("Frame inválido aceptado")
+    except ValueError:
+        pass
+
+# Escala int16 nula o no finita en la cabecera → ValueError (no división por cero)
+for escala in (0.0, float("nan")):
+    malo = bytearray(formato_gaze.codificar_buffer(puntos, formato_gaze.DTYPE_INT16))
+    malo[8:12] = np.float32(escala).tobytes()
+    try:
+        formato_gaze.decodificar_buffer(bytes(malo))
+        raise AssertionError(f"Escala {escala} aceptada")
+    except ValueError:
+        pass
+
+# calibration en headers AMQP llega como texto: "false" no es True
+for valor, esperado in ((True, True), ("true", True), ("1", True), (b"True", True), (1, True),
+                        (False, False), ("false", False), ("0", False), ("", False), (None, False)):
+    assert formato_gaze.leer_bandera(valor) is esperado, valor
+for valor in ("quizas", 0.5):
+    try:
+        formato_gaze.leer_bandera(valor)
+        raise AssertionError(f"{valor!r} aceptado como booleano")
+    except ValueError:
+        pass
+print("✅ Formato compacto (base64 / binario, float32 / int16) y JSON viejo")
+
 print(f"\n{'=' * 60}")
 print(f"Resultado: {passed}/{total} tests pasaron")
 if passed == total:
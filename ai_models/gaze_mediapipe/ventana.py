@@ -0,0 +1,251 @@
+"""
+ventana.py — Análisis de mirada por ventana deslizante por sesión
+=================================================================
+Cada mensaje de q_gaze trae ~5 s de puntos y se analizaba aislado: los
+buffers de menos de 15 puntos se descartaban y cada análisis empezaba
+de cero.
+
+Con GAZE_SLIDING_WINDOW=1 cada sesión tiene un anillo (AnilloGaze) de
+GAZE_WINDOW_POINTS puntos float32. Los puntos nuevos entran al anillo
+(también los de buffers cortos) y se mantienen de forma incremental:
+
+  • máscara de sacadas:  cada punto se compara con el anterior recibido,
+                         aunque haya llegado en el mensaje previo.
+  • contadores OOB:      puntos limpios y puntos limpios fuera de pantalla
+                         en el anillo (se restan los que salen).
+
+Cada GAZE_WINDOW_HOP puntos nuevos se emite evidencia sobre la ventana
+completa: el OOB sale de los contadores y solo DBSCAN + Isolation Forest
+corren sobre los puntos limpios de la ventana.
+
+Estado: en memoria del proceso (LRU/TTL) o, con GAZE_WINDOW_BACKEND=redis,
+en Redis (REDIS_HOST/REDIS_PORT/REDIS_PASSWORD) para que varios consumers
+de q_gaze compartan las sesiones.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+GAZE_SLIDING_WINDOW = os.environ.get("GAZE_SLIDING_WINDOW", "0") == "1"
+# Tamaño de la ventana (puntos) y puntos nuevos entre evidencias
+GAZE_WINDOW_POINTS = int(os.environ.get("GAZE_WINDOW_POINTS", "150"))
+GAZE_WINDOW_HOP = int(os.environ.get("GAZE_WINDOW_HOP", "75"))
+# "memoria" | "redis"
+GAZE_WINDOW_BACKEND = os.environ.get("GAZE_WINDOW_BACKEND", "memoria")
+GAZE_WINDOW_MAX_SESIONES = int(os.environ.get("GAZE_WINDOW_MAX_SESIONES", "5000"))
+GAZE_WINDOW_TTL_S = float(os.environ.get("GAZE_WINDOW_TTL_S", "300"))
+
+# Mismos umbrales que analyzer.detect_saccade_noise / is_out_of_bounds
+MAX_SALTO = 0.5
+LIMITE_PANTALLA = 1.0
+MIN_PUNTOS = 15
+
+
+class AnilloGaze:
+    """Ventana circular de puntos de mirada con contadores OOB incrementales."""
+
+    def __init__(self, capacidad: int):
+        self.capacidad = capacidad
+        self.puntos = np.zeros((capacidad, 2), dtype=np.float32)
+        self.limpio = np.zeros(capacidad, dtype=bool)
+        self.oob = np.zeros(capacidad, dtype=bool)
+        self.cabeza = 0          # próxima posición a escribir
+        self.n = 0               # puntos en el anillo
+        self.total = 0           # puntos recibidos en toda la sesión
+        self.n_limpios = 0
+        self.n_oob = 0           # limpios Y fuera de pantalla
+        self.ultimo = None       # último punto recibido (para las sacadas)
+        self.ultima_emision = 0  # `total` al emitir la última evidencia
+
+    def agregar(self, nuevos):
+        """Agrega puntos (M, 2) al anillo actualizando máscaras y contadores."""
+        nuevos = np.asarray(nuevos, dtype=np.float32).reshape(-1, 2)
+        m = len(nuevos)
+        if m == 0:
+            return
+
+        # Máscara de sacadas contra el punto anterior (aunque sea de otro
+        # mensaje); en float64 como analyzer.saccade_mask
+        previos = nuevos[:-1].astype(np.float64)
+        if self.ultimo is not None:
+            previos = np.concatenate([np.asarray([self.ultimo], dtype=np.float64), previos])
+        actuales = nuevos.astype(np.float64)
+        limpio = np.ones(m, dtype=bool)
+        desde = 0 if self.ultimo is not None else 1
+        dif = actuales[desde:] - previos
+        limpio[desde:] = np.sqrt(dif[:, 0] ** 2 + dif[:, 1] ** 2) <= MAX_SALTO
+        oob = np.any(np.abs(actuales) > LIMITE_PANTALLA, axis=1)
+
+        self.total += m
+        self.ultimo = nuevos[-1].tolist()
+        if m > self.capacidad:
+            nuevos, limpio, oob = nuevos[-self.capacidad:], limpio[-self.capacidad:], oob[-self.capacidad:]
+            m = self.capacidad
+
+        posiciones = (self.cabeza + np.arange(m)) % self.capacidad
+        # Las primeras (capacidad - n) posiciones estaban libres; el resto pisa
+        # los puntos más viejos, que salen de los contadores
+        pisadas = posiciones[self.capacidad - self.n:]
+        self.n_limpios -= int(np.count_nonzero(self.limpio[pisadas]))
+        self.n_oob -= int(np.count_nonzero(self.limpio[pisadas] & self.oob[pisadas]))
+
+        self.puntos[posiciones] = nuevos
+        self.limpio[posiciones] = limpio
+        self.oob[posiciones] = oob
+        self.n_limpios += int(np.count_nonzero(limpio))
+        self.n_oob += int(np.count_nonzero(limpio & oob))
+        self.cabeza = (self.cabeza + m) % self.capacidad
+        self.n = min(self.capacidad, self.n + m)
+
+    def orden(self) -> np.ndarray:
+        """Posiciones del anillo del punto más viejo al más nuevo."""
+        return (self.cabeza - self.n + np.arange(self.n)) % self.capacidad
+
+    def limpios(self) -> np.ndarray:
+        """Puntos sin sacadas de la ventana, en orden temporal (float64)."""
+        orden = self.orden()
+        return self.puntos[orden][self.limpio[orden]].astype(np.float64)
+
+    @property
+    def oob_ratio(self) -> float:
+        return self.n_oob / self.n_limpios if self.n_limpios else 0.0
+
+    def debe_emitir(self, hop: int) -> bool:
+        return self.total - self.ultima_emision >= hop and self.n_limpios >= MIN_PUNTOS
+
+    # ── Serialización (backend Redis) ──
+    _META = ("capacidad", "cabeza", "n", "total", "n_limpios", "n_oob", "ultimo", "ultima_emision")
+
+    def a_dict(self) -> dict:
+        return {
+            "puntos": self.puntos.tobytes(),
+            "limpio": np.packbits(self.limpio).tobytes(),
+            "oob": np.packbits(self.oob).tobytes(),
+            "meta": json.dumps({k: getattr(self, k) for k in self._META}),
+        }
+
+    @classmethod
+    def desde_dict(cls, datos: dict) -> "AnilloGaze":
+        meta = json.loads(datos["meta"])
+        anillo = cls(meta["capacidad"])
+        for k in cls._META:
+            setattr(anillo, k, meta[k])
+        cap = anillo.capacidad
+        anillo.puntos = np.frombuffer(datos["puntos"], dtype=np.float32).reshape(cap, 2).copy()
+        anillo.limpio = np.unpackbits(np.frombuffer(datos["limpio"], dtype=np.uint8), count=cap).astype(bool)
+        anillo.oob = np.unpackbits(np.frombuffer(datos["oob"], dtype=np.uint8), count=cap).astype(bool)
+        return anillo
+
+
+class EstadosMemoria:
+    """Anillos por sesión en memoria del proceso, con expulsión LRU/TTL."""
+
+    def __init__(self, max_sesiones: int = 5000, ttl_s: float = 300.0):
+        self.max_sesiones = max_sesiones
+        self.ttl_s = ttl_s
+        self._sesiones = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def bloqueo(self, sesion_id: str):
+        with self._lock:
+            yield
+
+    def obtener(self, sesion_id: str) -> AnilloGaze | None:
+        entrada = self._sesiones.get(sesion_id)
+        if entrada is None or time.time() - entrada[0] > self.ttl_s:
+            return None
+        return entrada[1]
+
+    def guardar(self, sesion_id: str, anillo: AnilloGaze):
+        self._sesiones[sesion_id] = (time.time(), anillo)
+        self._sesiones.move_to_end(sesion_id)
+        while len(self._sesiones) > self.max_sesiones:
+            self._sesiones.popitem(last=False)
+
+    def __len__(self):
+        return len(self._sesiones)
+
+
+class EstadosRedis:
+    """
+    Anillos por sesión en Redis (hash por sesión con EXPIRE = TTL), para
+    consumers que comparten sesiones. Un lock de Redis por sesión serializa
+    el leer → agregar → guardar entre procesos.
+    """
+
+    def __init__(self, cliente, ttl_s: float = 300.0, prefijo: str = "gaze:ventana"):
+        self.cliente = cliente
+        self.ttl_s = ttl_s
+        self.prefijo = prefijo
+
+    @contextmanager
+    def bloqueo(self, sesion_id: str):
+        with self.cliente.lock(f"{self.prefijo}:lock:{sesion_id}", timeout=10, blocking_timeout=5):
+            yield
+
+    def obtener(self, sesion_id: str) -> AnilloGaze | None:
+        datos = self.cliente.hgetall(f"{self.prefijo}:{sesion_id}")
+        if not datos:
+            return None
+        return AnilloGaze.desde_dict({k.decode(): v for k, v in datos.items()})
+
+    def guardar(self, sesion_id: str, anillo: AnilloGaze):
+        clave = f"{self.prefijo}:{sesion_id}"
+        pipe = self.cliente.pipeline()
+        pipe.hset(clave, mapping=anillo.a_dict())
+        pipe.expire(clave, int(self.ttl_s))
+        pipe.execute()
+
+
+def crear_cliente_redis():
+    """Cliente Redis a partir de REDIS_HOST/REDIS_PORT/REDIS_PASSWORD, o None."""
+    host = os.environ.get("REDIS_HOST")
+    if not host or redis is None:
+        return None
+    return redis.Redis(
+        host=host,
+        port=int(os.environ.get("REDIS_PORT", "6379")),
+        password=os.environ.get("REDIS_PASSWORD") or None,
+        socket_timeout=0.5,
+        socket_connect_timeout=0.5,
+    )
+
+
+def crear_estados():
+    """Backend de estado según GAZE_WINDOW_BACKEND (Redis cae a memoria si no hay cliente)."""
+    if GAZE_WINDOW_BACKEND == "redis":
+        cliente = crear_cliente_redis()
+        if cliente is not None:
+            return EstadosRedis(cliente, GAZE_WINDOW_TTL_S)
+        print("⚠️ GAZE_WINDOW_BACKEND=redis sin REDIS_HOST o sin paquete redis: estado en memoria.")
+    return EstadosMemoria(GAZE_WINDOW_MAX_SESIONES, GAZE_WINDOW_TTL_S)
+
+
+def agregar_y_ventana(estados, sesion_id: str, puntos, capacidad: int = GAZE_WINDOW_POINTS,
+                      hop: int = GAZE_WINDOW_HOP) -> tuple[np.ndarray, float] | None:
+    """
+    Agrega los puntos al anillo de la sesión. Si ya corresponde emitir
+    (≥ hop puntos nuevos desde la última evidencia), retorna
+    (puntos limpios de la ventana, oob_ratio); si no, None.
+    """
+    with estados.bloqueo(sesion_id):
+        anillo = estados.obtener(sesion_id) or AnilloGaze(capacidad)
+        anillo.agregar(puntos)
+        ventana = None
+        if anillo.debe_emitir(hop):
+            anillo.ultima_emision = anillo.total
+            ventana = (anillo.limpios(), anillo.oob_ratio)
+        estados.guardar(sesion_id, anillo)
+    return ventana
@@ -9,39 +9,88 @@ NO conoce RabbitMQ ni colas — eso es trabajo de main.py.
 import logging
 from datetime import datetime, timezone
 
-from analyzer import analyze_gaze_buffer
+import modelos_sesion
+import ventana
+from analyzer import analyze_clean_points, analyze_gaze_array
 from soft_evidence import normalizar_gaze
 
 logger = logging.getLogger("GazeTrackingWorker")
 
+# Modelo base de anomalías por sesión (GAZE_ANOMALY_MODE=sesion); con
+# "refit" cada buffer ajusta su propio Isolation Forest.
+modelos_por_sesion = (
+    modelos_sesion.ModelosSesion(
+        buffers_baseline=modelos_sesion.GAZE_BASELINE_BUFFERS,
+        contamination=modelos_sesion.GAZE_BASELINE_CONTAMINATION,
+        max_sesiones=modelos_sesion.GAZE_BASELINE_MAX_SESIONES,
+        ttl_s=modelos_sesion.GAZE_BASELINE_TTL_S,
+    )
+    if modelos_sesion.GAZE_ANOMALY_MODE == "sesion" else None
+)
+
+# Ventana deslizante por sesión (GAZE_SLIDING_WINDOW=1): los puntos de cada
+# mensaje se acumulan y la evidencia se emite cada GAZE_WINDOW_HOP puntos.
+estados_ventana = ventana.crear_estados() if ventana.GAZE_SLIDING_WINDOW else None
+
 
-def procesar_gaze(user_id: str, sesion_id: str, buffer_coordenadas: list) -> dict | None:
+def procesar_gaze(user_id: str, sesion_id: str, buffer_coordenadas: list,
+                  calibracion: bool = False) -> dict | None:
     """
     Pipeline completo de gaze: validación → análisis IA → soft evidence.
 
     Args:
         user_id:            ID del usuario (estudiante).
         sesion_id:          ID de la sesión de examen.
-        buffer_coordenadas: Lista de tuplas [(x1,y1), (x2,y2), ...] con
-                            las coordenadas de mirada del buffer temporal.
+        buffer_coordenadas: Lista de tuplas [(x1,y1), (x2,y2), ...] o
+                            ndarray (N, 2) con las coordenadas de mirada
+                            del buffer temporal.
+        calibracion:        True si el buffer es de la calibración: solo
+                            alimenta el modelo base de la sesión (no
+                            genera evidencia).
 
     Returns:
         dict con el evento universal de soft evidence listo para encolar,
         o None si los datos son insuficientes o irrecuperables.
     """
-    # 1. Validar datos suficientes
-    if not buffer_coordenadas or len(buffer_coordenadas) < 15:
+    con_ventana = estados_ventana is not None and bool(sesion_id)
+
+    # 1. Validar datos suficientes (con ventana deslizante los buffers
+    #    cortos no se descartan: se suman a la ventana de la sesión)
+    if buffer_coordenadas is None or len(buffer_coordenadas) < (1 if con_ventana else 15):
         logger.info(f"Buffer muy corto para {user_id}, ignorando...")
         return None
 
+    if calibracion:
+        if modelos_por_sesion is not None and sesion_id:
+            modelos_por_sesion.calibrar(sesion_id, buffer_coordenadas)
+        return None
+
     # 2. Análisis con la IA (Heurísticas + DBSCAN + Isolation Forest)
     #    Retorna métricas crudas: oob_ratio, secondary_cluster_ratio, anomaly_ratio
-    resultado_ia = analyze_gaze_buffer(buffer_coordenadas)
+    #    Ruta vectorizada: listas JSON y ndarray (N, 2) por igual
+    modelo = None
+    if modelos_por_sesion is not None and sesion_id:
+        modelo = modelos_por_sesion.obtener(sesion_id)
+
+    if con_ventana:
+        actual = ventana.agregar_y_ventana(estados_ventana, sesion_id, buffer_coordenadas)
+        if actual is None:
+            # Todavía no se juntaron GAZE_WINDOW_HOP puntos nuevos
+            return None
+        puntos_ventana, oob_ratio = actual
+        resultado_ia = analyze_clean_points(puntos_ventana, oob_ratio, modelo)
+    else:
+        resultado_ia = analyze_gaze_array(buffer_coordenadas, modelo)
 
     # Ignorar si los datos son irrecuperables
     if resultado_ia["status"] in ("insufficient_data", "too_much_noise"):
         return None
 
+    if modelos_por_sesion is not None and sesion_id and modelo is None:
+        # Sin modelo base todavía: este buffer se reportó con ajuste propio
+        # y pasa a formar parte del baseline de la sesión
+        modelos_por_sesion.acumular(sesion_id, buffer_coordenadas)
+
     # 3. Generar distribución de probabilidad (Soft Evidence)
     #    normalizar_gaze() aplica pesos relativos + normalización L1
     distribucion = normalizar_gaze(
@@ -50,6 +99,19 @@ def procesar_gaze(user_id: str, sesion_id: str, buffer_coordenadas: list) -> dic
         anomaly_ratio=resultado_ia["anomaly_ratio"],
     )
 
+    details = {
+        "oob_ratio": resultado_ia["oob_ratio"],
+        "secondary_cluster_ratio": resultado_ia["secondary_cluster_ratio"],
+        "anomaly_ratio": resultado_ia["anomaly_ratio"],
+    }
+    if modelos_por_sesion is not None:
+        # Origen de anomaly_ratio: bosque ajustado a este buffer (mientras
+        # se junta el baseline) o modelo base de la sesión
+        details["anomaly_model"] = "baseline" if modelo is not None else "refit"
+    if con_ventana:
+        # Puntos (sin sacadas) de la ventana sobre la que se calculó la evidencia
+        details["window_points"] = len(puntos_ventana)
+
     # 4. Construir evento en formato universal de Soft Evidence
     return {
         "timestamp": datetime.now(timezone.utc).isoformat(),
@@ -58,9 +120,5 @@ def procesar_gaze(user_id: str, sesion_id: str, buffer_coordenadas: list) -> dic
         "source": "gaze_tracker",
         "evidence_type": "soft",
         "soft_evidence": distribucion,
-        "details": {
-            "oob_ratio": resultado_ia["oob_ratio"],
-            "secondary_cluster_ratio": resultado_ia["secondary_cluster_ratio"],
-            "anomaly_ratio": resultado_ia["anomaly_ratio"],
-        }
+        "details": details,
     }
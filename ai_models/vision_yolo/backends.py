@@ -0,0 +1,248 @@
+"""
+backends.py — Backends de inferencia del Worker de Visión
+==========================================================
+VISION_BACKEND elige cómo se corre YOLOv8n:
+
+  • pytorch  (default): ultralytics + PyTorch eager, pesos yolov8n.pt.
+  • onnx:     ONNX Runtime sobre el modelo exportado.
+  • openvino: OpenVINO sobre el mismo .onnx.
+
+Los modelos exportados (exportar_modelo.py) conservan el head completo de
+80 clases COCO: la clase de cada ancla se decide entre las 80 y recién
+después se filtran persona y celular (postproceso.decodificar_salida),
+igual que classes= de ultralytics. Con VISION_INT8=1 se usa la variante
+cuantizada a int8 (QDQ, la ejecutan ambos runtimes).
+
+Todos los detectores exponen detectar(frames, conf, imgsz) → lista de
+arrays (K, 6) [x1, y1, x2, y2, conf, clase COCO] en píxeles de cada
+imagen. Cada frame es una imagen BGR o un FrameLetterbox ya preparado
+(preparar(), ver worker.descargar_frame). test_backends.py mide la
+paridad de los exportados con PyTorch.
+"""
+
+import os
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+from postproceso import decodificar_salida, escalar_cajas
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    import openvino as ov
+except ImportError:
+    ov = None
+
+# Mapeo de IDs de COCO que nos interesan
+CLASS_PERSON = 0
+CLASS_CELLPHONE = 67
+CLASES = (CLASS_PERSON, CLASS_CELLPHONE)
+
+# "pytorch" | "onnx" | "openvino"
+VISION_BACKEND = os.environ.get("VISION_BACKEND", "pytorch")
+VISION_INT8 = os.environ.get("VISION_INT8", "0") == "1"
+VISION_MODEL_DIR = os.environ.get("VISION_MODEL_DIR", "modelos")
+
+NOMBRE_FP32 = "yolov8n.onnx"
+NOMBRE_INT8 = "yolov8n_int8.onnx"
+IMGSZ = 640
+STRIDE = 32
+
+
+# ── Preproceso (igual que LetterBox de ultralytics) ──
+
+def letterbox(imagen: np.ndarray, forma: tuple[int, int], auto: bool = False,
+              stride: int = STRIDE) -> tuple[np.ndarray, float, tuple[int, int]]:
+    """
+    Redimensiona manteniendo la relación de aspecto y rellena con gris 114.
+
+    Args:
+        imagen: BGR (alto, ancho, 3).
+        forma:  (alto, ancho) de la entrada del modelo.
+        auto:   True → relleno mínimo hasta múltiplo de `stride` (rectangular).
+
+    Returns:
+        (imagen letterboxed, escala, (pad_izq, pad_sup)).
+    """
+    alto, ancho = imagen.shape[:2]
+    escala = min(forma[0] / alto, forma[1] / ancho)
+    nuevo = (int(round(ancho * escala)), int(round(alto * escala)))
+    dw, dh = forma[1] - nuevo[0], forma[0] - nuevo[1]
+    if auto:
+        dw, dh = dw % stride, dh % stride
+    dw, dh = dw / 2, dh / 2
+
+    if (ancho, alto) != nuevo:
+        imagen = cv2.resize(imagen, nuevo, interpolation=cv2.INTER_LINEAR)
+    arriba, abajo = int(round(dh - 0.1)), int(round(dh + 0.1))
+    izq, der = int(round(dw - 0.1)), int(round(dw + 0.1))
+    imagen = cv2.copyMakeBorder(imagen, arriba, abajo, izq, der, cv2.BORDER_CONSTANT,
+                                value=(114, 114, 114))
+    return imagen, escala, (izq, arriba)
+
+
+class FrameLetterbox(NamedTuple):
+    """Imagen ya letterboxed a la entrada del modelo + lo necesario para deshacerlo."""
+    imagen: np.ndarray              # (alto, ancho, 3) BGR, lados ≤ imgsz y múltiplos de 32
+    escala: float
+    pad: tuple[int, int]
+    forma: tuple[int, int]          # (alto, ancho) de la imagen de origen
+
+
+def preparar(imagen: np.ndarray, imgsz: int = IMGSZ, auto: bool = True) -> FrameLetterbox:
+    """Letterbox de una imagen BGR a la entrada del modelo (rectangular mínimo si auto=True)."""
+    letterboxed, escala, pad = letterbox(imagen, (imgsz, imgsz), auto=auto)
+    return FrameLetterbox(letterboxed, escala, pad, imagen.shape[:2])
+
+
+def reducir(frame: FrameLetterbox, imgsz: int) -> FrameLetterbox:
+    """
+    FrameLetterbox más grande que `imgsz` (p. ej. la pasada a 320 de la
+    cascada) → letterbox de nuevo a imgsz, componiendo escala y pad.
+    """
+    if max(frame.imagen.shape[:2]) <= imgsz:
+        return frame
+    imagen, escala, pad = letterbox(frame.imagen, (imgsz, imgsz), auto=True)
+    return FrameLetterbox(
+        imagen, frame.escala * escala,
+        (frame.pad[0] * escala + pad[0], frame.pad[1] * escala + pad[1]), frame.forma,
+    )
+
+
+def a_letterbox(frames, imgsz: int = IMGSZ) -> list[FrameLetterbox]:
+    """
+    Letterbox de un lote: los FrameLetterbox pasan tal cual (o se achican
+    si son más grandes que imgsz). Mismo criterio que ultralytics: si todas
+    son imágenes crudas de la misma forma, relleno rectangular mínimo; si
+    no, cuadrado imgsz (para poder apilarlas).
+    """
+    crudas = [f for f in frames if not isinstance(f, FrameLetterbox)]
+    auto = len(crudas) == len(frames) and len({f.shape[:2] for f in crudas}) == 1
+    return [reducir(f, imgsz) if isinstance(f, FrameLetterbox) else preparar(f, imgsz, auto) for f in frames]
+
+
+def igualar_formas(entradas: list[FrameLetterbox]) -> list[np.ndarray]:
+    """
+    Imágenes letterboxed de un lote con la misma forma (para apilarlas):
+    las más chicas se rellenan con gris 114 abajo/a la derecha, así el pad
+    (izq, sup) de cada una sigue valiendo.
+    """
+    alto = max(e.imagen.shape[0] for e in entradas)
+    ancho = max(e.imagen.shape[1] for e in entradas)
+    return [
+        cv2.copyMakeBorder(e.imagen, 0, alto - e.imagen.shape[0], 0, ancho - e.imagen.shape[1],
+                           cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        if e.imagen.shape[:2] != (alto, ancho) else e.imagen
+        for e in entradas
+    ]
+
+
+def a_tensor(imagenes: list[np.ndarray]) -> np.ndarray:
+    """Lote de imágenes BGR letterboxed (mismo tamaño) → (N, 3, H, W) float32 RGB en [0, 1]."""
+    lote = np.stack(imagenes)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(lote, dtype=np.float32) / 255.0
+
+
+# ── Detectores ──
+
+class DetectorUltralytics:
+    """YOLOv8 con ultralytics + PyTorch (comportamiento original)."""
+
+    nombre = "pytorch"
+
+    def __init__(self, pesos: str = "yolov8n.pt", clases=CLASES):
+        # Import diferido: con los backends exportados no se carga PyTorch
+        from ultralytics import YOLO
+        self.model = YOLO(pesos)
+        self.clases = list(clases)
+
+    def detectar(self, frames, conf: float, imgsz: int = IMGSZ) -> list[np.ndarray]:
+        # classes= solo filtra qué clases se reportan: el NMS es por clase,
+        # así que personas y celulares salen igual que sin filtro
+        if not any(isinstance(f, FrameLetterbox) for f in frames):
+            results = self.model(list(frames), conf=conf, classes=self.clases, imgsz=imgsz, verbose=False)
+            return [r.boxes.data.cpu().numpy().astype(np.float32) for r in results]
+
+        # Frames ya letterboxed (lados ≤ imgsz): ultralytics no los vuelve a
+        # achicar y las cajas salen en coordenadas del letterbox
+        entradas = a_letterbox(frames, imgsz)
+        results = self.model([e.imagen for e in entradas], conf=conf, classes=self.clases, imgsz=imgsz, verbose=False)
+        return [
+            escalar_cajas(r.boxes.data.cpu().numpy().astype(np.float32), e.escala, e.pad, e.forma)
+            for r, e in zip(results, entradas)
+        ]
+
+
+class _DetectorExportado:
+    """Pre/post-proceso común de los modelos exportados (salida cruda del head)."""
+
+    nombre = "exportado"
+
+    def __init__(self, clases=CLASES, iou: float = 0.7):
+        self.clases = tuple(clases)
+        self.iou = iou
+
+    def _inferir(self, tensor: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def detectar(self, frames, conf: float, imgsz: int = IMGSZ) -> list[np.ndarray]:
+        entradas = a_letterbox(frames, imgsz)
+        salida = self._inferir(a_tensor(igualar_formas(entradas)))
+        detecciones = decodificar_salida(salida, self.clases, conf, self.iou)
+        return [escalar_cajas(det, e.escala, e.pad, e.forma) for det, e in zip(detecciones, entradas)]
+
+
+class DetectorOnnx(_DetectorExportado):
+    """Modelo exportado con ONNX Runtime (CPU)."""
+
+    nombre = "onnx"
+
+    def __init__(self, ruta: str, clases=CLASES, iou: float = 0.7):
+        super().__init__(clases, iou)
+        opciones = ort.SessionOptions()
+        opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.sesion = ort.InferenceSession(ruta, opciones, providers=["CPUExecutionProvider"])
+        self.entrada = self.sesion.get_inputs()[0].name
+
+    def _inferir(self, tensor):
+        return self.sesion.run(None, {self.entrada: tensor})[0]
+
+
+class DetectorOpenVINO(_DetectorExportado):
+    """Modelo exportado con OpenVINO (CPU, lee el .onnx directamente)."""
+
+    nombre = "openvino"
+
+    def __init__(self, ruta: str, clases=CLASES, iou: float = 0.7):
+        super().__init__(clases, iou)
+        core = ov.Core()
+        self.compilado = core.compile_model(core.read_model(ruta), "CPU", {"PERFORMANCE_HINT": "LATENCY"})
+        self.salida = self.compilado.output(0)
+
+    def _inferir(self, tensor):
+        return self.compilado(tensor)[self.salida]
+
+
+def ruta_modelo(int8: bool = VISION_INT8) -> str:
+    return os.path.join(VISION_MODEL_DIR, NOMBRE_INT8 if int8 else NOMBRE_FP32)
+
+
+def crear_detector(backend: str = VISION_BACKEND, int8: bool = VISION_INT8):
+    """
+    Detector según VISION_BACKEND / VISION_INT8. Si falta el runtime o el
+    modelo exportado, cae a PyTorch.
+    """
+    if backend in ("onnx", "openvino"):
+        ruta = ruta_modelo(int8)
+        runtime = ort if backend == "onnx" else ov
+        if runtime is not None and os.path.exists(ruta):
+            detector = DetectorOnnx(ruta) if backend == "onnx" else DetectorOpenVINO(ruta)
+            detector.nombre = f"{backend}{'-int8' if int8 else ''}"
+            return detector
+        print(f"⚠️ VISION_BACKEND={backend} sin runtime instalado o sin {ruta}: se usa PyTorch.")
+    return DetectorUltralytics()
@@ -0,0 +1,104 @@
+"""
+cascada.py — Cascada de dos resoluciones para el Worker de Visión
+=================================================================
+Con VISION_CASCADE=1, vision_logic corre cada frame primero a
+VISION_CASCADE_IMGSZ (320: ~1/4 del costo de 640) con un umbral bajo
+(VISION_CASCADE_CONF_MIN) para ver también a los candidatos dudosos, y
+solo refina cuando la decisión de negocio depende de ellos:
+
+  • completa: el conteo de personas cambia de categoría (0 / 1 / >1)
+    según se cuenten o no las personas de la banda dudosa
+    [CONF_MIN, CONF_MAX) → se repite el frame a resolución completa.
+  • recorte:  hay celulares en la banda dudosa → se corre una ventana
+    de 320x320 de la entrada de 640 alrededor de ellos, a imgsz 320:
+    misma densidad de píxeles que la pasada completa, al costo de la
+    baja. Si los candidatos no entran en una ventana, pasada completa.
+  • baja:     nada dudoso → vale la pasada baja.
+
+Los celulares (y max_phone_confidence) salen siempre de la pasada de
+mayor resolución que cubre su zona. Cajas: [x1, y1, x2, y2, conf, clase]
+en píxeles de la imagen original; ventanas en píxeles del letterbox.
+"""
+
+import os
+
+import numpy as np
+
+# IDs COCO (mismos que backends.CLASS_PERSON / CLASS_CELLPHONE)
+CLASS_PERSON = 0
+CLASS_CELLPHONE = 67
+
+# "1" activa la cascada; "0" (default) corre todo a resolución completa
+VISION_CASCADE = os.environ.get("VISION_CASCADE", "0") == "1"
+VISION_CASCADE_IMGSZ = int(os.environ.get("VISION_CASCADE_IMGSZ", "320"))
+# Banda dudosa de la pasada baja: [CONF_MIN, CONF_MAX)
+VISION_CASCADE_CONF_MIN = float(os.environ.get("VISION_CASCADE_CONF_MIN", "0.15"))
+VISION_CASCADE_CONF_MAX = float(os.environ.get("VISION_CASCADE_CONF_MAX", "0.70"))
+
+BAJA = "baja"
+RECORTE = "recorte"
+COMPLETA = "completa"
+
+
+def _categoria_personas(n: int) -> int:
+    """Las reglas de negocio solo distinguen 0, 1 o más de 1 persona."""
+    return min(int(n), 2)
+
+
+def decidir(det: np.ndarray, conf_min: float = 0.15, conf_max: float = 0.70):
+    """
+    Qué pasada necesita un frame según sus detecciones de la pasada baja.
+
+    Returns:
+        (BAJA | RECORTE | COMPLETA, cajas (K, 4) de los celulares dudosos o None).
+    """
+    clases, confianzas = det[:, 5], det[:, 4]
+    personas = confianzas[clases == CLASS_PERSON]
+    if _categoria_personas((personas >= conf_min).sum()) != _categoria_personas((personas >= conf_max).sum()):
+        return COMPLETA, None
+
+    dudosos = (clases == CLASS_CELLPHONE) & (confianzas >= conf_min) & (confianzas < conf_max)
+    if dudosos.any():
+        return RECORTE, det[dudosos, :4]
+    return BAJA, None
+
+
+def ventana_recorte(cajas: np.ndarray, escala: float, pad, forma_letterbox, lado: int = 320):
+    """
+    Esquina (x0, y0) de la ventana lado×lado del letterbox centrada en las
+    `cajas` (píxeles originales), o None si no entran en una ventana o el
+    letterbox es más chico que la ventana.
+    """
+    alto, ancho = forma_letterbox
+    if alto < lado or ancho < lado:
+        return None
+    x1 = cajas[:, 0].min() * escala + pad[0]
+    y1 = cajas[:, 1].min() * escala + pad[1]
+    x2 = cajas[:, 2].max() * escala + pad[0]
+    y2 = cajas[:, 3].max() * escala + pad[1]
+    if x2 - x1 > lado or y2 - y1 > lado:
+        return None
+    x0 = int(np.clip(round((x1 + x2 - lado) / 2), 0, ancho - lado))
+    y0 = int(np.clip(round((y1 + y2 - lado) / 2), 0, alto - lado))
+    return x0, y0
+
+
+def recortar(frame, x0: int, y0: int, lado: int = 320):
+    """FrameLetterbox de la ventana: mismo mapeo al original con el pad corrido."""
+    imagen = np.ascontiguousarray(frame.imagen[y0:y0 + lado, x0:x0 + lado])
+    return frame._replace(imagen=imagen, pad=(frame.pad[0] - x0, frame.pad[1] - y0))
+
+
+def combinar(det_baja: np.ndarray, det_recorte: np.ndarray, recorte) -> np.ndarray:
+    """
+    Personas de la pasada baja + celulares del recorte + celulares de la
+    pasada baja fuera de la ventana (`recorte`, FrameLetterbox de recortar()).
+    """
+    alto, ancho = recorte.imagen.shape[:2]
+    x1, y1 = -recorte.pad[0] / recorte.escala, -recorte.pad[1] / recorte.escala
+    x2, y2 = x1 + ancho / recorte.escala, y1 + alto / recorte.escala
+    cx = (det_baja[:, 0] + det_baja[:, 2]) / 2
+    cy = (det_baja[:, 1] + det_baja[:, 3]) / 2
+    dentro = (cx >= x1) & (cx < x2) & (cy >= y1) & (cy < y2)
+    conservar = (det_baja[:, 5] != CLASS_CELLPHONE) | ~dentro
+    return np.concatenate([det_baja[conservar], det_recorte[det_recorte[:, 5] == CLASS_CELLPHONE]])
@@ -0,0 +1,120 @@
+"""
+exportar_modelo.py — Exporta YOLOv8n para los backends ONNX / OpenVINO
+=======================================================================
+Se corre al construir la imagen (ver Dockerfile), después de descargar
+yolov8n.pt:
+
+  1. Exporta a ONNX con batch y tamaño de entrada dinámicos
+     (modelos/yolov8n.onnx), con el head completo de 80 clases: recortarlo
+     a persona/celular cambiaría la clase ganadora de algunas anclas (un
+     control remoto con algo de score de celular saldría como celular).
+  2. Con --int8: cuantización estática QDQ (pesos int8 por canal,
+     activaciones uint8) calibrada con imágenes letterboxed
+     (modelos/yolov8n_int8.onnx). El DFL del head queda en float.
+     ONNX Runtime y OpenVINO ejecutan el formato QDQ en int8.
+
+La calibración necesita un set representativo (snapshots de webcam reales,
+al menos MIN_IMAGENES_CALIBRACION): --int8 sin --calibracion, o con menos
+imágenes, es un error. Dependencias en requirements-export.txt; en la
+imagen solo se corre con --build-arg VISION_EXPORT=1 (ver Dockerfile).
+
+Ejecutar:  python exportar_modelo.py [--int8 --calibracion DIR]
+"""
+
+import argparse
+import glob
+import os
+import shutil
+
+import cv2
+
+from backends import IMGSZ, NOMBRE_FP32, NOMBRE_INT8, VISION_MODEL_DIR, a_tensor, letterbox
+
+MIN_IMAGENES_CALIBRACION = 100
+MAX_IMAGENES_CALIBRACION = 500
+
+
+def exportar_onnx(pesos: str, destino: str) -> str:
+    """Exporta YOLOv8 (head completo) a ONNX con batch y tamaño dinámicos."""
+    from ultralytics import YOLO
+
+    ruta = YOLO(pesos).export(format="onnx", dynamic=True, simplify=True, imgsz=IMGSZ)
+    shutil.move(ruta, destino)
+    return destino
+
+
+def imagenes_calibracion(directorio: str, minimo: int = MIN_IMAGENES_CALIBRACION,
+                         limite: int = MAX_IMAGENES_CALIBRACION) -> list:
+    """
+    Imágenes BGR de `directorio` para calibrar/verificar.
+
+    Raises:
+        SystemExit: si hay menos de `minimo` imágenes legibles.
+    """
+    rutas = sorted(
+        r for ext in ("jpg", "jpeg", "png") for r in glob.glob(os.path.join(directorio, f"**/*.{ext}"), recursive=True)
+    )[:limite]
+    imagenes = [cv2.imread(r, cv2.IMREAD_COLOR) for r in rutas]
+    imagenes = [im for im in imagenes if im is not None]
+    if len(imagenes) < minimo:
+        raise SystemExit(f"❌ {directorio}: {len(imagenes)} imágenes legibles, se necesitan al menos {minimo}.")
+    return imagenes
+
+
+def cuantizar_int8(origen: str, destino: str, imagenes: list) -> str:
+    """Cuantización estática QDQ de ONNX Runtime calibrada con `imagenes`."""
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class LectorCalibracion(CalibrationDataReader):
+        def __init__(self):
+            self.lotes = iter([
+                {"images": a_tensor([letterbox(im, (IMGSZ, IMGSZ))[0]])} for im in imagenes
+            ])
+
+        def get_next(self):
+            return next(self.lotes, None)
+
+    preparado = destino.replace(".onnx", "_pre.onnx")
+    # La inferencia simbólica de formas no resuelve el export dinámico
+    # (batch/alto/ancho simbólicos tras simplify): se usa solo la de ONNX
+    quant_pre_process(origen, preparado, skip_symbolic_shape=True)
+    # El DFL (softmax sobre la distribución de cada lado de la caja) es
+    # sensible a la cuantización y casi no pesa: queda en float
+    excluidos = [n.name for n in onnx.load(preparado).graph.node if "/dfl/" in n.name]
+    quantize_static(
+        preparado, destino, LectorCalibracion(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        op_types_to_quantize=["Conv"],
+        nodes_to_exclude=excluidos,
+    )
+    os.remove(preparado)
+    return destino
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta YOLOv8n a ONNX fp32/int8.")
+    parser.add_argument("--pesos", default="yolov8n.pt")
+    parser.add_argument("--salida", default=VISION_MODEL_DIR)
+    parser.add_argument("--int8", action="store_true", help="Genera también la variante int8 (QDQ)")
+    parser.add_argument("--calibracion", default=None, help="Directorio de imágenes de calibración (requerido con --int8)")
+    args = parser.parse_args()
+    if args.int8 and args.calibracion is None:
+        parser.error("--int8 requiere --calibracion DIR")
+
+    os.makedirs(args.salida, exist_ok=True)
+    fp32 = exportar_onnx(args.pesos, os.path.join(args.salida, NOMBRE_FP32))
+    print(f"✅ ONNX fp32: {fp32}")
+
+    if args.int8:
+        imagenes = imagenes_calibracion(args.calibracion)
+        int8 = cuantizar_int8(fp32, os.path.join(args.salida, NOMBRE_INT8), imagenes)
+        print(f"✅ ONNX int8 (calibrado con {len(imagenes)} imágenes): {int8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+identidad.py — Verificación de identidad sobre el mismo snapshot de YOLO
+========================================================================
+Con VISION_IDENTITY=1, el worker de visión compara el rostro del
+snapshot con el embedding de registro de la sesión sin volver a
+descargar ni decodificar la imagen (antes: /api/compare del servicio
+biométrico, otra descarga por HTTP):
+
+  • Solo si YOLO vio exactamente UNA persona (con 0 no hay a quién
+    verificar y con >1 ya hay evidencia de Multitud).
+  • El rostro se busca en la parte superior de la caja de esa persona,
+    sobre la imagen decodificada ANTES del letterbox (a resolución
+    original, o reducida por libjpeg a no menos de la entrada del
+    modelo), con HOG de dlib como biometrics.py.
+  • El embedding de registro (128 floats, el `vector_db` de /api/compare)
+    llega en el mensaje de q_snapshots y se guarda por sesión (LRU).
+
+Misma distancia y conversión a similitud que biometric_deepface.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import face_recognition
+except ImportError:
+    face_recognition = None
+
+# "1" activa la verificación de identidad (requiere face_recognition/dlib)
+VISION_IDENTITY = os.environ.get("VISION_IDENTITY", "0") == "1"
+# Distancia máxima para considerar match (mismo default que /api/compare)
+VISION_IDENTITY_UMBRAL = float(os.environ.get("VISION_IDENTITY_UMBRAL", "0.5"))
+VISION_IDENTITY_MAX_SESIONES = int(os.environ.get("VISION_IDENTITY_MAX_SESIONES", "5000"))
+
+DIMENSIONES = 128
+# Fracción superior de la caja de la persona donde se busca el rostro
+FRACCION_ROSTRO = 0.6
+
+
+def disponible() -> bool:
+    return VISION_IDENTITY and face_recognition is not None
+
+
+class VectoresSesion:
+    """Embedding de registro por sesión, acotado a `max_sesiones` (LRU)."""
+
+    def __init__(self, max_sesiones: int = 5000):
+        self.max_sesiones = max_sesiones
+        self._vectores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def registrar(self, sesion_id: str, vector) -> bool:
+        """Guarda el embedding de la sesión; False si no tiene 128 dimensiones."""
+        vector = np.asarray(vector, dtype=np.float64)
+        if vector.shape != (DIMENSIONES,):
+            return False
+        with self._lock:
+            self._vectores[sesion_id] = vector
+            self._vectores.move_to_end(sesion_id)
+            while len(self._vectores) > self.max_sesiones:
+                self._vectores.popitem(last=False)
+        return True
+
+    def obtener(self, sesion_id: str) -> np.ndarray | None:
+        with self._lock:
+            vector = self._vectores.get(sesion_id)
+            if vector is not None:
+                self._vectores.move_to_end(sesion_id)
+            return vector
+
+    def __len__(self):
+        return len(self._vectores)
+
+
+def recorte_rostro(imagen: np.ndarray, forma, caja) -> np.ndarray | None:
+    """
+    Zona del rostro (parte superior de `caja`, en píxeles originales) de la
+    imagen decodificada BGR, en RGB contiguo para dlib. `forma` es el
+    (alto, ancho) original: la imagen puede venir reducida. None si queda vacía.
+    """
+    x1, y1, x2, y2 = caja
+    y2 = y1 + (y2 - y1) * FRACCION_ROSTRO
+    alto, ancho = imagen.shape[:2]
+    escala = ancho / forma[1]
+    x1, x2 = (int(np.clip(v * escala, 0, ancho)) for v in (x1, x2))
+    y1, y2 = (int(np.clip(v * escala, 0, alto)) for v in (y1, y2))
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return np.ascontiguousarray(imagen[y1:y2, x1:x2, ::-1])
+
+
+def codificar_rostro(rgb: np.ndarray) -> np.ndarray | None:
+    """Embedding (128,) del rostro más grande del recorte, o None si no hay rostro."""
+    cajas = face_recognition.face_locations(rgb, model="hog")
+    if not cajas:
+        return None
+    # (arriba, derecha, abajo, izquierda)
+    mayor = max(cajas, key=lambda c: (c[2] - c[0]) * (c[1] - c[3]))
+    encodings = face_recognition.face_encodings(rgb, [mayor])
+    return encodings[0] if encodings else None
+
+
+def comparar(vector_db: np.ndarray, vector_nuevo: np.ndarray, umbral: float = 0.5) -> dict:
+    """Misma salida que biometrics.comparar_vectores() (distancia euclidiana)."""
+    distancia = float(np.linalg.norm(np.asarray(vector_db, dtype=np.float64) - vector_nuevo))
+    return {
+        "is_match": bool(distancia < umbral),
+        "similarity_percent": round(max(0.0, 1.0 - distancia) * 100, 2),
+        "distance": round(distancia, 4),
+    }
+
+
+def verificar(imagen: np.ndarray, forma, caja, vector_db: np.ndarray, umbral: float = 0.5) -> dict:
+    """
+    Rostro de la persona de `caja` (imagen decodificada, ver recorte_rostro)
+    contra el embedding de registro.
+
+    Returns:
+        {"face_detected": False} o {"face_detected": True, is_match,
+        similarity_percent, distance}.
+    """
+    rgb = recorte_rostro(imagen, forma, caja)
+    vector = codificar_rostro(rgb) if rgb is not None else None
+    if vector is None:
+        return {"face_detected": False}
+    return {"face_detected": True, **comparar(vector_db, vector, umbral)}
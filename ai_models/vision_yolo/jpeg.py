@@ -0,0 +1,64 @@
+"""
+jpeg.py — Dimensiones de un JPEG sin decodificarlo
+==================================================
+Los snapshots de webcam llegan como JPEG de 720p/1080p y YOLO trabaja a
+640: decodificarlos completos para después achicarlos desperdicia la
+mayor parte del costo de decodificación.
+
+libjpeg puede decodificar directamente a 1/2, 1/4 u 1/8 de resolución
+(escalado en el dominio DCT; cv2.IMREAD_REDUCED_COLOR_2/4/8). Para elegir
+el factor alcanza con leer el marcador SOF de la cabecera.
+"""
+
+import struct
+
+# Marcadores Start Of Frame (C4 = DHT, C8 = JPG y CC = DAC no lo son)
+_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Marcadores sin segmento de longitud
+_SIN_LONGITUD = {0x01, 0xD8, *range(0xD0, 0xD8)}
+
+FACTORES = (8, 4, 2)
+
+
+def dimensiones_jpeg(datos) -> tuple[int, int] | None:
+    """
+    (ancho, alto) del marcador SOF de un JPEG, o None si no es un JPEG o
+    la cabecera está truncada.
+    """
+    datos = memoryview(datos)
+    if len(datos) < 4 or datos[0] != 0xFF or datos[1] != 0xD8:
+        return None
+
+    i = 2
+    while i + 4 <= len(datos):
+        if datos[i] != 0xFF:
+            return None
+        marcador = datos[i + 1]
+        if marcador == 0xFF:            # relleno entre marcadores
+            i += 1
+            continue
+        if marcador in _SIN_LONGITUD:
+            i += 2
+            continue
+        if marcador == 0xDA:            # inicio de los datos comprimidos sin SOF
+            return None
+        longitud = struct.unpack_from(">H", datos, i + 2)[0]
+        if marcador in _SOF:
+            if i + 9 > len(datos):
+                return None
+            alto, ancho = struct.unpack_from(">HH", datos, i + 5)
+            return (ancho, alto) if ancho and alto else None
+        i += 2 + longitud
+    return None
+
+
+def factor_reduccion(ancho: int, alto: int, lado: int) -> int:
+    """
+    Mayor factor de decodificación reducida (8, 4, 2 o 1) que todavía deja
+    el lado mayor ≥ `lado` (la entrada del modelo): el letterbox sigue
+    achicando y no se pierde resolución útil.
+    """
+    for factor in FACTORES:
+        if max(ancho, alto) // factor >= lado:
+            return factor
+    return 1
@@ -0,0 +1,95 @@
+"""
+postproceso.py — Salida cruda de YOLOv8 exportado → detecciones
+================================================================
+Los backends exportados (ONNX Runtime / OpenVINO, ver backends.py)
+devuelven el tensor crudo del head de YOLOv8: (N, 4 + 80, A) con
+cx, cy, w, h en píxeles de la entrada letterboxed y un score (sigmoide)
+por clase COCO y ancla. Acá se replica non_max_suppression(classes=...)
++ scale_boxes() de ultralytics en numpy:
+
+  1. Por ancla, clase de mayor score entre las 80; se descartan scores
+     ≤ conf y las anclas cuya clase ganadora no está en `clases` (un
+     control remoto con algo de score de celular sigue siendo remoto).
+  2. cxcywh → xyxy, NMS por clase (IoU > iou se suprime), máx. max_det.
+  3. Se deshace el letterbox (padding + escala) y se recorta a la imagen.
+
+Detección = fila [x1, y1, x2, y2, conf, clase] en píxeles de la imagen
+original; `clase` es el id COCO (= fila de score del head).
+"""
+
+import numpy as np
+
+# Desplazamiento por clase para hacer NMS por clase en una sola pasada
+# (mismo valor que ultralytics)
+MAX_WH = 7680
+MAX_NMS = 30000
+MAX_DET = 300
+
+
+def nms(cajas: np.ndarray, scores: np.ndarray, iou: float) -> np.ndarray:
+    """
+    NMS greedy (como torchvision.ops.nms): índices conservados, por score
+    descendente. Se suprime toda caja con IoU > `iou` con una conservada.
+    """
+    x1, y1, x2, y2 = cajas.T
+    areas = (x2 - x1) * (y2 - y1)
+    orden = np.argsort(-scores, kind="stable")
+    conservar = []
+    while len(orden):
+        i = orden[0]
+        conservar.append(i)
+        resto = orden[1:]
+        ancho = np.clip(np.minimum(x2[i], x2[resto]) - np.maximum(x1[i], x1[resto]), 0, None)
+        alto = np.clip(np.minimum(y2[i], y2[resto]) - np.maximum(y1[i], y1[resto]), 0, None)
+        inter = ancho * alto
+        orden = resto[inter / (areas[i] + areas[resto] - inter) <= iou]
+    return np.asarray(conservar, dtype=np.int64)
+
+
+def decodificar_salida(salida: np.ndarray, clases, conf: float, iou: float = 0.7,
+                       max_det: int = MAX_DET) -> list[np.ndarray]:
+    """
+    Args:
+        salida: Tensor crudo (N, 4 + C, A) del modelo exportado (C = 80 COCO).
+        clases: Ids de clase que se reportan (como `classes=` de ultralytics).
+        conf:   Umbral de confianza (estricto, como ultralytics).
+        iou:    Umbral de IoU del NMS.
+
+    Returns:
+        Lista de N arrays (K, 6) [x1, y1, x2, y2, conf, clase] en píxeles
+        de la entrada letterboxed.
+    """
+    clases = np.asarray(clases)
+    detecciones = []
+    for pred in salida:
+        pred = pred.T                                   # (A, 4 + C)
+        scores = pred[:, 4:]
+        j = scores.argmax(axis=1)
+        mejor = scores[np.arange(len(scores)), j]
+        # El argmax es sobre TODAS las clases; el filtro de clase va después
+        validos = (mejor > conf) & np.isin(j, clases)
+        caja, mejor, j = pred[validos, :4], mejor[validos], j[validos]
+        if len(mejor) > MAX_NMS:
+            top = np.argsort(-mejor, kind="stable")[:MAX_NMS]
+            caja, mejor, j = caja[top], mejor[top], j[top]
+
+        xyxy = np.empty_like(caja)
+        xyxy[:, :2] = caja[:, :2] - caja[:, 2:] / 2
+        xyxy[:, 2:] = caja[:, :2] + caja[:, 2:] / 2
+        conservar = nms(xyxy + j[:, None] * MAX_WH, mejor, iou)[:max_det]
+        detecciones.append(np.concatenate([
+            xyxy[conservar], mejor[conservar, None], j[conservar, None],
+        ], axis=1).astype(np.float32))
+    return detecciones
+
+
+def escalar_cajas(det: np.ndarray, escala: float, pad: tuple[float, float],
+                  forma: tuple[int, int]) -> np.ndarray:
+    """
+    Deshace el letterbox: cajas de la entrada del modelo → píxeles de la
+    imagen original de forma (alto, ancho), recortadas a sus bordes.
+    """
+    det = det.copy()
+    det[:, [0, 2]] = ((det[:, [0, 2]] - pad[0]) / escala).clip(0, forma[1])
+    det[:, [1, 3]] = ((det[:, [1, 3]] - pad[1]) / escala).clip(0, forma[0])
+    return det
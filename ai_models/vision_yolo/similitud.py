@@ -0,0 +1,110 @@
+"""
+similitud.py — Reutilización de resultados entre snapshots casi iguales
+=======================================================================
+Con la webcam quieta, los snapshots consecutivos de una sesión son casi
+idénticos y YOLO devuelve lo mismo. Antes de inferir, cada frame se
+compara con el ÚLTIMO FRAME ANALIZADO de su sesión:
+
+  • Firma: miniatura en grises (promedio por bloques de ~MINIATURA celdas
+    en el lado mayor) del frame ya letterboxed.
+  • Cambio: fracción de celdas cuya diferencia supera DELTA_CELDA niveles,
+    descontando antes la mediana de las diferencias (cambios globales de
+    exposición/balance de la webcam no cuentan). Un celular que aparece
+    cambia varias celdas aunque el promedio global casi no se mueva.
+
+Si el cambio es menor que VISION_DEDUP_UMBRAL se reutiliza el análisis
+anterior (marcado como reutilizado). Cada VISION_DEDUP_REFRESCO frames
+de la sesión se fuerza una inferencia aunque no haya cambios.
+
+Las sesiones viven en memoria del proceso con expulsión LRU/TTL.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# "1" (default) activa la reutilización; "0" infiere todos los frames
+VISION_DEDUP = os.environ.get("VISION_DEDUP", "1") == "1"
+# Fracción máxima de celdas cambiadas para reutilizar el resultado anterior
+VISION_DEDUP_UMBRAL = float(os.environ.get("VISION_DEDUP_UMBRAL", "0.005"))
+# Al menos 1 de cada N frames de una sesión pasa por YOLO (N-1 reutilizados seguidos como máximo)
+VISION_DEDUP_REFRESCO = int(os.environ.get("VISION_DEDUP_REFRESCO", "10"))
+VISION_DEDUP_MAX_SESIONES = int(os.environ.get("VISION_DEDUP_MAX_SESIONES", "5000"))
+
+MINIATURA = 32
+DELTA_CELDA = 12.0
+
+
+def miniatura(imagen: np.ndarray, lado: int = MINIATURA) -> np.ndarray:
+    """
+    Firma del frame: promedio en grises por bloques cuadrados, con ~`lado`
+    bloques en el lado mayor. Dentro de cada bloque se promedia 1 de cada
+    2 píxeles por fila y columna (alcanza y cuesta la cuarta parte).
+    """
+    alto, ancho = imagen.shape[:2]
+    bloque = max(2, max(alto, ancho) // lado)
+    filas, columnas = alto // bloque, ancho // bloque
+    recorte = imagen[:filas * bloque, :columnas * bloque]
+    bloques = recorte.reshape(filas, bloque, columnas, bloque, -1)[:, ::2, :, ::2]
+    return bloques.mean(axis=(1, 3, 4), dtype=np.float32)
+
+
+def fraccion_cambio(a: np.ndarray, b: np.ndarray, delta: float = DELTA_CELDA) -> float:
+    """Fracción de celdas que cambiaron entre dos miniaturas (1.0 si no son comparables)."""
+    if a.shape != b.shape:
+        return 1.0
+    diferencia = a - b
+    diferencia -= np.median(diferencia)
+    return float(np.mean(np.abs(diferencia) > delta))
+
+
+class ResultadosSesion:
+    """Último frame analizado y su resultado por sesión, con expulsión LRU/TTL."""
+
+    def __init__(self, umbral: float = 0.005, refresco: int = 10,
+                 max_sesiones: int = 5000, ttl_s: float = 3600.0):
+        self.umbral = umbral
+        self.refresco = refresco
+        self.max_sesiones = max_sesiones
+        self.ttl_s = ttl_s
+        self.reutilizados = 0
+        self.inferidos = 0
+        self._sesiones = OrderedDict()
+        self._lock = threading.Lock()
+
+    def buscar(self, sesion_id: str, firma: np.ndarray) -> dict | None:
+        """
+        Resultado anterior de la sesión si `firma` casi no cambió respecto
+        del último frame analizado y no toca refrescar; si no, None (hay
+        que inferir y después llamar a guardar()).
+        """
+        with self._lock:
+            estado = self._sesiones.get(sesion_id)
+            if estado is None or time.monotonic() - estado["ultimo"] > self.ttl_s:
+                self.inferidos += 1
+                return None
+            self._sesiones.move_to_end(sesion_id)
+            estado["ultimo"] = time.monotonic()
+            if (estado["seguidos"] + 1 >= self.refresco
+                    or fraccion_cambio(firma, estado["firma"]) >= self.umbral):
+                self.inferidos += 1
+                return None
+            estado["seguidos"] += 1
+            self.reutilizados += 1
+            return estado["resultado"]
+
+    def guardar(self, sesion_id: str, firma: np.ndarray, resultado: dict):
+        """Registra el frame recién analizado como referencia de la sesión."""
+        with self._lock:
+            self._sesiones[sesion_id] = {
+                "firma": firma, "resultado": resultado, "seguidos": 0, "ultimo": time.monotonic(),
+            }
+            self._sesiones.move_to_end(sesion_id)
+            while len(self._sesiones) > self.max_sesiones:
+                self._sesiones.popitem(last=False)
+
+    def __len__(self):
+        return len(self._sesiones)
@@ -1,14 +1,33 @@
 """
 test.py — Tests unitarios para el Worker de Visión (YOLOv8)
 ============================================================
-Testea soft_evidence.normalizar_vision() sin necesidad de cargar
-el modelo YOLO ni tener acceso a la red.
+Testea soft_evidence.normalizar_vision(), el post-proceso de los
+backends exportados (postproceso.py), la lectura de cabeceras JPEG de
+la decodificación reducida (jpeg.py), la reutilización de resultados
+entre frames casi iguales (similitud.py) y las decisiones de la cascada
+de dos resoluciones (cascada.py) y de la verificación de identidad
+(identidad.py, con face_recognition simulado) sin necesidad de cargar el
+modelo YOLO ni tener acceso a la red (ultralytics.YOLO se reemplaza por
+YOLOFalso). worker._verificar_identidad() y el consumo por lotes de
+main.py (procesar_lote, consumir_en_lotes) solo se prueban si worker.py y
+main.py se pueden importar (cv2, requests, pika y dotenv). La paridad de
+los backends con PyTorch está en test_backends.py (requiere los modelos).
 
 Ejecutar:  python test.py
 """
 
 import json
+import sys
+import types
+from typing import NamedTuple
+
+import numpy as np
+import cascada
+import identidad
 from soft_evidence import normalizar_vision
+from postproceso import decodificar_salida, escalar_cajas
+from jpeg import dimensiones_jpeg, factor_reduccion
+from similitud import ResultadosSesion, fraccion_cambio, miniatura
 
 # ====================================================================
 # CONSTANTES
@@ -98,6 +117,369 @@ assert d["Objeto_Prohibido"] > d["Normal"], "Objeto_Prohibido debería dominar c
 d = normalizar_vision(1, 0.0, False, False)
 assert d["Normal"] > d["Ausente"], "Normal debería dominar en caso base"
 
+# ====================================================================
+# TESTS: postproceso (salida cruda de YOLOv8 exportado)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: postproceso.decodificar_salida()")
+print("=" * 60)
+
+# Anclas de una imagen con el head completo: (cx, cy, w, h) + 80 scores COCO
+def ancla(cx, cy, w, h, **scores):
+    fila = np.zeros(4 + 80, np.float32)
+    fila[:4] = cx, cy, w, h
+    for clase, score in scores.items():
+        fila[4 + int(clase[1:])] = score
+    return fila
+
+
+anclas = np.stack([
+    ancla(100, 100, 80, 160, c0=0.90, c67=0.05),    # persona
+    ancla(102, 101, 80, 160, c0=0.80, c67=0.05),    # misma persona (IoU alto) → NMS
+    ancla(100, 100, 30, 60, c0=0.10, c67=0.70),     # celular sobre la persona → otra clase, se conserva
+    ancla(400, 300, 50, 50, c0=0.45),               # = conf → se descarta (umbral estricto)
+    ancla(500, 100, 80, 160, c0=0.60, c67=0.50),    # otra persona
+    ancla(300, 300, 20, 40, c65=0.80, c67=0.50),    # control remoto (65) con score de celular → NO es celular
+])
+det = decodificar_salida(anclas.T[None], clases=(0, 67), conf=0.45)[0]
+assert det.shape == (3, 6), det
+assert det[:, 5].tolist() == [0.0, 67.0, 0.0], "Orden por confianza, ids COCO"
+assert np.allclose(det[det[:, 4] == np.float32(0.9), :4], [[60, 20, 140, 180]])
+assert len(decodificar_salida(np.zeros((2, 84, 10), np.float32), (0, 67), 0.45)) == 2
+todas = decodificar_salida(anclas.T[None], clases=range(80), conf=0.45)[0]
+assert 65.0 in todas[:, 5], "Sin filtro, el remoto sale como remoto"
+
+# Deshacer el letterbox: 1280x720 → 640x360 + 12 px arriba (640x384)
+caja = escalar_cajas(np.array([[0, 12, 320, 372, 0.9, 0]], np.float32), 0.5, (0, 12), (720, 1280))
+assert np.allclose(caja[0, :4], [0, 0, 640, 720])
+print("✅ Argmax sobre 80 clases + filtro persona/celular + NMS por clase + escalado al original")
+
+# ====================================================================
+# TESTS: jpeg (dimensiones para la decodificación reducida)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: jpeg.dimensiones_jpeg() / factor_reduccion()")
+print("=" * 60)
+
+# SOI + APP0 (JFIF, 16 bytes) + SOF0 baseline 1920x1080, 3 componentes
+app0 = bytes.fromhex("FFE00010") + b"JFIF\x00" + bytes(9)
+sof0 = bytes.fromhex("FFC00011 08 0438 0780 03") + bytes(9)
+cabecera = bytes.fromhex("FFD8") + app0 + bytes.fromhex("FFFF") + sof0
+assert dimensiones_jpeg(cabecera) == (1920, 1080), dimensiones_jpeg(cabecera)
+assert dimensiones_jpeg(cabecera + bytes.fromhex("FFDA")) == (1920, 1080)
+assert dimensiones_jpeg(bytearray(cabecera)) == (1920, 1080), "Acepta cualquier buffer"
+assert dimensiones_jpeg(bytes.fromhex("FFD8") + app0 + bytes.fromhex("FFDA000C")) is None, "Sin SOF"
+assert dimensiones_jpeg(cabecera[:len(cabecera) - 12]) is None, "Cabecera truncada"
+assert dimensiones_jpeg(b"\x89PNG\r\n\x1a\n" + bytes(16)) is None, "No es JPEG"
+assert dimensiones_jpeg(b"") is None
+
+assert factor_reduccion(1920, 1080, 640) == 2
+assert factor_reduccion(1280, 720, 640) == 2
+assert factor_reduccion(640, 480, 640) == 1
+assert factor_reduccion(5000, 3000, 640) == 4
+assert factor_reduccion(1080, 1920, 640) == 2, "Retrato: cuenta el lado mayor"
+print("✅ Dimensiones del SOF y factor de reducción ≥ entrada del modelo")
+
+# ====================================================================
+# TESTS: similitud (reutilización entre frames casi iguales)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: similitud.ResultadosSesion")
+print("=" * 60)
+
+# Webcam quieta: escena suave 640x384 (ya letterboxed) + ruido de sensor
+rng = np.random.default_rng(0)
+fy, fx = np.mgrid[0:384, 0:640]
+escena = 100 + 60 * np.sin(fx / 40) + 40 * np.cos(fy / 30)
+escena = np.stack([escena, escena * 0.9, escena * 1.1], axis=-1)
+
+
+def snapshot(brillo=0.0, celular=False):
+    f = escena + brillo + rng.normal(0, 6, escena.shape)
+    if celular:
+        f[150:190, 300:325] = 20        # objeto oscuro de 40x25 px
+    return np.clip(f, 0, 255).astype(np.uint8)
+
+
+ref = miniatura(snapshot())
+assert ref.shape == (19, 32), ref.shape
+assert fraccion_cambio(ref, miniatura(snapshot())) < 0.005, "El ruido no cuenta como cambio"
+assert fraccion_cambio(ref, miniatura(snapshot(brillo=15))) < 0.005, "Ni un cambio global de exposición"
+assert fraccion_cambio(ref, miniatura(snapshot(celular=True))) >= 0.005, "Un celular sí"
+assert fraccion_cambio(ref, ref[:, :-1]) == 1.0, "Formas distintas → no comparables"
+
+cache = ResultadosSesion(umbral=0.005, refresco=10, max_sesiones=2)
+inferidos = 0
+for k in range(100):
+    firma = miniatura(snapshot())
+    if cache.buscar("s1", firma) is None:
+        inferidos += 1
+        cache.guardar("s1", firma, {"k": k})
+assert inferidos == 10, f"Refresco forzado cada 10 frames: {inferidos} inferencias"
+
+firma = miniatura(snapshot(celular=True))
+assert cache.buscar("s1", firma) is None, "Frame con cambios → se infiere"
+cache.guardar("s1", firma, {"k": "celular"})
+assert cache.buscar("s1", miniatura(snapshot(celular=True))) == {"k": "celular"}
+assert cache.buscar("s2", firma) is None, "Otra sesión no comparte resultados"
+cache.guardar("s2", firma, {})
+cache.guardar("s3", firma, {})
+assert len(cache) == 2 and cache.buscar("s1", firma) is None, "Expulsión LRU"
+print(f"✅ Webcam quieta: {inferidos}/100 frames pasan por YOLO; con cambios locales o refresco se infiere")
+
+# ====================================================================
+# TESTS: cascada (pasada baja → recorte / resolución completa)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: cascada.decidir() / ventana_recorte() / combinar()")
+print("=" * 60)
+
+
+class Frame(NamedTuple):
+    """Mismos campos que backends.FrameLetterbox (backends requiere cv2)."""
+    imagen: np.ndarray
+    escala: float
+    pad: tuple
+    forma: tuple
+
+
+def dets(*filas):
+    return np.array(filas, dtype=np.float32).reshape(-1, 6)
+
+
+P, C = cascada.CLASS_PERSON, cascada.CLASS_CELLPHONE
+assert cascada.decidir(dets([0, 0, 10, 10, 0.9, P]))[0] == cascada.BAJA
+assert cascada.decidir(dets())[0] == cascada.BAJA, "Nadie, sin dudas → ausente a baja resolución"
+assert cascada.decidir(dets([0, 0, 10, 10, 0.3, P]))[0] == cascada.COMPLETA, "¿0 o 1 persona?"
+assert cascada.decidir(dets([0, 0, 10, 10, 0.9, P], [20, 0, 30, 10, 0.5, P]))[0] == cascada.COMPLETA, "¿1 o 2?"
+assert cascada.decidir(dets([0, 0, 10, 10, 0.9, P], [20, 0, 30, 10, 0.8, P]))[0] == cascada.BAJA
+assert cascada.decidir(dets([0, 0, 10, 10, 0.9, P], [5, 5, 8, 9, 0.8, C]))[0] == cascada.BAJA, "Celular claro"
+pasada, dudosos = cascada.decidir(dets([0, 0, 10, 10, 0.9, P], [5, 5, 8, 9, 0.3, C]))
+assert pasada == cascada.RECORTE and dudosos.tolist() == [[5, 5, 8, 9]]
+
+# 1280x720 → letterbox 640x384: escala 0.5, pad (0, 12)
+frame = Frame(np.zeros((384, 640, 3), np.uint8), 0.5, (0, 12), (720, 1280))
+celular = np.array([[600, 300, 660, 420]], np.float32)      # → (300, 162, 330, 222) en el letterbox
+assert cascada.ventana_recorte(celular, frame.escala, frame.pad, (384, 640)) == (155, 32)
+lejos = np.array([[0, 0, 40, 40], [1200, 600, 1280, 720]], np.float32)
+assert cascada.ventana_recorte(lejos, frame.escala, frame.pad, (384, 640)) is None, "No entran en 320x320"
+assert cascada.ventana_recorte(celular, 0.5, (0, 0), (192, 640)) is None, "Letterbox más chico que la ventana"
+
+recorte = cascada.recortar(frame, 155, 32)
+assert recorte.imagen.shape == (320, 320, 3) and recorte.pad == (-155, -20)
+en_recorte = escalar_cajas(dets([145, 130, 175, 190, 0.62, C]), recorte.escala, recorte.pad, recorte.forma)
+assert np.allclose(en_recorte[0, :4], celular[0]), "El recorte vuelve a píxeles originales"
+
+baja = dets([500, 100, 800, 700, 0.9, P], [600, 300, 660, 420, 0.3, C], [40, 40, 80, 90, 0.8, C])
+final = cascada.combinar(baja, en_recorte, recorte)
+assert np.allclose(final[np.argsort(final[:, 4]), 4:], [[0.62, C], [0.8, C], [0.9, P]]), final
+print("✅ Banda dudosa → recorte o resolución completa; celulares del recorte reemplazan a los de la baja")
+
+# ====================================================================
+# TESTS: identidad (embedding de registro por sesión + recorte del rostro)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: identidad.VectoresSesion / recorte_rostro() / comparar()")
+print("=" * 60)
+
+vectores = identidad.VectoresSesion(max_sesiones=2)
+registro = np.linspace(-0.2, 0.2, 128)
+assert vectores.registrar("s1", registro.tolist())
+assert not vectores.registrar("s1", [0.1] * 64), "Solo embeddings de 128 dimensiones"
+assert np.array_equal(vectores.obtener("s1"), registro)
+vectores.registrar("s2", registro)
+vectores.obtener("s1")                  # s1 pasa a ser la más reciente
+vectores.registrar("s3", registro)
+assert vectores.obtener("s2") is None and vectores.obtener("s1") is not None, "Expulsión LRU"
+
+# Misma fórmula que biometrics.comparar_vectores(): distancia euclidiana
+otro = registro.copy()
+otro[:4] += 0.2                         # distancia = sqrt(4 · 0.04) = 0.4
+r = identidad.comparar(registro, otro)
+assert r == {"is_match": True, "similarity_percent": 60.0, "distance": 0.4}, r
+assert not identidad.comparar(registro, otro, umbral=0.3)["is_match"]
+
+# Persona en (400, 100)-(800, 700) de un 1280x720 decodificado a 1/2 (640x360)
+imagen = np.zeros((360, 640, 3), np.uint8)
+imagen[..., 2] = 255                    # BGR rojo → RGB (255, 0, 0)
+rostro = identidad.recorte_rostro(imagen, (720, 1280), [400, 100, 800, 700])
+assert rostro.shape == (180, 200, 3), rostro.shape          # 60% superior de 300 px de alto
+assert rostro.flags["C_CONTIGUOUS"] and rostro[0, 0].tolist() == [255, 0, 0], "RGB contiguo"
+assert identidad.recorte_rostro(imagen, (720, 1280), [1400, 100, 1500, 700]) is None, "Fuera de la imagen"
+# A resolución original el recorte conserva todos los píxeles del rostro
+completa = np.zeros((720, 1280, 3), np.uint8)
+assert identidad.recorte_rostro(completa, (720, 1280), [400, 100, 800, 700]).shape == (360, 400, 3)
+print("✅ Embedding por sesión (LRU), distancia como /api/compare y recorte RGB del rostro")
+
+
+class FaceRecognitionFalso:
+    """face_recognition de prueba: un rostro por recorte, embedding = `vector`."""
+    def __init__(self, vector, rostros=1):
+        self.vector, self.rostros, self.formas = vector, rostros, []
+    def face_locations(self, rgb, model="hog"):
+        self.formas.append(rgb.shape)
+        alto, ancho = rgb.shape[:2]
+        return [(0, ancho, alto, 0)] * self.rostros
+    def face_encodings(self, rgb, cajas):
+        return [self.vector for _ in cajas]
+
+
+face_recognition_real = identidad.face_recognition
+try:
+    identidad.face_recognition = FaceRecognitionFalso(otro)
+    r = identidad.verificar(completa, (720, 1280), [400, 100, 800, 700], registro)
+    assert r == {"face_detected": True, "is_match": True, "similarity_percent": 60.0, "distance": 0.4}, r
+    assert identidad.face_recognition.formas == [(360, 400, 3)], "Se codifica el recorte de la imagen decodificada"
+    identidad.face_recognition = FaceRecognitionFalso(otro, rostros=0)
+    assert identidad.verificar(completa, (720, 1280), [400, 100, 800, 700], registro) == {"face_detected": False}
+    assert identidad.verificar(completa, (720, 1280), [1400, 100, 1500, 700], registro) == {"face_detected": False}
+finally:
+    identidad.face_recognition = face_recognition_real
+print("✅ verificar() sobre la imagen decodificada (face_recognition simulado)")
+
+
+
+class YOLOFalso:
+    """ultralytics.YOLO de prueba: no carga pesos (los tests simulan las detecciones)."""
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+# vision_logic construye el detector al importarse: nunca con el modelo real
+sys.modules["ultralytics"] = types.SimpleNamespace(YOLO=YOLOFalso)
+
+# worker._verificar_identidad necesita cv2/requests para importar worker
+try:
+    import worker
+except ImportError as e:
+    worker = None
+    print(f"⏭️  worker._verificar_identidad omitido ({e})")
+
+if worker is not None:
+    VISION_IDENTITY_real = identidad.VISION_IDENTITY
+    try:
+        identidad.VISION_IDENTITY = True
+        identidad.face_recognition = FaceRecognitionFalso(registro)
+        worker.vectores_sesion.registrar("s-identidad", registro)
+
+        def analisis(personas):
+            return {"details": {"persons": personas}, "person_boxes": [[400, 100, 800, 700]] * personas}
+
+        resultado = analisis(1)
+        worker._verificar_identidad("s-identidad", completa, (720, 1280), resultado)
+        assert resultado["identity"]["face_detected"] and resultado["identity"]["is_match"], resultado
+        assert identidad.face_recognition.formas == [(360, 400, 3)]
+        for sesion, personas, imagen_sesion in (("s-identidad", 2, completa), ("s-sin-registro", 1, completa),
+                                                ("s-identidad", 1, None)):
+            resultado = analisis(personas)
+            worker._verificar_identidad(sesion, imagen_sesion, (720, 1280), resultado)
+            assert "identity" not in resultado, (sesion, personas)
+        assert len(identidad.face_recognition.formas) == 1, "Solo se codifica con una persona y registro"
+    finally:
+        identidad.VISION_IDENTITY = VISION_IDENTITY_real
+        identidad.face_recognition = face_recognition_real
+    print("✅ worker._verificar_identidad() (face_recognition simulado)")
+
+# ====================================================================
+# TESTS: main.procesar_lote / consumir_en_lotes (YOLO simulado)
+# ====================================================================
+print(f"\n{'=' * 60}")
+print("TESTS: main.procesar_lote() / consumir_en_lotes()")
+print("=" * 60)
+
+try:
+    import main
+except ImportError as e:
+    main = None
+    print(f"⏭️  main.py omitido ({e})")
+
+if main is not None:
+    import cv2
+    import vision_logic
+
+    class CanalFalso:
+        def __init__(self, entrantes=()):
+            self.acks, self.nacks, self.publicados = [], [], []
+            self.entrantes = list(entrantes)
+        def basic_ack(self, delivery_tag):
+            self.acks.append(delivery_tag)
+        def basic_nack(self, delivery_tag, requeue=True):
+            self.nacks.append(delivery_tag)
+        def basic_publish(self, exchange, routing_key, body, properties=None):
+            self.publicados.append(json.loads(body))
+        def consume(self, queue, inactivity_timeout=None):
+            yield from self.entrantes
+
+    def jpeg(color):
+        imagen = np.zeros((480, 640, 3), np.uint8)
+        imagen[100:400, 200:400] = color
+        return cv2.imencode(".jpg", imagen)[1].tobytes()
+
+    # url → bytes del blob (None = 404 / error de descarga)
+    blobs = {"a": jpeg(200), "b": jpeg(60), "basura": b"no es una imagen", "404": None}
+    analizados = []
+
+    def analizar_frames(frames):
+        analizados.append(len(frames))
+        return [vision_logic.resumir_detecciones(np.array([[10, 10, 200, 400, 0.9, 0]], np.float32))
+                for _ in frames]
+
+    def mensaje(tag, sesion, url):
+        metodo = types.SimpleNamespace(delivery_tag=tag)
+        return metodo, json.dumps({"user_id": f"u{tag}", "sesion_id": sesion, "url_storage": url})
+
+    reales = (worker._descargar, vision_logic.analizar_frames, vision_logic.analizar_frame,
+              main.procesar_lote_frames, main.VISION_BATCH_SIZE)
+    try:
+        worker._descargar = blobs.get
+        vision_logic.analizar_frames = analizar_frames
+        vision_logic.analizar_frame = lambda frame: analizar_frames([frame])[0]
+
+        # Lote mixto: JSON roto → nack; 404 y bytes no decodificables → ack sin evento
+        canal = CanalFalso()
+        main.procesar_lote(canal, [
+            mensaje(1, "lote-s1", "a"), mensaje(2, "lote-s2", "404"), mensaje(3, "lote-s3", "basura"),
+            (types.SimpleNamespace(delivery_tag=4), b"{no es json"), mensaje(5, "lote-s4", "b"),
+        ])
+        assert canal.acks == [1, 2, 3, 5] and canal.nacks == [4], (canal.acks, canal.nacks)
+        assert [e["user_id"] for e in canal.publicados] == ["u1", "u5"] and analizados == [2]
+        assert all(e["details"]["persons_detected"] == 1 and not e["details"]["reused"] for e in canal.publicados)
+
+        # Mismo frame de la sesión en el lote siguiente → se republica sin pasar por YOLO
+        canal = CanalFalso()
+        main.procesar_lote(canal, [mensaje(6, "lote-s1", "a"), mensaje(7, "lote-s4", "a")])
+        assert canal.acks == [6, 7] and analizados == [2, 1], analizados
+        assert [e["details"]["reused"] for e in canal.publicados] == [True, False]
+
+        # Si falla el lote, cada mensaje se procesa solo y se confirma según su resultado
+        def lote_roto(mensajes):
+            raise RuntimeError("falla del lote")
+        def frame_roto(frame):
+            raise RuntimeError("frame roto")
+        main.procesar_lote_frames = lote_roto
+        vision_logic.analizar_frame = frame_roto
+        canal = CanalFalso()
+        main.procesar_lote(canal, [mensaje(8, "lote-s5", "a"), mensaje(9, "lote-s6", "404")])
+        assert canal.acks == [9] and canal.nacks == [8] and canal.publicados == [], (canal.acks, canal.nacks)
+        main.procesar_lote_frames = reales[3]
+
+        # consumir_en_lotes: corta por tamaño y vacía lo acumulado al quedar inactiva la cola
+        vision_logic.analizar_frame = reales[2]
+        main.VISION_BATCH_SIZE = 2
+        lotes = []
+        procesar_lote_real = main.procesar_lote
+        main.procesar_lote = lambda ch, lote: lotes.append([m.delivery_tag for m, _ in lote])
+        try:
+            entrantes = [(mensaje(t, f"s{t}", "a")[0], None, mensaje(t, f"s{t}", "a")[1]) for t in (10, 11, 12)]
+            main.consumir_en_lotes(CanalFalso(entrantes + [(None, None, None)]), "q_snapshots")
+        finally:
+            main.procesar_lote = procesar_lote_real
+        assert lotes == [[10, 11], [12]], lotes
+    finally:
+        (worker._descargar, vision_logic.analizar_frames, vision_logic.analizar_frame,
+         main.procesar_lote_frames, main.VISION_BATCH_SIZE) = reales
+    print("✅ Lotes de q_snapshots: ack/nack por mensaje, reutilización y respaldo mensaje a mensaje")
+
 print(f"\n{'=' * 60}")
 print(f"Resultado: {passed}/{total} tests pasaron")
 if passed == total:
@@ -0,0 +1,120 @@
+"""
+test_backends.py — Paridad de los backends exportados con PyTorch
+=================================================================
+Compara las detecciones de persona/celular de los modelos exportados
+(ONNX Runtime y OpenVINO, fp32 e int8) con las de ultralytics + PyTorch
+(yolov8n.pt) sobre las mismas imágenes:
+
+  • conteos:  fracción de imágenes con igual cantidad de personas y de
+              celulares a CONF_THRESHOLD (lo que usa la lógica de negocio).
+  • recall:   fracción de cajas de PyTorch (conf > 0.25) con una caja de
+              la misma clase e IoU ≥ 0.5 en el backend exportado.
+  • Δconf:    diferencia máxima de confianza entre cajas emparejadas.
+
+El modelo exportado es el mismo head de 80 clases con el mismo filtro de
+clases que ultralytics: en fp32 solo difieren el preproceso y el runtime.
+
+Requiere ultralytics, los modelos de exportar_modelo.py y un set de
+imágenes representativo (al menos MIN_IMAGENES_CALIBRACION): con pocas
+imágenes los umbrales son todo-o-nada. En la imagen se corre solo con
+--build-arg VISION_EXPORT=1.
+
+Ejecutar:  python test_backends.py --calibracion DIR
+"""
+
+import os
+import sys
+
+import numpy as np
+
+import backends
+from exportar_modelo import imagenes_calibracion
+
+CONF_NEGOCIO = 0.45
+CONF_CAJAS = 0.25
+# (conteos, recall) mínimos por precisión
+UMBRALES = {False: (0.95, 0.95), True: (0.85, 0.85)}
+
+total = 0
+passed = 0
+
+
+def check(nombre, ok, detalle=""):
+    global total, passed
+    total += 1
+    if ok:
+        passed += 1
+        print(f"✅ {nombre}  {detalle}")
+    else:
+        print(f"❌ {nombre}  {detalle}")
+
+
+def iou(a, b):
+    """IoU entre cajas (K, 4) y (M, 4) → (K, M)."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter)
+
+
+def emparejar(ref, otro):
+    """(cajas de ref emparejadas, Δconf máximo) con la misma clase e IoU ≥ 0.5."""
+    emparejadas, delta = 0, 0.0
+    for clase in backends.CLASES:
+        r, o = ref[ref[:, 5] == clase], otro[otro[:, 5] == clase]
+        if len(r) == 0 or len(o) == 0:
+            continue
+        m = iou(r[:, :4], o[:, :4])
+        for i in np.argsort(-r[:, 4]):
+            j = int(m[i].argmax())
+            if m[i, j] >= 0.5:
+                emparejadas += 1
+                delta = max(delta, abs(float(r[i, 4] - o[j, 4])))
+                m[:, j] = -1
+    return emparejadas, delta
+
+
+def conteos(det, conf):
+    det = det[det[:, 4] > conf]
+    return int((det[:, 5] == backends.CLASS_PERSON).sum()), int((det[:, 5] == backends.CLASS_CELLPHONE).sum())
+
+
+if "--calibracion" not in sys.argv:
+    sys.exit("Uso: python test_backends.py --calibracion DIR")
+imagenes = imagenes_calibracion(sys.argv[sys.argv.index("--calibracion") + 1])
+print("=" * 60)
+print(f"TESTS: paridad con PyTorch en {len(imagenes)} imágenes")
+print("=" * 60)
+
+referencia = backends.DetectorUltralytics()
+ref = [referencia.detectar([im], conf=CONF_CAJAS)[0] for im in imagenes]
+
+for backend, runtime in (("onnx", backends.ort), ("openvino", backends.ov)):
+    for int8 in (False, True):
+        nombre = f"{backend}{'-int8' if int8 else ''}"
+        ruta = backends.ruta_modelo(int8)
+        if runtime is None or not os.path.exists(ruta):
+            print(f"⏭️  {nombre}: sin runtime o sin {ruta}")
+            continue
+        detector = backends.DetectorOnnx(ruta) if backend == "onnx" else backends.DetectorOpenVINO(ruta)
+        dets = [detector.detectar([im], conf=CONF_CAJAS)[0] for im in imagenes]
+
+        iguales = np.mean([conteos(r, CONF_NEGOCIO) == conteos(d, CONF_NEGOCIO) for r, d in zip(ref, dets)])
+        pares = [emparejar(r, d) for r, d in zip(ref, dets)]
+        cajas_ref = sum(len(r) for r in ref)
+        recall = sum(p[0] for p in pares) / cajas_ref if cajas_ref else 1.0
+        delta = max((p[1] for p in pares), default=0.0)
+
+        min_conteos, min_recall = UMBRALES[int8]
+        check(f"{nombre}: conteos persona/celular", iguales >= min_conteos, f"{iguales:.3f} (mín {min_conteos})")
+        check(f"{nombre}: recall de cajas", recall >= min_recall, f"{recall:.3f} (mín {min_recall}), Δconf máx {delta:.3f}")
+
+print(f"\n{'=' * 60}")
+print(f"Resultado: {passed}/{total} tests pasaron")
+if passed != total:
+    print("⚠️  Algunos tests fallaron.")
+    exit(1)
@@ -1,41 +1,115 @@
-from ultralytics import YOLO
-import cv2
-import numpy as np
+import os
+
+import backends
+import cascada
+# Mapeo de IDs de COCO que nos interesan
+from backends import CLASS_PERSON, CLASS_CELLPHONE
 
 print("⏳ Cargando modelo YOLOv8 Nano...")
 # Usamos el modelo nano (n) pre-entrenado. Se descarga solo la primera vez.
-model = YOLO('yolov8n.pt')  
+# VISION_BACKEND=onnx|openvino usa el modelo exportado (ver backends.py).
+detector = backends.crear_detector()
 # Ajustamos confianza. 0.4 evita detectar "fantasmas" pero detecta celulares claros.
 CONF_THRESHOLD = 0.45 
-print("✅ Modelo YOLO cargado.")
+print(f"✅ Modelo YOLO cargado (backend: {detector.nombre}).")
 
-# Mapeo de IDs de COCO que nos interesan
-CLASS_PERSON = 0
-CLASS_CELLPHONE = 67
+# Frames por forward pass en analizar_frames() (el consumer junta lotes de
+# hasta este tamaño, ver main.py)
+VISION_BATCH_SIZE = int(os.environ.get("VISION_BATCH_SIZE", "8"))
 
 def analizar_frame(image_np):
     """
-    Recibe un array numpy de imagen (OpenCV format BGR)
+    Recibe un array numpy de imagen (OpenCV format BGR) o un
+    backends.FrameLetterbox ya preparado (ver worker.descargar_frame).
     Retorna el análisis de objetos prohibidos/requeridos.
     """
-    # Corremos la inferencia. verbose=False para no llenar los logs.
-    results = model(image_np, conf=CONF_THRESHOLD, verbose=False)
-    
+    if cascada.VISION_CASCADE:
+        return _analizar_cascada([image_np])[0]
+    # Corremos la inferencia sobre un lote de una sola imagen
+    detecciones = detector.detectar([image_np], conf=CONF_THRESHOLD)
+    return resumir_detecciones(detecciones[0])
+
+def analizar_frames(imagenes):
+    """
+    Igual que analizar_frame(), pero para varios frames (de distintas
+    sesiones): un forward pass por cada VISION_BATCH_SIZE imágenes.
+    El detector aplica letterbox a las imágenes crudas; los frames ya
+    preparados solo se rellenan hasta la forma común del lote.
+
+    Returns:
+        Lista de análisis alineada con `imagenes`.
+    """
+    if cascada.VISION_CASCADE:
+        return _analizar_cascada(imagenes)
+    return [resumir_detecciones(det) for det in _detectar_en_lotes(imagenes, CONF_THRESHOLD)]
+
+def _detectar_en_lotes(imagenes, conf, imgsz=backends.IMGSZ):
+    """detector.detectar() de a VISION_BATCH_SIZE imágenes."""
+    detecciones = []
+    for inicio in range(0, len(imagenes), VISION_BATCH_SIZE):
+        lote = list(imagenes[inicio:inicio + VISION_BATCH_SIZE])
+        detecciones.extend(detector.detectar(lote, conf=conf, imgsz=imgsz))
+    return detecciones
+
+def _analizar_cascada(imagenes):
+    """
+    Cascada de dos resoluciones (ver cascada.py): todos los frames a
+    VISION_CASCADE_IMGSZ y, solo los dudosos, recorte o pasada completa.
+    Cada pasada corre en lotes; el análisis lleva la pasada usada.
+    """
+    lado = cascada.VISION_CASCADE_IMGSZ
+    frames = [f if isinstance(f, backends.FrameLetterbox) else backends.preparar(f) for f in imagenes]
+
+    # 1. Pasada baja, con umbral bajo para ver la banda dudosa
+    detecciones = _detectar_en_lotes(frames, cascada.VISION_CASCADE_CONF_MIN, lado)
+    pasadas = [cascada.BAJA] * len(frames)
+    recortes = {}
+    for i, det in enumerate(detecciones):
+        pasadas[i], dudosos = cascada.decidir(det, cascada.VISION_CASCADE_CONF_MIN, cascada.VISION_CASCADE_CONF_MAX)
+        if pasadas[i] == cascada.RECORTE:
+            frame = frames[i]
+            esquina = cascada.ventana_recorte(dudosos, frame.escala, frame.pad, frame.imagen.shape[:2], lado)
+            if esquina is None:
+                pasadas[i] = cascada.COMPLETA
+            else:
+                recortes[i] = cascada.recortar(frame, *esquina, lado)
+
+    # 2. Recortes alrededor de los celulares dudosos (misma densidad que la completa)
+    indices = list(recortes)
+    for i, det in zip(indices, _detectar_en_lotes([recortes[i] for i in indices], CONF_THRESHOLD, lado)):
+        detecciones[i] = cascada.combinar(detecciones[i], det, recortes[i])
+
+    # 3. Resolución completa para los conteos de personas dudosos
+    indices = [i for i, pasada in enumerate(pasadas) if pasada == cascada.COMPLETA]
+    for i, det in zip(indices, _detectar_en_lotes([frames[i] for i in indices], CONF_THRESHOLD)):
+        detecciones[i] = det
+
+    analisis = []
+    for det, pasada in zip(detecciones, pasadas):
+        # Umbral estricto, como el filtro de confianza del detector
+        resultado = resumir_detecciones(det[det[:, 4] > CONF_THRESHOLD])
+        resultado["pasada"] = pasada
+        analisis.append(resultado)
+    return analisis
+
+def resumir_detecciones(detecciones):
+    """
+    Cuenta personas/celulares de las detecciones de una imagen, array
+    (K, 6) [x1, y1, x2, y2, conf, clase], y aplica las reglas de negocio.
+    """
     person_count = 0
     phone_count = 0
     max_phone_confidence = 0.0  # Confianza máxima de detección de celular
     detected_objects = []
-
-    # Procesamos la primera imagen del lote (solo mandamos una)
-    result = results[0]
+    person_boxes = []  # Cajas de las personas, para la verificación de identidad
     
     # Iteramos sobre las cajas detectadas
-    for box in result.boxes:
-        class_id = int(box.cls[0])
-        confidence = float(box.conf[0])
+    for *box, confidence, class_id in detecciones.tolist():
+        class_id = int(class_id)
         
         if class_id == CLASS_PERSON:
             person_count += 1
+            person_boxes.append(box)
             detected_objects.append("persona")
         elif class_id == CLASS_CELLPHONE:
             phone_count += 1
@@ -77,5 +151,6 @@ def analizar_frame(image_np):
             "phones": phone_count,
             "max_phone_confidence": round(max_phone_confidence, 4),
             "flags": flags,
-        }
+        },
+        "person_boxes": person_boxes,
     }
\ No newline at end of file
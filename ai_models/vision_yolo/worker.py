@@ -5,39 +5,114 @@ Responsabilidad: descarga de imagen, análisis YOLO, generación de
 soft evidence. NO conoce RabbitMQ ni colas — eso es trabajo de main.py.
 """
 
+import os
 import cv2
 import numpy as np
 import requests
 import logging
 from datetime import datetime, timezone
 
+import backends
+import identidad
+import jpeg
+import similitud
 import vision_logic
 from soft_evidence import normalizar_vision
 
 logger = logging.getLogger("YoloVisionWorker")
 
+# Último frame analizado por sesión (ver similitud.py)
+resultados_sesion = similitud.ResultadosSesion(
+    umbral=similitud.VISION_DEDUP_UMBRAL,
+    refresco=similitud.VISION_DEDUP_REFRESCO,
+    max_sesiones=similitud.VISION_DEDUP_MAX_SESIONES,
+)
 
-def descargar_imagen(url: str):
+# Embedding de registro por sesión (ver identidad.py)
+vectores_sesion = identidad.VectoresSesion(max_sesiones=identidad.VISION_IDENTITY_MAX_SESIONES)
+
+
+def registrar_vector(sesion_id: str, vector_db) -> bool:
+    """Guarda el embedding de registro (vector_db del mensaje) de la sesión."""
+    if sesion_id is None or not vector_db:
+        return False
+    return vectores_sesion.registrar(sesion_id, vector_db)
+
+# ── Decodificación ──
+# Con "1", los JPEG más grandes que la entrada del modelo se decodifican
+# directo a 1/2, 1/4 u 1/8 de resolución (ver jpeg.py)
+VISION_REDUCED_DECODE = os.environ.get("VISION_REDUCED_DECODE", "1") == "1"
+
+_FLAGS_REDUCIDO = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def decodificar_imagen(datos: bytes, lado: int = backends.IMGSZ):
     """
-    Descarga una imagen desde Azure Blob Storage y la decodifica
-    a un array numpy en formato BGR (OpenCV).
+    Bytes de la imagen → (imagen BGR, forma original (alto, ancho)).
+
+    Si es un JPEG con el lado mayor ≥ 2·lado, libjpeg la decodifica ya
+    reducida (sigue quedando ≥ `lado`, el letterbox termina de achicarla).
 
     Returns:
-        np.ndarray | None: imagen decodificada o None si falla.
+        (np.ndarray, (alto, ancho)) o (None, None) si no se pudo decodificar.
     """
+    # np.frombuffer no copia los bytes de la respuesta
+    buffer = np.frombuffer(datos, dtype=np.uint8)
+    dimensiones = jpeg.dimensiones_jpeg(datos) if VISION_REDUCED_DECODE else None
+    factor = jpeg.factor_reduccion(*dimensiones, lado) if dimensiones else 1
+    imagen = cv2.imdecode(buffer, _FLAGS_REDUCIDO[factor])
+    if imagen is None:
+        return None, None
+    forma = (dimensiones[1], dimensiones[0]) if dimensiones else imagen.shape[:2]
+    return imagen, forma
+
+
+def _descargar(url: str) -> bytes | None:
     try:
         response = requests.get(url, timeout=15)
         response.raise_for_status()
-        image_array = np.asarray(bytearray(response.content), dtype=np.uint8)
-        return cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+        return response.content
     except Exception as e:
         logger.error(f"Error descargando imagen de {url}: {e}")
         return None
 
 
+def descargar_frame(url: str):
+    """
+    Descarga → decodificación reducida → letterbox a la entrada del modelo,
+    en un solo paso por frame. Las cajas que devuelva el detector quedan en
+    píxeles de la imagen original (la escala incluye el factor de reducción).
+
+    Con la verificación de identidad activa también se devuelve la imagen
+    decodificada (antes del letterbox): el rostro se recorta de ahí.
+
+    Returns:
+        (backends.FrameLetterbox, imagen BGR o None) o (None, None) si falla.
+    """
+    datos = _descargar(url)
+    if datos is None:
+        return None, None
+    imagen, forma = decodificar_imagen(datos)
+    if imagen is None:
+        logger.error(f"No se pudo decodificar la imagen de {url}")
+        return None, None
+    frame = backends.preparar(imagen)
+    # La imagen decodificada mide ~forma/factor: escala respecto del original
+    reduccion = imagen.shape[1] / forma[1]
+    frame = frame._replace(escala=frame.escala * reduccion, forma=forma)
+    return frame, (imagen if identidad.disponible() else None)
+
+
 def procesar_frame(user_id: str, sesion_id: str, url_storage: str) -> dict | None:
     """
-    Pipeline completo de visión: descarga → YOLO → soft evidence.
+    Pipeline completo de visión: descarga → YOLO → identidad → soft evidence.
+    Si el frame casi no cambió respecto del último analizado de la sesión,
+    se reutiliza ese análisis en vez de correr YOLO (details.reused).
 
     Args:
         user_id:     ID del usuario (estudiante).
@@ -48,18 +123,102 @@ def procesar_frame(user_id: str, sesion_id: str, url_storage: str) -> dict | Non
         dict con el evento universal de soft evidence listo para encolar,
         o None si la imagen no se pudo procesar.
     """
-    # 1. Descargar la imagen
-    image_np = descargar_imagen(url_storage)
-    if image_np is None:
+    # 1. Descargar la imagen (decodificada y letterboxed)
+    frame, imagen = descargar_frame(url_storage)
+    if frame is None:
         return None
 
-    # 2. Análisis YOLO
-    resultado_vision = vision_logic.analizar_frame(image_np)
+    # 2. Análisis YOLO (o el de la sesión, si el frame no cambió)
+    firma, resultado_vision = _buscar_reutilizable(sesion_id, frame)
+    if resultado_vision is None:
+        resultado_vision = vision_logic.analizar_frame(frame)
+        # 3. Identidad sobre la misma imagen decodificada
+        _verificar_identidad(sesion_id, imagen, frame.forma, resultado_vision)
+        _guardar_analisis(sesion_id, firma, resultado_vision)
+
+    return _construir_evento(user_id, sesion_id, resultado_vision)
+
+
+def procesar_lote_frames(mensajes: list[tuple[str, str, str]]) -> list[dict | None]:
+    """
+    Igual que procesar_frame(), pero para una ventana de mensajes de
+    q_snapshots: las imágenes descargadas que no se pueden reutilizar
+    pasan juntas por vision_logic.analizar_frames() (un forward pass por lote).
+
+    Args:
+        mensajes: Lista de tuplas (user_id, sesion_id, url_storage).
+
+    Returns:
+        Lista alineada con `mensajes`: evento de soft evidence o None por frame.
+    """
+    # 1. Descargar las imágenes (decodificadas y letterboxed)
+    descargas = [descargar_frame(url_storage) for _, _, url_storage in mensajes]
+    frames = [frame for frame, _ in descargas]
+    imagenes = [imagen for _, imagen in descargas]
+    validas = [i for i, frame in enumerate(frames) if frame is not None]
+
+    # 2. Reutilización por sesión; el resto pasa por YOLO en un solo lote
+    firmas, resultados = {}, {}
+    for i in validas:
+        firmas[i], resultados[i] = _buscar_reutilizable(mensajes[i][1], frames[i])
+    pendientes = [i for i in validas if resultados[i] is None]
+    analisis = vision_logic.analizar_frames([frames[i] for i in pendientes]) if pendientes else []
+    for i, resultado_vision in zip(pendientes, analisis):
+        resultados[i] = resultado_vision
+        _verificar_identidad(mensajes[i][1], imagenes[i], frames[i].forma, resultado_vision)
+        _guardar_analisis(mensajes[i][1], firmas[i], resultado_vision)
+
+    eventos = [None] * len(mensajes)
+    for i in validas:
+        user_id, sesion_id, _ = mensajes[i]
+        eventos[i] = _construir_evento(user_id, sesion_id, resultados[i])
+    return eventos
+
+
+def _buscar_reutilizable(sesion_id, frame):
+    """(firma del frame, análisis reutilizable de la sesión o None)."""
+    if not similitud.VISION_DEDUP or sesion_id is None:
+        return None, None
+    firma = similitud.miniatura(frame.imagen)
+    anterior = resultados_sesion.buscar(sesion_id, firma)
+    return firma, (dict(anterior, reused=True) if anterior is not None else None)
+
+
+def _guardar_analisis(sesion_id, firma, resultado_vision):
+    if firma is not None:
+        resultados_sesion.guardar(sesion_id, firma, resultado_vision)
+
+
+def _verificar_identidad(sesion_id, imagen, forma, resultado_vision):
+    """
+    Agrega resultado_vision["identity"] si la sesión tiene embedding de
+    registro y YOLO vio exactamente una persona (si no, no se codifica).
+    `imagen` es la decodificada antes del letterbox y `forma` la original.
+    Queda guardado con el análisis: los frames reutilizados lo repiten.
+    """
+    if imagen is None or not identidad.disponible() or resultado_vision["details"]["persons"] != 1:
+        return
+    vector_db = vectores_sesion.obtener(sesion_id)
+    if vector_db is None:
+        return
+    try:
+        resultado_vision["identity"] = identidad.verificar(
+            imagen, forma, resultado_vision["person_boxes"][0], vector_db, identidad.VISION_IDENTITY_UMBRAL,
+        )
+    except Exception as e:
+        logger.error(f"Error verificando identidad de la sesión {sesion_id}: {e}")
+
 
+def _construir_evento(user_id: str, sesion_id: str, resultado_vision: dict) -> dict:
+    """Señales crudas de YOLO → distribución → evento universal de soft evidence."""
     # 3. Extraer señales crudas
     person_count = resultado_vision["details"]["persons"]
     phone_count = resultado_vision["details"]["phones"]
     phone_confidence = resultado_vision["details"]["max_phone_confidence"]
+    identity = resultado_vision.get("identity")
+    flags = resultado_vision["details"]["flags"]
+    if identity is not None and identity["face_detected"] and not identity["is_match"]:
+        flags = flags + ["Identidad no coincide"]
 
     # 4. Generar distribución de probabilidad (Soft Evidence)
     #    normalizar_vision() aplica normalización L1 y garantiza Σ = 1.0
@@ -82,6 +241,11 @@ def procesar_frame(user_id: str, sesion_id: str, url_storage: str) -> dict | Non
             "persons_detected": person_count,
             "phones_detected": phone_count,
             "phone_confidence": phone_confidence,
-            "flags": resultado_vision["details"]["flags"],
+            "flags": flags,
+            # Rostro vs. embedding de registro; None si no se verificó
+            # (sin embedding para la sesión o ≠ 1 persona)
+            "identity": identity,
+            # True si se republicó el análisis del último frame analizado de la sesión
+            "reused": resultado_vision.get("reused", False),
         }
     }